@@ -1,5 +1,7 @@
 from flask import Flask, request, jsonify, render_template, send_from_directory
-from db_manager import Database
+from db_manager import Database, ReplayError
+from query import Query, parse_query
+import json
 import os
 
 app = Flask(__name__)
@@ -17,12 +19,20 @@ def select_database():
         return jsonify({"error": "Database name is required"}), 400
     try:
         global db
-        db = Database(db_name)
-        db.load()
-        return jsonify({
+        database = Database(db_name, concurrent=True)  # Flask serves requests on several threads
+        response = {
             "message": f"Connected to database '{db_name}'",
             "database": db_name
-        })
+        }
+        try:
+            loaded = database.load(warm=True)  # Tables finish loading in the background
+        except ReplayError as e:
+            loaded = True  # The other tables are loaded and usable
+            response["warning"] = str(e)
+        if not loaded:
+            return jsonify({"error": f"Could not load database '{db_name}'"}), 500
+        db = database
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -34,7 +44,7 @@ def create_database():
         return jsonify({"error": "Database name is required"}), 400
     try:
         global db
-        db = Database(db_name)
+        db = Database(db_name, concurrent=True)  # Flask serves requests on several threads
         db.persist()  # Create the database
         db.load()  # Load the newly created database
         return jsonify({
@@ -78,12 +88,14 @@ def create_table():
     table_name = data.get("name")
     columns = data.get("columns")
     primary_key = data.get("primary_key")
+    storage = data.get("storage", "memory")
+    partitions = data.get("partitions")  # e.g. {"by": "hash", "count": 4}
     if not table_name or not columns or not primary_key:
         return jsonify({"error": "Missing required fields"}), 400
     try:
         column_dict = {col.split(":")[0]: eval(col.split(":")[1]) for col in columns.split(",")}
-        db.create_table(table_name, column_dict, primary_key)
-        db.persist()  # Save after creating table
+        db.create_table(table_name, column_dict, primary_key, storage=storage, partitions=partitions)
+        db.commit()  # Log the new table; checkpoints happen periodically
         return jsonify({"message": f"Table '{table_name}' created successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -92,6 +104,7 @@ def create_table():
 def delete_table(table_name):
     try:
         db.delete_table(table_name)
+        db.commit()
         return jsonify({"message": f"Table '{table_name}' deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -104,11 +117,56 @@ def insert_record(table_name):
     record = request.json
     try:
         table.insert(record)
-        db.persist()  # Save after inserting record
+        db.commit()  # Durable once the log record is synced
         return jsonify({"message": "Record inserted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/table/<table_name>/upsert", methods=["POST"])
+def upsert_record(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    record = request.json
+    try:
+        status = table.upsert(record)
+        db.commit()
+        return jsonify({"message": f"Record {status.name.lower()} successfully", "status": status.name.lower()})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/insert_many", methods=["POST"])
+def insert_records(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    records = request.json
+    if not isinstance(records, list):
+        return jsonify({"error": "Expected a list of records"}), 400
+    try:
+        inserted = table.insert_many(records)
+        db.commit()  # One log record and one sync for the whole batch
+        return jsonify({"message": f"{inserted} records inserted successfully", "inserted": inserted})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/get_many", methods=["POST"])
+def get_records(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    keys = (request.json or {}).get("primary_keys")
+    if not isinstance(keys, list):
+        return jsonify({"error": "Missing primary_keys list"}), 400
+    try:
+        return jsonify(table.select_many(keys))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/table/<table_name>/update", methods=["PUT"])
 def update_record(table_name):
     table = db.get_table(table_name)
@@ -121,7 +179,7 @@ def update_record(table_name):
         return jsonify({"error": "Missing required fields"}), 400
     try:
         table.update(primary_key, updates)
-        db.persist()  # Save after updating record
+        db.commit()  # Durable once the log record is synced
         return jsonify({"message": "Record updated successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -137,10 +195,162 @@ def delete_record(table_name):
         return jsonify({"error": "Missing primary key"}), 400
     try:
         table.delete(primary_key)
+        db.commit()
         return jsonify({"message": "Record deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/table/<table_name>/delete_many", methods=["DELETE"])
+def delete_records(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    keys = (request.json or {}).get("primary_keys")
+    if not isinstance(keys, list):
+        return jsonify({"error": "Missing primary_keys list"}), 400
+    try:
+        deleted = table.delete_many(keys)
+        db.commit()
+        return jsonify({"message": f"{deleted} records deleted successfully", "deleted": deleted})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/delete_range", methods=["DELETE"])
+def delete_record_range(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    data = request.json or {}
+    try:
+        # A missing bound leaves that end of the range open
+        deleted = table.delete_range(data.get("start"), data.get("end"))
+        db.commit()
+        return jsonify({"message": f"{deleted} records deleted successfully", "deleted": deleted})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/truncate", methods=["POST"])
+def truncate_table(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    try:
+        deleted = table.truncate()
+        db.commit()
+        return jsonify({"message": f"{deleted} records deleted successfully", "deleted": deleted})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/compaction", methods=["GET"])
+def compaction_stats(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    return jsonify(table.compaction_stats())
+
+@app.route("/table/<table_name>/compact", methods=["POST"])
+def compact_table(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        repaired = table.compact(data.get("limit"))
+        return jsonify({"message": f"{repaired} leaves rebalanced", "repaired": repaired,
+                        "stats": table.compaction_stats()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/index", methods=["POST"])
+def create_index(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    data = request.json
+    column = data.get("column")
+    if not column:
+        return jsonify({"error": "Missing column"}), 400
+    try:
+        if not table.create_index(column, unique=bool(data.get("unique", False))):
+            return jsonify({"error": f"Column '{column}' is already indexed"}), 400
+        db.commit()
+        return jsonify({"message": f"Index on '{column}' created successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/aggregate", methods=["POST"])
+def create_aggregate(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    column = request.json.get("column")
+    if not column:
+        return jsonify({"error": "Missing column"}), 400
+    try:
+        if not table.create_aggregate(column):
+            return jsonify({"error": f"Column '{column}' is already aggregated"}), 400
+        db.commit()
+        return jsonify({"message": f"Aggregate on '{column}' created successfully"})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/aggregate", methods=["GET"])
+def get_aggregate(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    op = request.args.get("op", "count")
+    column = request.args.get("column")
+    if op not in ("count", "sum", "min", "max"):
+        return jsonify({"error": "op must be count, sum, min or max"}), 400
+    try:
+        pk_type = table.columns.get(table.primary_key)
+        convert = pk_type if isinstance(pk_type, type) else str
+        start = convert(request.args["start"]) if "start" in request.args else None
+        end = convert(request.args["end"]) if "end" in request.args else None
+        if op == "count":
+            result = table.count(start, end)
+        elif op == "sum":
+            if not column:
+                return jsonify({"error": "Missing column"}), 400
+            result = table.sum(column, start, end)
+        else:
+            result = getattr(table, op)(column, start, end)
+        return jsonify({"op": op, "column": column, "result": result})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/table/<table_name>/lookup", methods=["GET"])
+def lookup_records(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    column = request.args.get("column")
+    if column not in table.columns:
+        return jsonify({"error": "Missing or unknown column"}), 400
+    col_type = table.columns[column]
+    convert = col_type if isinstance(col_type, type) else str
+    try:
+        if "value" in request.args:
+            records = table.select_by(column, convert(request.args["value"]))
+        elif "start" in request.args and "end" in request.args:
+            records = table.select_by_range(column, convert(request.args["start"]), convert(request.args["end"]))
+        else:
+            return jsonify({"error": "Provide value, or start and end"}), 400
+        return jsonify(records)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/table/<table_name>/visualize", methods=["GET"])
 def visualize_table(table_name):
     table = db.get_table(table_name)
@@ -162,14 +372,75 @@ def visualize_table(table_name):
 def serve_visualization(filename):
     return send_from_directory(".", filename)
 
+@app.route("/table/<table_name>/query", methods=["POST"])
+def query_table(table_name):
+    table = db.get_table(table_name)
+    if not table:
+        return jsonify({"error": "Table not found"}), 404
+    data = request.json or {}
+    try:
+        # Either query text, as in the shell's query command, or its parts as JSON fields
+        if "q" in data:
+            options = parse_query(data["q"])
+        else:
+            options = {key: data[key] for key in ("where", "columns", "order_by", "descending", "limit", "aggregates")
+                       if key in data}
+        query = Query(table, **options)
+        return jsonify({"plan": query.explain(), "results": query.run()})
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/join", methods=["POST"])
+def join_tables():
+    data = request.json or {}
+    if not data.get("left") or not data.get("right"):
+        return jsonify({"error": "Both 'left' and 'right' tables are required"}), 400
+    try:
+        options = {key: data[key] for key in ("left_on", "right_on", "columns", "where", "limit") if key in data}
+        join = db.join(data["left"], data["right"], **options)
+        return jsonify({"plan": join.explain(), "results": join.run()})
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/table/<table_name>/contents", methods=["GET"])
 def get_table_contents(table_name):
     table = db.get_table(table_name)
     if not table:
         return jsonify({"error": "Table not found"}), 404
     try:
-        records = table.select_all()
-        return jsonify(records)
+        pk_type = table.columns.get(table.primary_key)
+        convert = pk_type if isinstance(pk_type, type) else str
+        start = convert(request.args["start"]) if "start" in request.args else None
+        end = convert(request.args["end"]) if "end" in request.args else None
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+        offset = int(request.args.get("offset", 0))
+        reverse = request.args.get("reverse", "false").lower() in ("1", "true", "yes")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    records = table.scan(start, end, limit=limit, offset=offset, reverse=reverse)
+
+    def generate():
+        # Stream the JSON array as the cursor walks the leaves
+        yield "["
+        for i, record in enumerate(records):
+            yield ("," if i else "") + json.dumps(record, default=str)
+        yield "]"
+
+    return app.response_class(generate(), mimetype="application/json")
+
+@app.route("/table/<table_name>/freeze", methods=["POST"])
+def freeze_table(table_name):
+    try:
+        if not db.freeze_table(table_name):
+            return jsonify({"error": "Table not found"}), 404
+        return jsonify({"message": f"Table '{table_name}' frozen"})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -177,7 +448,7 @@ def get_table_contents(table_name):
 def persist_db():
     try:
         db.persist()
-        return jsonify({"message": "Database persisted to disk"})
+        return jsonify({"message": "Database persisted to disk", "stats": db.persist_stats})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,338 @@
+# augmented.py
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bplustree import _MISSING, BPlusTree, BPlusTreeNode, InternalNode, WriteStatus
+
+# A summary is (count, ((sum, min, max), ...)) with one triple per aggregated field
+Summary = Tuple[int, Tuple[Tuple[Any, Any, Any], ...]]
+
+class SummaryInternalNode(InternalNode):
+    """Internal node that also keeps a summary of each child's subtree."""
+    __slots__ = ('summaries',)
+
+    def __init__(self):
+        super().__init__()
+        self.summaries: List[Summary] = []
+
+class AugmentedBPlusTree(BPlusTree):
+    """B+ tree whose internal nodes summarize each child subtree.
+
+    Every summary holds the subtree's key count and, for each entry of fields
+    (a name mapped to a function of the stored value), the sum, min and max of
+    the non-None results. That turns rank, select_kth, count_range and range
+    aggregates into one or two root-to-leaf descents instead of a scan.
+
+    Summaries move with their children in _split_child, the borrow paths and
+    _merge. An insert adds the new pair to each summary on its path, a delete
+    (or delete_range) summarizes the path again on its way back up, and
+    updates and batches summarize the paths to the keys they changed
+    afterwards. The tail-leaf
+    append path is never taken, since _insert_non_full never sets _tail.
+    """
+    internal_type = SummaryInternalNode
+
+    def __init__(self, degree: int = 3, fields: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        super().__init__(degree)
+        self.fields = dict(fields or {})
+        self._extractors = list(self.fields.values())
+
+    # Summaries
+
+    def _summarize_leaf(self, keys: List, values: List) -> Summary:
+        aggregates = []
+        for extract in self._extractors:
+            column = [x for x in map(extract, values) if x is not None]
+            if column:
+                aggregates.append((sum(column), min(column), max(column)))
+            else:
+                aggregates.append((0, None, None))
+        return len(keys), tuple(aggregates)
+
+    def _combine(self, summaries: List[Summary]) -> Summary:
+        if not self._extractors:
+            return sum(count for count, _ in summaries), ()
+        count = 0
+        aggregates = [[0, None, None] for _ in self._extractors]
+        for child_count, child_aggregates in summaries:
+            count += child_count
+            for total, (child_sum, child_min, child_max) in zip(aggregates, child_aggregates):
+                total[0] += child_sum
+                if child_min is not None and (total[1] is None or child_min < total[1]):
+                    total[1] = child_min
+                if child_max is not None and (total[2] is None or child_max > total[2]):
+                    total[2] = child_max
+        return count, tuple(map(tuple, aggregates))
+
+    def _summarize(self, node: BPlusTreeNode) -> Summary:
+        if node.is_leaf:
+            return self._summarize_leaf(node.keys, node.values)
+        return self._combine(node.summaries)
+
+    def _refresh_path(self, key) -> None:
+        """Summarize again every node on the path to key, bottom-up."""
+        path = []
+        node = self._own_root()
+        self.descents += 1
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            path.append((node, idx))
+            node = self._own_child(node, idx)
+        for parent, idx in reversed(path):
+            parent.summaries[idx] = self._summarize(parent.children[idx])
+
+    def _refresh_all(self, node: BPlusTreeNode) -> Summary:
+        if not node.is_leaf:
+            node.summaries = [self._refresh_all(child) for child in node.children]
+        return self._summarize(node)
+
+    def _copy_node(self, node: BPlusTreeNode) -> BPlusTreeNode:
+        copy = super()._copy_node(node)
+        if not node.is_leaf:
+            copy.summaries = list(node.summaries)
+        return copy
+
+    # Writes
+
+    def _insert_non_full(self, node: BPlusTreeNode, key, value, replace: bool = True) -> WriteStatus:
+        path = []
+        rightmost = node is self.root
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            child = self._own_child(node, idx)
+            if len(child.keys) == self.max_keys:
+                self._split_child(node, idx, appending=rightmost and idx == len(node.keys)
+                                  and key > child.keys[-1])
+                if key >= node.keys[idx]:
+                    idx += 1
+            rightmost = rightmost and idx == len(node.keys)
+            path.append((node, idx))
+            node = node.children[idx]
+
+        idx = bisect_left(node.keys, key)
+        if idx < len(node.keys) and node.keys[idx] == key:
+            if not replace:
+                return WriteStatus.EXISTS
+            node.values[idx] = value
+            if self._extractors:
+                for parent, i in reversed(path):
+                    parent.summaries[i] = self._summarize(parent.children[i])
+            return WriteStatus.REPLACED
+        node.keys.insert(idx, key)
+        node.values.insert(idx, value)
+
+        # Splits summarized both halves before the key arrived, so add it on top
+        added = [extract(value) for extract in self._extractors]
+        for parent, i in path:
+            count, aggregates = parent.summaries[i]
+            if added:
+                aggregates = tuple(
+                    (total, low, high) if x is None else
+                    (total + x, x if low is None or x < low else low, x if high is None or x > high else high)
+                    for (total, low, high), x in zip(aggregates, added))
+            parent.summaries[i] = (count + 1, aggregates)
+        return WriteStatus.INSERTED
+
+    def modify(self, key, func) -> WriteStatus:
+        status = super().modify(key, func)
+        if status and self._extractors:
+            self._refresh_path(key)
+        return status
+
+    def _delete(self, node: BPlusTreeNode, key):
+        if node.is_leaf:
+            return super()._delete(node, key)
+        idx = bisect_right(node.keys, key)
+        child = self._own_child(node, idx)
+        value = self._delete(child, key)
+        if len(child.keys) < self.min_keys and not self._defer(child, key):
+            self._fill_child(node, idx)  # Summarizes the children it rebalances
+        elif value is not _MISSING:
+            node.summaries[idx] = self._summarize(child)
+        return value
+
+    def _delete_range(self, node: BPlusTreeNode, start_key, end_key) -> int:
+        deleted = super()._delete_range(node, start_key, end_key)
+        if not node.is_leaf:
+            # The children the range ends in were trimmed below without updating their summaries here
+            node.summaries = [self._summarize(child) for child in node.children]
+        return deleted
+
+    def _compact_path(self, root: BPlusTreeNode, key) -> bool:
+        if not super()._compact_path(root, key):
+            return False
+        # The repairs summarized the siblings they touched, but not the ancestors above them
+        path = []
+        node = root
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            path.append((node, idx))
+            node = node.children[idx]
+        for parent, idx in reversed(path):
+            parent.summaries[idx] = self._summarize(parent.children[idx])
+        return True
+
+    def _count_keys(self, node: BPlusTreeNode) -> int:
+        return len(node.keys) if node.is_leaf else sum(count for count, _ in node.summaries)
+
+    def _drop_children(self, node: InternalNode, low: int, high: int) -> None:
+        super()._drop_children(node, low, high)
+        del node.summaries[low:high]
+
+    def insert_many(self, pairs) -> int:
+        batch = dict(pairs)
+        inserted = super().insert_many(batch.items())
+        self._refresh_keys(batch)
+        return inserted
+
+    def delete_many(self, keys) -> int:
+        keys = set(keys)
+        deleted = super().delete_many(keys)
+        if deleted:
+            self._refresh_keys(keys)
+        return deleted
+
+    def _refresh_keys(self, keys) -> None:
+        # One refresh per leaf is enough: keys sharing a leaf share its path
+        high = None
+        for key in sorted(keys):
+            if high is not None and key < high:
+                continue
+            self._refresh_path(key)
+            _, _, high = self._find_leaf_bounds(key)
+            if high is None:
+                return
+
+    def bulk_load(self, sorted_pairs, fill_factor: float = 1.0) -> None:
+        super().bulk_load(sorted_pairs, fill_factor)
+        self._refresh_all(self.root)
+
+    def _split_child(self, parent: InternalNode, child_idx: int, appending: bool = False) -> None:
+        child = parent.children[child_idx]
+        super()._split_child(parent, child_idx, appending)
+        new_node = parent.children[child_idx + 1]
+        if not child.is_leaf:
+            split = len(child.children)
+            new_node.summaries = child.summaries[split:]
+            child.summaries = child.summaries[:split]
+        # Also seeds the summaries of a freshly grown root, whose list is empty
+        parent.summaries[child_idx:child_idx + 1] = [self._summarize(child), self._summarize(new_node)]
+
+    def _borrow_from_prev(self, parent: InternalNode, child_idx: int) -> None:
+        super()._borrow_from_prev(parent, child_idx)
+        child, left_sibling = parent.children[child_idx], parent.children[child_idx - 1]
+        if not child.is_leaf:
+            child.summaries.insert(0, left_sibling.summaries.pop())
+        parent.summaries[child_idx - 1] = self._summarize(left_sibling)
+        parent.summaries[child_idx] = self._summarize(child)
+
+    def _borrow_from_next(self, parent: InternalNode, child_idx: int) -> None:
+        super()._borrow_from_next(parent, child_idx)
+        child, right_sibling = parent.children[child_idx], parent.children[child_idx + 1]
+        if not child.is_leaf:
+            child.summaries.append(right_sibling.summaries.pop(0))
+        parent.summaries[child_idx] = self._summarize(child)
+        parent.summaries[child_idx + 1] = self._summarize(right_sibling)
+
+    def _merge(self, parent: InternalNode, child_idx: int) -> None:
+        right_child = parent.children[child_idx + 1]
+        super()._merge(parent, child_idx)
+        left_child = parent.children[child_idx]
+        if not left_child.is_leaf:
+            left_child.summaries += right_child.summaries
+        parent.summaries.pop(child_idx + 1)
+        parent.summaries[child_idx] = self._summarize(left_child)
+
+    # Order statistics and aggregates
+
+    def _size(self) -> int:
+        return self._summarize(self.root)[0]
+
+    def rank(self, key, inclusive: bool = False) -> int:
+        """Number of keys < key (<= key with inclusive=True)."""
+        rank = 0
+        node = self.root
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            rank += sum(count for count, _ in node.summaries[:idx])
+            node = node.children[idx]
+        return rank + (bisect_right if inclusive else bisect_left)(node.keys, key)
+
+    def select_kth(self, k: int) -> Tuple:
+        """Return the (key, value) pair with k keys before it (0-based; negative counts from the end)."""
+        if k < 0:
+            k += self._size()
+        if k < 0:
+            raise IndexError("select_kth index out of range")
+        node = self.root
+        while not node.is_leaf:
+            for idx, (count, _) in enumerate(node.summaries):
+                if k < count:
+                    break
+                k -= count
+            else:
+                raise IndexError("select_kth index out of range")
+            node = node.children[idx]
+        if k >= len(node.keys):
+            raise IndexError("select_kth index out of range")
+        return node.keys[k], node.values[k]
+
+    def count_range(self, start_key=None, end_key=None) -> int:
+        """Number of keys with start_key <= key <= end_key; either bound may be None."""
+        high = self._size() if end_key is None else self.rank(end_key, inclusive=True)
+        low = 0 if start_key is None else self.rank(start_key)
+        return max(high - low, 0)
+
+    def estimated_count(self) -> int:
+        """Exact here: the root's summary holds the count."""
+        return self._size()
+
+    def aggregate(self, field: str, start_key=None, end_key=None) -> Dict[str, Any]:
+        """Count the keys in [start_key, end_key] and sum/min/max field over their values.
+
+        None results of the field function are left out of sum, min and max;
+        min and max are None if nothing remains.
+        """
+        if field not in self.fields:
+            raise ValueError(f"Field '{field}' is not aggregated")
+        if start_key is not None and end_key is not None and start_key > end_key:
+            count, aggregates = self._combine([])
+        else:
+            count, aggregates = self._summarize_range(self.root, start_key, end_key)
+        total, low, high = aggregates[list(self.fields).index(field)]
+        return {'count': count, 'sum': total, 'min': low, 'max': high}
+
+    def _summarize_range(self, node: BPlusTreeNode, start_key, end_key) -> Summary:
+        """Summary of the keys in node's subtree within [start_key, end_key] (None = unbounded)."""
+        if node.is_leaf:
+            lo = 0 if start_key is None else bisect_left(node.keys, start_key)
+            hi = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+            return self._summarize_leaf(node.keys[lo:hi], node.values[lo:hi])
+        if start_key is None and end_key is None:
+            return self._combine(node.summaries)
+        first = 0 if start_key is None else bisect_right(node.keys, start_key)
+        last = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+        if first == last:
+            return self._summarize_range(node.children[first], start_key, end_key)
+        # Only the two boundary children can be partly in range
+        return self._combine([self._summarize_range(node.children[first], start_key, None)]
+                             + node.summaries[first + 1:last]
+                             + [self._summarize_range(node.children[last], None, end_key)])
+
+    def validate_tree(self) -> bool:
+        """Check tree invariants, including that every stored summary is accurate."""
+        return super().validate_tree() and self._validate_summaries(self.root)
+
+    def _validate_summaries(self, node: BPlusTreeNode) -> bool:
+        if node.is_leaf:
+            return True
+        if len(node.summaries) != len(node.children):
+            return False
+        for child, summary in zip(node.children, node.summaries):
+            if not self._validate_summaries(child) or summary != self._exact_summary(child):
+                return False
+        return True
+
+    def _exact_summary(self, node: BPlusTreeNode) -> Summary:
+        if node.is_leaf:
+            return self._summarize_leaf(node.keys, node.values)
+        return self._combine([self._exact_summary(child) for child in node.children])
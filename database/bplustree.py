@@ -1,101 +1,486 @@
-import graphviz
-from typing import List, Dict, Tuple, Optional, Union
+import weakref
+from bisect import bisect_left, bisect_right
+from enum import Enum
+from operator import itemgetter
+from typing import Any, Callable, Iterator, List, Dict, Tuple, Optional, Union
+
+# Share of a node's keys kept on the left when a split makes room for an append
+APPEND_SPLIT = 0.9
+
+_MISSING = object()  # Default that no stored value can be
+
+class WriteStatus(Enum):
+    """Outcome of a single-key write. Truthy when the tree was changed."""
+    INSERTED = 'inserted'
+    REPLACED = 'replaced'
+    DELETED = 'deleted'
+    EXISTS = 'exists'  # insert_if_absent found the key already present
+    NOT_FOUND = 'not found'
+
+    def __bool__(self) -> bool:
+        return self is not WriteStatus.EXISTS and self is not WriteStatus.NOT_FOUND
 
 class BPlusTreeNode:
-    def __init__(self, is_leaf: bool = False):
+    """Common base for tree nodes. Concrete nodes are LeafNode or InternalNode.
+
+    epoch is the tree epoch the node was created in; nodes from an epoch a live
+    snapshot can see are copied before they are modified.
+    """
+    __slots__ = ('keys', 'epoch')
+    is_leaf: bool = False
+
+    def __init__(self):
+        self.keys: List = []
+        self.epoch = 0
+
+class LeafNode(BPlusTreeNode):
+    __slots__ = ('values', 'next', 'prev')
+    is_leaf = True
+
+    def __init__(self):
         self.keys: List = []
-        self.children: List = []
-        self.is_leaf: bool = is_leaf
-        self.next: Optional['BPlusTreeNode'] = None  # For leaf nodes
-        self.values: List = []  # Only for leaf nodes
+        self.epoch = 0
+        self.values: List = []
+        self.next: Optional['LeafNode'] = None
+        self.prev: Optional['LeafNode'] = None
+
+class InternalNode(BPlusTreeNode):
+    __slots__ = ('children',)
+    is_leaf = False
+
+    def __init__(self):
+        self.keys: List = []
+        self.epoch = 0
+        self.children: List[BPlusTreeNode] = []
+
+class Cursor:
+    """A position in a tree's leaf chain, yielding (key, value) pairs in key order.
+
+    With reverse=True it walks the chain backwards. seek() repositions it, so a
+    scan can be resumed later from the last key it returned.
+    """
+
+    def __init__(self, tree, reverse: bool = False):
+        self.tree = tree
+        self.reverse = reverse
+        self.seek(None)
+
+    def seek(self, key, inclusive: bool = True) -> 'Cursor':
+        """Move to the first key >= key (<= key when reversed); None means the start of the scan.
+
+        With inclusive=False an exact match is skipped, which resumes after a key already seen.
+        """
+        tree = self.tree
+        if key is None:
+            self.leaf = tree._last_leaf() if self.reverse else tree._first_leaf()
+            self.pos = len(self.leaf.keys) - 1 if self.reverse else 0
+            return self
+        self.leaf = tree._find_leaf(key)
+        if self.reverse:
+            find = bisect_right if inclusive else bisect_left
+            self.pos = find(self.leaf.keys, key) - 1
+        else:
+            find = bisect_left if inclusive else bisect_right
+            self.pos = find(self.leaf.keys, key)
+        return self
+
+    def __iter__(self) -> 'Cursor':
+        return self
+
+    def __next__(self) -> Tuple[Any, Any]:
+        leaf, pos = self.leaf, self.pos
+        if self.reverse:
+            while leaf is not None and pos < 0:
+                leaf = self.tree._prev_leaf(leaf)
+                pos = len(leaf.keys) - 1 if leaf is not None else 0
+            self.pos = pos - 1
+        else:
+            while leaf is not None and pos >= len(leaf.keys):
+                leaf = self.tree._next_leaf(leaf)
+                pos = 0
+            self.pos = pos + 1
+        self.leaf = leaf
+        if leaf is None:
+            raise StopIteration
+        return leaf.keys[pos], leaf.values[pos]
 
 class BPlusTree:
+    """B+ tree with keys in sorted leaves chained left to right.
+
+    Non-root nodes hold between min_keys and max_keys keys, except along the
+    right edge: appending past the largest key splits nodes there 90/10 so
+    sequential ingest packs the leaves it leaves behind, and the thin nodes
+    this leaves on the right edge may stay below min_keys.
+
+    With relaxed_deletes set, a delete that leaves a leaf underfull skips the
+    borrow/merge, so churn that empties and refills the same leaves does not
+    merge and split them over and over; compact() rebalances those leaves
+    later, in one pass or a few at a time.
+    """
+    # Node classes, so subclasses can build trees out of extended nodes
+    leaf_type = LeafNode
+    internal_type = InternalNode
+
     def __init__(self, degree: int = 3):
         self.degree: int = degree
-        self.root: BPlusTreeNode = BPlusTreeNode(is_leaf=True)
+        # Nodes created from now on get this epoch; those with epoch <= _pinned
+        # may be seen by a live snapshot and are copied before being modified
+        self.epoch = 0
+        self._pinned = -1
+        self._snapshots = weakref.WeakSet()
+        self.root: BPlusTreeNode = self._new_node(self.leaf_type)
         self.min_keys: int = degree - 1
         self.max_keys: int = 2 * degree - 1
+        # Rightmost leaf as of the last insert that reached it; see _is_tail
+        self._tail: Optional[LeafNode] = None
+        # Root-to-leaf descents made so far, to show what each operation costs
+        self.descents = 0
+        self.relaxed_deletes = False
+        # Leaves a relaxed delete left underfull, each with a key deleted from
+        # it that routes compact() to it (or to whatever replaced it)
+        self._sparse: Dict[LeafNode, Any] = {}
 
-    def search(self, key) -> bool:
-        """Search for a key in the B+ tree. Return True if found, False otherwise."""
+    def _find_leaf(self, key) -> LeafNode:
+        """Descend from the root to the leaf that may hold key."""
+        self.descents += 1
         node = self.root
         while not node.is_leaf:
-            # Find the appropriate child to traverse
-            i = 0
-            while i < len(node.keys) and key >= node.keys[i]:
-                i += 1
-            if i >= len(node.children):  # Safety check
-                return False
-            node = node.children[i]
-        
-        # Search in the leaf node
-        return key in node.keys
+            node = node.children[bisect_right(node.keys, key)]
+        return node
+
+    def search(self, key) -> bool:
+        """Search for a key in the B+ tree. Return True if found, False otherwise."""
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        return i < len(leaf.keys) and leaf.keys[i] == key
 
     def get(self, key) -> Optional[object]:
         """Get the value associated with a key, or None if not found."""
-        node = self.root
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i < len(leaf.keys) and leaf.keys[i] == key:
+            return leaf.values[i]
+        return None
+
+    # Snapshots and copy-on-write
+
+    def snapshot(self) -> 'TreeSnapshot':
+        """Return a read-only view of the tree as it is now, unaffected by later writes.
+
+        Taking a snapshot is O(1). Until it is closed or garbage collected, writes
+        copy each node they modify that the snapshot can see (path copying), so
+        the live tree and the snapshot share every unchanged node. Old node
+        versions are freed once no snapshot references them.
+        """
+        snapshot = TreeSnapshot(self, self.root, self.epoch)
+        self._snapshots.add(snapshot)
+        weakref.finalize(snapshot, self._unpin)
+        self._pinned = self.epoch
+        self.epoch += 1
+        return snapshot
+
+    def _unpin(self) -> None:
+        """Recompute the newest epoch a live snapshot can see; writes stop copying when none are left."""
+        self._pinned = max((s.epoch for s in self._snapshots if s.root is not None), default=-1)
+
+    def _new_node(self, node_type):
+        node = node_type()
+        node.epoch = self.epoch
+        return node
+
+    def _copy_node(self, node: BPlusTreeNode) -> BPlusTreeNode:
+        copy = self._new_node(type(node))
+        copy.keys = list(node.keys)
+        if node.is_leaf:
+            copy.values = list(node.values)
+            # Leaf links serve the live tree only (snapshots walk down from their
+            # root), so the neighbours are relinked in place
+            copy.prev, copy.next = node.prev, node.next
+            if node.prev is not None:
+                node.prev.next = copy
+            if node.next is not None:
+                node.next.prev = copy
+        else:
+            copy.children = list(node.children)
+        return copy
+
+    def _own_root(self) -> BPlusTreeNode:
+        """Return the root, copying it first if a snapshot can see it."""
+        if self.root.epoch <= self._pinned:
+            self.root = self._copy_node(self.root)
+        return self.root
+
+    def _own_child(self, parent: InternalNode, idx: int) -> BPlusTreeNode:
+        """Return parent's child at idx, copying it first if a snapshot can see it. parent must be owned."""
+        child = parent.children[idx]
+        if child.epoch <= self._pinned:
+            child = parent.children[idx] = self._copy_node(child)
+        return child
+
+    def _own_leaf(self, leaf: LeafNode, key) -> LeafNode:
+        """Return a modifiable version of the leaf for key, path copying from the root if needed."""
+        if leaf.epoch > self._pinned:
+            # A node newer than every snapshot is only reachable through newer nodes
+            return leaf
+        self.descents += 1
+        node = self._own_root()
         while not node.is_leaf:
-            i = 0
-            while i < len(node.keys) and key >= node.keys[i]:
-                i += 1
-            if i >= len(node.children):  # Safety check
-                return None
-            node = node.children[i]
-        
-        try:
-            idx = node.keys.index(key)
-            return node.values[idx]
-        except ValueError:
-            return None
-
-    def insert(self, key, value=None) -> None:
-        """Insert a key-value pair into the B+ tree."""
-        if self.search(key):
-            self.update(key, value)
-            return
+            node = self._own_child(node, bisect_right(node.keys, key))
+        return node
+
+    def insert(self, key, value=None) -> WriteStatus:
+        """Insert a key-value pair, replacing the value if the key exists. Returns INSERTED or REPLACED."""
+        return self._put(key, value, replace=True)
+
+    def insert_if_absent(self, key, value=None) -> WriteStatus:
+        """Insert a key-value pair unless the key exists. Returns INSERTED or EXISTS."""
+        return self._put(key, value, replace=False)
+
+    def _is_tail(self, leaf: LeafNode) -> bool:
+        """Whether leaf is still the live, modifiable rightmost leaf.
+
+        Merges and copy-on-write unlink a replaced leaf from its left
+        neighbour, so checking the links avoids tracking every change.
+        """
+        if leaf.next is not None or leaf.epoch <= self._pinned:
+            return False
+        return leaf.prev.next is leaf if leaf.prev is not None else leaf is self.root
+
+    def _put(self, key, value, replace: bool) -> WriteStatus:
+        """Insert key, or replace its value if replace is set, in one descent.
 
+        Full nodes are split on the way down before we know whether the key
+        exists; they would split on the next insert below them anyway.
+        """
+        tail = self._tail
+        if tail is not None and tail.keys and key > tail.keys[-1] and self._is_tail(tail):
+            # Appending past the largest key: no descent unless the tail is full
+            if len(tail.keys) < self.max_keys:
+                tail.keys.append(key)
+                tail.values.append(value)
+                return WriteStatus.INSERTED
+
+        self.descents += 1
         # If root is full, split it
-        if len(self.root.keys) == self.max_keys:
+        if len(self._own_root().keys) == self.max_keys:
             old_root = self.root
-            self.root = BPlusTreeNode()
+            self.root = self._new_node(self.internal_type)
             self.root.children.append(old_root)
-            self._split_child(self.root, 0)
-        
-        self._insert_non_full(self.root, key, value)
+            self._split_child(self.root, 0, appending=key > old_root.keys[-1])
+
+        return self._insert_non_full(self.root, key, value, replace)
+
+    def _find_leaf_bounds(self, key) -> Tuple[LeafNode, Any, Any]:
+        """Descend to the leaf for key and return it with its routing bounds [low, high).
+
+        Any key in that range routes to the same leaf, so batches over sorted keys
+        can reuse it instead of descending again. None means unbounded.
+        """
+        self.descents += 1
+        node = self.root
+        low = high = None
+        while not node.is_leaf:
+            i = bisect_right(node.keys, key)
+            if i > 0:
+                low = node.keys[i - 1]
+            if i < len(node.keys):
+                high = node.keys[i]
+            node = node.children[i]
+        return node, low, high
+
+    def get_many(self, keys, default=None) -> List[Optional[object]]:
+        """Get the values for many keys (default where missing), in the order given.
+
+        Keys are looked up in sorted order, moving along the leaf chain while the
+        next key is at most one leaf away, so a sorted batch visits each leaf once.
+        """
+        keys = list(keys)
+        results = [default] * len(keys)
+        leaf = None
+        for i in sorted(range(len(keys)), key=keys.__getitem__):
+            key = keys[i]
+            if leaf is None or not leaf.keys or key > leaf.keys[-1]:
+                nxt = leaf.next if leaf is not None else None
+                if nxt is not None and nxt.keys and key <= nxt.keys[-1]:
+                    leaf = nxt
+                elif leaf is None or nxt is not None:
+                    leaf = self._find_leaf(key)
+            j = bisect_left(leaf.keys, key)
+            if j < len(leaf.keys) and leaf.keys[j] == key:
+                results[i] = leaf.values[j]
+        return results
+
+    def insert_many(self, pairs) -> int:
+        """Insert or replace many key-value pairs; later pairs win on duplicate keys.
+
+        Pairs are applied in key order and go straight into the current leaf while
+        it has room, so a sorted batch visits each leaf about once. Returns the
+        number of new keys.
+        """
+        batch = dict(pairs)
+        inserted = 0
+        leaf = None
+        low = high = None
+        for key in sorted(batch):
+            if leaf is None or (low is not None and key < low) or (high is not None and key >= high):
+                leaf, low, high = self._find_leaf_bounds(key)
+                leaf = self._own_leaf(leaf, key)
+            j = bisect_left(leaf.keys, key)
+            if j < len(leaf.keys) and leaf.keys[j] == key:
+                leaf.values[j] = batch[key]
+            elif len(leaf.keys) < self.max_keys:
+                leaf.keys.insert(j, key)
+                leaf.values.insert(j, batch[key])
+                inserted += 1
+            else:
+                # Full leaf: take the splitting path and descend afresh next time
+                self._put(key, batch[key], replace=True)
+                inserted += 1
+                leaf = None
+        return inserted
+
+    def delete_many(self, keys) -> int:
+        """Delete many keys, visiting each leaf about once for a sorted batch. Returns the number deleted."""
+        deleted = 0
+        leaf = None
+        low = high = None
+        for key in sorted(set(keys)):
+            if leaf is None or (low is not None and key < low) or (high is not None and key >= high):
+                leaf, low, high = self._find_leaf_bounds(key)
+            j = bisect_left(leaf.keys, key)
+            if j == len(leaf.keys) or leaf.keys[j] != key:
+                continue
+            if len(leaf.keys) > self.min_keys or leaf is self.root or self.relaxed_deletes:
+                leaf = self._own_leaf(leaf, key)
+                leaf.keys.pop(j)
+                leaf.values.pop(j)
+                if len(leaf.keys) < self.min_keys and leaf is not self.root:
+                    self._defer(leaf, key)
+            else:
+                # The leaf would underflow: rebalance through the normal path
+                self.delete(key)
+                leaf = None
+            deleted += 1
+        return deleted
+
+    def bulk_load(self, sorted_pairs, fill_factor: float = 1.0) -> None:
+        """Replace the tree contents with (key, value) pairs given in strictly increasing key order.
+
+        Leaves are packed to fill_factor of capacity and internal levels are built
+        bottom-up, so loading n pairs is O(n) instead of n separate inserts.
+        """
+        if not 0 < fill_factor <= 1:
+            raise ValueError("fill_factor must be in (0, 1]")
+        pairs = list(sorted_pairs)
+        for i in range(1, len(pairs)):
+            if not pairs[i - 1][0] < pairs[i][0]:
+                raise ValueError("bulk_load requires strictly increasing keys")
+
+        per_leaf = min(self.max_keys, max(self.min_keys, 1, round(self.max_keys * fill_factor)))
+
+        # Pack the leaves and chain them together
+        level = []  # (node, smallest key in its subtree)
+        prev = None
+        start = 0
+        for size in self._pack_sizes(len(pairs), per_leaf, self.min_keys, self.max_keys):
+            leaf = self._new_node(self.leaf_type)
+            chunk = pairs[start:start + size]
+            leaf.keys = [k for k, _ in chunk]
+            leaf.values = [v for _, v in chunk]
+            if prev is not None:
+                prev.next = leaf
+                leaf.prev = prev
+            prev = leaf
+            level.append((leaf, leaf.keys[0]))
+            start += size
+
+        self._tail = None
+        self._sparse.clear()
+        if not level:
+            self.root = self._new_node(self.leaf_type)
+            return
+
+        # Build internal levels until a single root remains
+        per_node = per_leaf + 1
+        while len(level) > 1:
+            parents = []
+            start = 0
+            for size in self._pack_sizes(len(level), per_node, self.min_keys + 1, self.max_keys + 1):
+                group = level[start:start + size]
+                node = self._new_node(self.internal_type)
+                node.children = [child for child, _ in group]
+                node.keys = [low for _, low in group[1:]]
+                parents.append((node, group[0][1]))
+                start += size
+            level = parents
+
+        self.root = level[0][0]
+
+    @staticmethod
+    def _pack_sizes(count: int, per_node: int, low: int, high: int) -> List[int]:
+        """Split count entries into nodes of per_node entries, keeping the last node within [low, high]."""
+        sizes = [per_node] * (count // per_node)
+        if count % per_node:
+            sizes.append(count % per_node)
+        if len(sizes) > 1 and sizes[-1] < low:
+            total = sizes.pop() + sizes.pop()
+            if total <= high:
+                sizes.append(total)
+            else:
+                sizes += [total // 2, total - total // 2]
+        return sizes
+
+    def _insert_non_full(self, node: BPlusTreeNode, key, value, replace: bool = True) -> WriteStatus:
+        rightmost = node is self.root
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
 
-    def _insert_non_full(self, node: BPlusTreeNode, key, value) -> None:
-        if node.is_leaf:
-            # Insert into leaf node
-            idx = 0
-            while idx < len(node.keys) and key > node.keys[idx]:
-                idx += 1
-            node.keys.insert(idx, key)
-            node.values.insert(idx, value)
-        else:
-            # Find the appropriate child
-            idx = 0
-            while idx < len(node.keys) and key > node.keys[idx]:
-                idx += 1
-            
             # If child is full, split it
-            if len(node.children[idx].keys) == self.max_keys:
-                self._split_child(node, idx)
-                if key > node.keys[idx]:
+            child = self._own_child(node, idx)
+            if len(child.keys) == self.max_keys:
+                self._split_child(node, idx, appending=rightmost and idx == len(node.keys)
+                                  and key > child.keys[-1])
+                if key >= node.keys[idx]:
                     idx += 1
-            
-            self._insert_non_full(node.children[idx], key, value)
+            rightmost = rightmost and idx == len(node.keys)
+
+            node = node.children[idx]
+
+        # Insert into leaf node
+        if rightmost:
+            self._tail = node
+        idx = bisect_left(node.keys, key)
+        if idx < len(node.keys) and node.keys[idx] == key:
+            if not replace:
+                return WriteStatus.EXISTS
+            node.values[idx] = value
+            return WriteStatus.REPLACED
+        node.keys.insert(idx, key)
+        node.values.insert(idx, value)
+        return WriteStatus.INSERTED
 
-    def _split_child(self, parent: BPlusTreeNode, child_idx: int) -> None:
+    @staticmethod
+    def _split_point(length: int, is_leaf: bool, appending: bool) -> int:
+        """Index of the key a full node splits at: the middle, or near the end when appending.
+
+        An internal node keeps at least one key on the right so it never has a single child.
+        """
+        if not appending:
+            return length // 2
+        return max(length // 2, min(int(length * APPEND_SPLIT), length - (1 if is_leaf else 2)))
+
+    def _split_child(self, parent: InternalNode, child_idx: int, appending: bool = False) -> None:
+        """Split the full child at child_idx; appending=True splits 90/10 for a key past all of it."""
         child = parent.children[child_idx]
-        new_node = BPlusTreeNode(is_leaf=child.is_leaf)
-        
-        split_point = len(child.keys) // 2
+        new_node = self._new_node(type(child))
+
+        split_point = self._split_point(len(child.keys), child.is_leaf, appending)
         mid_key = child.keys[split_point]
-        
+
         # Split keys and children
         new_node.keys = child.keys[split_point + (0 if child.is_leaf else 1):]
         child.keys = child.keys[:split_point]
-        
+
         if not child.is_leaf:
             new_node.children = child.children[split_point + 1:]
             child.children = child.children[:split_point + 1]
@@ -103,65 +488,129 @@ class BPlusTree:
             new_node.values = child.values[split_point:]
             child.values = child.values[:split_point]
             new_node.next = child.next
+            new_node.prev = child
+            if child.next is not None:
+                child.next.prev = new_node
             child.next = new_node
-        
+
         # Insert the new node into parent
         parent.keys.insert(child_idx, mid_key)
         parent.children.insert(child_idx + 1, new_node)
 
-    def delete(self, key) -> bool:
-        """Delete a key from the B+ tree. Returns True if successful, False if key not found."""
-        if not self.search(key):
-            return False
-        
-        self._delete(self.root, key)
-        
+    def delete(self, key) -> WriteStatus:
+        """Delete a key from the B+ tree. Returns DELETED, or NOT_FOUND if the key is absent."""
+        return WriteStatus.NOT_FOUND if self._pop(key) is _MISSING else WriteStatus.DELETED
+
+    def pop(self, key, default=None):
+        """Delete a key and return its value, or default if the key is absent."""
+        value = self._pop(key)
+        return default if value is _MISSING else value
+
+    def _pop(self, key):
+        """Delete key in one descent, returning its value or _MISSING."""
+        self.descents += 1
+        value = self._delete(self._own_root(), key)
+
         # If root becomes empty after deletion
-        if not self.root.keys and self.root.children:
+        if not self.root.is_leaf and not self.root.keys:
             self.root = self.root.children[0]
-        
-        return True
 
-    def _delete(self, node: BPlusTreeNode, key) -> None:
+        return value
+
+    def _delete(self, node: BPlusTreeNode, key):
+        """Delete key below node and return its value, or _MISSING if it is absent."""
         if node.is_leaf:
             # Delete from leaf node
-            try:
-                idx = node.keys.index(key)
+            idx = bisect_left(node.keys, key)
+            if idx < len(node.keys) and node.keys[idx] == key:
                 node.keys.pop(idx)
-                if node.values and idx < len(node.values):  # Ensure idx is valid for values
-                    node.values.pop(idx)
-            except ValueError:
-                return  # Key not found in this leaf
-        else:
-            # Find the appropriate child
-            idx = 0
-            while idx < len(node.keys) and key >= node.keys[idx]:
-                idx += 1
-            
-            # Ensure we don't go out of bounds
-            if idx >= len(node.children):
-                return
-            
-            # Check if key exists in the subtree
-            if idx < len(node.keys) and key == node.keys[idx]:
-                # Key is in this internal node, find predecessor
-                predecessor = self._get_predecessor(node.children[idx])
-                node.keys[idx] = predecessor
-                self._delete(node.children[idx], predecessor)
-            else:
-                self._delete(node.children[idx], key)
-            
-            # Check if child needs merging or borrowing
-            if len(node.children[idx].keys) < self.min_keys:
-                self._fill_child(node, idx)
-
-    def _get_predecessor(self, node: BPlusTreeNode):
-        """Get the largest key in the subtree rooted at node"""
+                return node.values.pop(idx)
+            return _MISSING
+
+        # Separators may outlive the keys they were copied from; they still
+        # route correctly, so only the child on the path needs fixing up.
+        idx = bisect_right(node.keys, key)
+        value = self._delete(self._own_child(node, idx), key)
+
+        # Check if child needs merging or borrowing
+        if len(node.children[idx].keys) < self.min_keys and not self._defer(node.children[idx], key):
+            self._fill_child(node, idx)
+        return value
+
+    def _defer(self, node: BPlusTreeNode, key) -> bool:
+        """Whether an underfull node is left for compact() rather than rebalanced now.
+
+        Only leaves are, in relaxed mode; the leaf is noted with key, the key
+        deleted from it, so compact() can find it again.
+        """
+        if not (self.relaxed_deletes and node.is_leaf):
+            return False
+        self._sparse[node] = key
+        return True
+
+    @property
+    def sparse_leaves(self) -> int:
+        """Leaves relaxed deletes have left underfull since the last compaction."""
+        return len(self._sparse)
+
+    def estimated_count(self) -> int:
+        """Approximate number of keys, in time proportional to the tree's height, for planning.
+
+        The fan-out of the nodes on one root-to-leaf path is multiplied out,
+        which is within a small factor of the true count.
+        """
+        estimate = 1
+        node = self.root
         while not node.is_leaf:
-            node = node.children[-1]
-        return node.keys[-1] if node.keys else None
+            estimate *= len(node.children)
+            node = node.children[len(node.children) // 2]
+        return estimate * len(node.keys)
+
+    def compact(self, limit: Optional[int] = None) -> int:
+        """Rebalance the leaves relaxed deletes left underfull; returns the number repaired.
+
+        Only the paths to the leaves noted by those deletes are visited, and
+        each is repaired like the ends of a range delete; a noted leaf that
+        inserts have refilled since is skipped without a descent. limit caps
+        how many noted leaves one call handles, so compaction can run a
+        little at a time between writes.
+        """
+        pending = sorted(self._sparse.items(), key=itemgetter(1))
+        if limit is not None:
+            pending = pending[:limit]
+        for leaf, _ in pending:
+            del self._sparse[leaf]
+        # Skip leaves refilled since; a snapshot copy made later is noted itself if it underflows
+        pending = [key for leaf, key in pending if len(leaf.keys) < self.min_keys]
+        if not pending:
+            return 0
+        # As in delete_range, the root is replaced only once every path is repaired
+        root = self._copy_node(self.root) if self.root.epoch <= self._pinned else self.root
+        repaired = sum(1 for key in pending if self._compact_path(root, key))
+        while not root.is_leaf and len(root.children) == 1:
+            root = root.children[0]
+        self.root = root
+        return repaired
+
+    def _compact_path(self, root: BPlusTreeNode, key) -> bool:
+        """Rebalance the leaf under root (modifiable) that holds key, and its ancestors, if it is underfull."""
+        self.descents += 1
+        node = root
+        while not node.is_leaf:
+            node = node.children[bisect_right(node.keys, key)]
+        if node is root or len(node.keys) >= self.min_keys:
+            return False
+        path = []
+        node = root
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            path.append((node, idx))
+            node = self._own_child(node, idx)
+        for parent, idx in reversed(path):
+            self._repair(parent, idx)
+        return True
 
-    def _fill_child(self, parent: BPlusTreeNode, child_idx: int) -> None:
+    def _fill_child(self, parent: InternalNode, child_idx: int) -> None:
         """Ensure child at given index has enough keys"""
         if child_idx > 0 and len(parent.children[child_idx - 1].keys) > self.min_keys:
             # Borrow from left sibling
@@ -178,18 +627,15 @@ class BPlusTree:
                 # Merge with right sibling
                 self._merge(parent, child_idx)
 
-    def _borrow_from_prev(self, parent: BPlusTreeNode, child_idx: int) -> None:
+    def _borrow_from_prev(self, parent: InternalNode, child_idx: int) -> None:
         child = parent.children[child_idx]
-        left_sibling = parent.children[child_idx - 1]
-        
+        left_sibling = self._own_child(parent, child_idx - 1)
+
         if child.is_leaf:
-            # Borrow key from left sibling
-            borrowed_key = left_sibling.keys.pop()
-            borrowed_value = left_sibling.values.pop() if left_sibling.values else None
-            child.keys.insert(0, borrowed_key)
-            if borrowed_value is not None:
-                child.values.insert(0, borrowed_value)
-            parent.keys[child_idx - 1] = left_sibling.keys[-1] if left_sibling.keys else borrowed_key
+            # Borrow key from left sibling; it becomes the new separator
+            child.keys.insert(0, left_sibling.keys.pop())
+            child.values.insert(0, left_sibling.values.pop())
+            parent.keys[child_idx - 1] = child.keys[0]
         else:
             # Borrow from internal node
             borrowed_key = parent.keys[child_idx - 1]
@@ -198,18 +644,15 @@ class BPlusTree:
             child.children.insert(0, borrowed_child)
             parent.keys[child_idx - 1] = left_sibling.keys.pop()
 
-    def _borrow_from_next(self, parent: BPlusTreeNode, child_idx: int) -> None:
+    def _borrow_from_next(self, parent: InternalNode, child_idx: int) -> None:
         child = parent.children[child_idx]
-        right_sibling = parent.children[child_idx + 1]
-        
+        right_sibling = self._own_child(parent, child_idx + 1)
+
         if child.is_leaf:
             # Borrow key from right sibling
-            borrowed_key = right_sibling.keys.pop(0)
-            borrowed_value = right_sibling.values.pop(0) if right_sibling.values else None
-            child.keys.append(borrowed_key)
-            if borrowed_value is not None:
-                child.values.append(borrowed_value)
-            parent.keys[child_idx] = right_sibling.keys[0] if right_sibling.keys else borrowed_key
+            child.keys.append(right_sibling.keys.pop(0))
+            child.values.append(right_sibling.values.pop(0))
+            parent.keys[child_idx] = right_sibling.keys[0]
         else:
             # Borrow from internal node
             borrowed_key = parent.keys[child_idx]
@@ -218,127 +661,289 @@ class BPlusTree:
             child.children.append(borrowed_child)
             parent.keys[child_idx] = right_sibling.keys.pop(0)
 
-    def _merge(self, parent: BPlusTreeNode, child_idx: int) -> None:
-        left_child = parent.children[child_idx]
-        right_child = parent.children[child_idx + 1]
-        
+    def _merge(self, parent: InternalNode, child_idx: int) -> None:
+        left_child = self._own_child(parent, child_idx)
+        right_child = parent.children[child_idx + 1]  # Discarded, so never modified
+        separator = parent.keys.pop(child_idx)
+
         if left_child.is_leaf:
             # Merge leaf nodes
             left_child.keys += right_child.keys
             left_child.values += right_child.values
             left_child.next = right_child.next
+            if right_child.next is not None:
+                right_child.next.prev = left_child
         else:
             # Merge internal nodes
-            left_child.keys.append(parent.keys.pop(child_idx))
+            left_child.keys.append(separator)
             left_child.keys += right_child.keys
             left_child.children += right_child.children
-        
+
         parent.children.pop(child_idx + 1)
 
         # If parent is root and becomes empty
-        if parent == self.root and not parent.keys:
+        if parent is self.root and not parent.keys:
             self.root = left_child
 
-    def update(self, key, new_value) -> bool:
-        """Update the value associated with a key. Returns True if successful."""
-        node = self.root
-        while not node.is_leaf:
-            i = 0
-            while i < len(node.keys) and key >= node.keys[i]:
-                i += 1
-            if i >= len(node.children):  # Safety check
-                return False
-            node = node.children[i]
-        
-        try:
-            idx = node.keys.index(key)
-            node.values[idx] = new_value
-            return True
-        except ValueError:
-            return False
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        """Delete every key with start_key <= key <= end_key; either bound may be None. Returns the number deleted.
+
+        Subtrees that lie wholly inside the range are unlinked from their
+        parents in one step rather than emptied key by key, so only the nodes
+        on the paths to the two ends of the range are trimmed and rebalanced,
+        and the leaf chain is closed over each run of leaves dropped. Deleting
+        everything just starts a new root.
+        """
+        if start_key is not None and end_key is not None and start_key > end_key:
+            return 0
+        self.descents += 1
+        self._tail = None  # It may be among the leaves unlinked
+        if start_key is None and end_key is None:
+            deleted = self._count_keys(self.root)
+            self.root = self._new_node(self.leaf_type)
+            return deleted
+        # The root is replaced only at the end, when the tree is whole again
+        root = self._copy_node(self.root) if self.root.epoch <= self._pinned else self.root
+        deleted = self._delete_range(root, start_key, end_key)
+        while not root.is_leaf and len(root.children) == 1:
+            root = root.children[0]
+        self.root = root
+        return deleted
+
+    def _delete_range(self, node: BPlusTreeNode, start_key, end_key) -> int:
+        """Delete the keys in [start_key, end_key] below node, which must be modifiable; returns the count.
+
+        Children between the two that hold the bounds are dropped whole. On
+        return every node below node is at least min_keys full again; node
+        itself may not be, and is left for its parent to repair.
+        """
+        if node.is_leaf:
+            low = 0 if start_key is None else bisect_left(node.keys, start_key)
+            high = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+            if high <= low:
+                return 0
+            del node.keys[low:high]
+            del node.values[low:high]
+            return high - low
+        first = 0 if start_key is None else bisect_right(node.keys, start_key)
+        last = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+        deleted = sum(self._count_keys(node.children[i]) for i in range(first + 1, last))
+        if last > first + 1:
+            # Close the leaf chain over the leaves dropped, which are never visited
+            head, tail = node.children[first + 1], node.children[last - 1]
+            while not head.is_leaf:
+                head, tail = head.children[0], tail.children[-1]
+            if head.prev is not None:
+                head.prev.next = tail.next
+            if tail.next is not None:
+                tail.next.prev = head.prev
+            self._drop_children(node, first + 1, last)
+        deleted += self._delete_range(self._own_child(node, first), start_key, end_key)
+        if last > first:
+            deleted += self._delete_range(self._own_child(node, first + 1), start_key, end_key)
+            self._repair(node, first + 1)
+        self._repair(node, min(first, len(node.children) - 1))
+        return deleted
+
+    def _count_keys(self, node: BPlusTreeNode) -> int:
+        """Number of keys in the subtree under node."""
+        count = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                count += len(node.keys)
+            else:
+                stack.extend(node.children)
+        return count
+
+    def _drop_children(self, node: InternalNode, low: int, high: int) -> None:
+        """Unlink children[low:high] of node (low >= 1) with the separators before them."""
+        del node.children[low:high]
+        del node.keys[low - 1:high - 1]
+
+    def _repair(self, parent: InternalNode, idx: int) -> None:
+        """Rebalance the child at idx, which a range delete may have left with any number of keys.
+
+        It merges with or borrows from its neighbours until it is min_keys
+        full or the only child. A merged or refilled internal node may have
+        taken in an underfull child of its own, so its children are checked
+        in turn.
+        """
+        floor = max(self.min_keys, 1)
+        if len(parent.children) == 1 or len(parent.children[idx].keys) >= floor:
+            return
+        child = self._own_child(parent, idx)
+        while len(parent.children) > 1 and len(child.keys) < floor:
+            i = idx - 1 if idx > 0 else idx
+            left, right = parent.children[i], parent.children[i + 1]
+            if len(left.keys) + len(right.keys) + (0 if left.is_leaf else 1) <= self.max_keys:
+                self._merge(parent, i)
+                idx = i
+            elif idx > i:
+                while len(child.keys) < floor:
+                    self._borrow_from_prev(parent, idx)
+            else:
+                while len(child.keys) < floor:
+                    self._borrow_from_next(parent, idx)
+            child = parent.children[idx]
+            if child.is_leaf:
+                continue
+            # Merging the underfull children it took in may leave child underfull again
+            j = 0
+            while j < len(child.children):
+                count = len(child.children)
+                self._repair(child, j)
+                if len(child.children) == count:  # Else a merge moved the next child to j
+                    j += 1
+
+    def update(self, key, new_value) -> WriteStatus:
+        """Update the value associated with a key. Returns REPLACED, or NOT_FOUND if the key is absent."""
+        return self.modify(key, lambda _: new_value)
+
+    def modify(self, key, func: Callable[[Any], Any]) -> WriteStatus:
+        """Replace the value of key with func(old value) in one descent. Returns REPLACED or NOT_FOUND.
+
+        If func raises, the tree is left unchanged.
+        """
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i < len(leaf.keys) and leaf.keys[i] == key:
+            new_value = func(leaf.values[i])
+            self._own_leaf(leaf, key).values[i] = new_value
+            return WriteStatus.REPLACED
+        return WriteStatus.NOT_FOUND
 
     def range_query(self, start_key, end_key) -> List[Tuple]:
         """Return all key-value pairs where start_key <= key <= end_key."""
         results = []
-        
-        # Find the starting leaf node
-        node = self.root
-        while not node.is_leaf:
-            i = 0
-            while i < len(node.keys) and start_key > node.keys[i]:
-                i += 1
-            if i >= len(node.children):  # Safety check
-                return results
-            node = node.children[i]
-        
+
+        # Find the starting leaf node and the first key in range
+        node = self._find_leaf(start_key)
+        i = bisect_left(node.keys, start_key)
+
         # Traverse leaf nodes
         while node:
-            for i, key in enumerate(node.keys):
-                if start_key <= key <= end_key:
-                    results.append((key, node.values[i] if node.values else None))
-                elif key > end_key:
-                    return results
+            keys = node.keys
+            stop = bisect_right(keys, end_key, i)
+            results.extend(zip(keys[i:stop], node.values[i:stop]))
+            if stop < len(keys):
+                return results
             node = node.next
-        
+            i = 0
+
         return results
 
+    def _first_leaf(self) -> LeafNode:
+        node = self.root
+        while not node.is_leaf:
+            node = node.children[0]
+        return node
+
+    def _last_leaf(self) -> LeafNode:
+        node = self.root
+        while not node.is_leaf:
+            node = node.children[-1]
+        return node
+
+    def _next_leaf(self, leaf: LeafNode) -> Optional[LeafNode]:
+        return leaf.next
+
+    def _prev_leaf(self, leaf: LeafNode) -> Optional[LeafNode]:
+        return leaf.prev
+
+    def cursor(self, reverse: bool = False) -> Cursor:
+        """Return a cursor positioned at the first key (the last key if reverse)."""
+        return Cursor(self, reverse)
+
+    def iter_range(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                   reverse: bool = False) -> Iterator[Tuple]:
+        """Lazily yield pairs with start_key <= key <= end_key; either bound may be None.
+
+        Pairs come in descending key order when reverse is set, and at most limit
+        of them are produced. Nothing is materialized up front.
+        """
+        if limit is not None and limit <= 0:
+            return
+        cursor = self.cursor(reverse).seek(end_key if reverse else start_key)
+        stop = start_key if reverse else end_key
+        count = 0
+        for key, value in cursor:
+            if stop is not None and (key < stop if reverse else key > stop):
+                return
+            yield key, value
+            count += 1
+            if count == limit:
+                return
+
     def get_all(self) -> List[Tuple]:
         """Return all key-value pairs in the tree."""
         results = []
         node = self.root
-        
+
         # Find the leftmost leaf
         while not node.is_leaf:
-            if not node.children:  # Safety check
-                return results
             node = node.children[0]
-        
+
         # Traverse all leaf nodes
         while node:
-            for i, key in enumerate(node.keys):
-                results.append((key, node.values[i] if node.values else None))
+            results.extend(zip(node.keys, node.values))
             node = node.next
-        
+
         return results
 
+    def leaf_fill_factor(self) -> float:
+        """Average leaf occupancy as a fraction of max_keys."""
+        node = self._first_leaf()
+        leaves = keys = 0
+        while node:
+            leaves += 1
+            keys += len(node.keys)
+            node = node.next
+        return keys / (leaves * self.max_keys)
+
     def validate_tree(self) -> bool:
         """Check tree invariants"""
-        return self._validate_node(self.root)
+        return self._validate_node(self.root, None, None)
 
-    def _validate_node(self, node: BPlusTreeNode) -> bool:
-        if node.is_leaf:
-            # Check leaf node properties
-            if len(node.keys) > self.max_keys or (node != self.root and len(node.keys) < self.min_keys):
-                return False
-            return True
-        
-        # Check internal node properties
-        if len(node.keys) > self.max_keys or (node != self.root and len(node.keys) < self.min_keys):
+    def _validate_node(self, node: BPlusTreeNode, low, high) -> bool:
+        # Check occupancy and ordering, and that every key lies in [low, high);
+        # nodes on the right edge (no high bound) may be thinned by appends,
+        # and leaves anywhere by relaxed deletes
+        underfull = high is not None and len(node.keys) < self.min_keys
+        if len(node.keys) > self.max_keys or (underfull and not (node.is_leaf and self.relaxed_deletes)):
             return False
-        
-        if len(node.children) != len(node.keys) + 1:
+        if any(a >= b for a, b in zip(node.keys, node.keys[1:])):
+            return False
+        if node.keys and ((low is not None and node.keys[0] < low) or
+                          (high is not None and node.keys[-1] >= high)):
             return False
-        
-        # Check keys are sorted
-        if node.keys != sorted(node.keys):
+
+        if node.is_leaf:
+            return len(node.values) == len(node.keys)
+
+        if len(node.children) != len(node.keys) + 1:
             return False
-        
+
         # Recursively validate children
-        for child in node.children:
-            if not self._validate_node(child):
+        bounds = [low] + node.keys + [high]
+        for i, child in enumerate(node.children):
+            if not self._validate_node(child, bounds[i], bounds[i + 1]):
                 return False
-        
+
         return True
 
     def visualize_tree(self, filename: str = 'bplustree') -> None:
         """Generate a visualization of the B+ tree using Graphviz."""
+        import graphviz  # Optional dependency, only needed here
+
         dot = graphviz.Digraph(comment='B+ Tree', node_attr={'shape': 'box'})
-        
+
         # Add nodes
         nodes = [self.root]
         while nodes:
             node = nodes.pop(0)
-            
+
             if node.is_leaf:
                 label = f"Leaf: {node.keys}"
                 if node.values:
@@ -346,9 +951,9 @@ class BPlusTree:
             else:
                 label = f"Node: {node.keys}"
                 nodes.extend(node.children)
-            
+
             dot.node(str(id(node)), label=label)
-        
+
         # Add edges
         nodes = [self.root]
         while nodes:
@@ -357,7 +962,7 @@ class BPlusTree:
                 for child in node.children:
                     dot.edge(str(id(node)), str(id(child)))
                     nodes.append(child)
-        
+
         # Add leaf links
         if not self.root.is_leaf:
             # Find leftmost leaf
@@ -366,13 +971,13 @@ class BPlusTree:
                 if not node.children:  # Safety check
                     break
                 node = node.children[0]
-            
+
             # Add links between leaves
             while node and node.next:
-                dot.edge(str(id(node)), str(id(node.next)), 
+                dot.edge(str(id(node)), str(id(node.next)),
                        style='dashed', constraint='false')
                 node = node.next
-        
+
         try:
             dot.render(filename, format='png', cleanup=True)
             print(f"Visualization saved as {filename}.png")
@@ -395,7 +1000,73 @@ class BPlusTree:
                 print(f"{prefix}Node: {node.keys}")
                 for child in reversed(node.children):
                     nodes.insert(0, (child, level + 1))
-            
+
             # Show leaf links
             if node.is_leaf and node.next:
-                print(f"{prefix}  -> Next leaf: {node.next.keys[:1]}...")
\ No newline at end of file
+                print(f"{prefix}  -> Next leaf: {node.next.keys[:1]}...")
+
+class TreeSnapshot:
+    """Read-only view of a BPlusTree as of a BPlusTree.snapshot() call.
+
+    Its nodes are never modified again, so it can be read while the live tree
+    keeps changing (from other threads too). Scans walk down from the
+    snapshot's root rather than along the leaf links, which belong to the live
+    tree. Close it, or drop it, so the tree can stop copying nodes.
+    """
+
+    def __init__(self, tree: BPlusTree, root: BPlusTreeNode, epoch: int):
+        self.tree = tree
+        self.root = root
+        self.epoch = epoch
+        self.descents = 0
+
+    _find_leaf = BPlusTree._find_leaf
+    search = BPlusTree.search
+    get = BPlusTree.get
+
+    def iter_range(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                   reverse: bool = False) -> Iterator[Tuple]:
+        """Lazily yield pairs with start_key <= key <= end_key, like BPlusTree.iter_range."""
+        if self.root is None:
+            raise ValueError("Snapshot is closed")
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                keys = node.keys
+                lo = 0 if start_key is None else bisect_left(keys, start_key)
+                hi = len(keys) if end_key is None else bisect_right(keys, end_key)
+                for i in (range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)):
+                    yield keys[i], node.values[i]
+                    count += 1
+                    if count == limit:
+                        return
+                continue
+            # Only visit children whose key range overlaps [start_key, end_key]
+            first = 0 if start_key is None else bisect_right(node.keys, start_key)
+            last = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+            children = node.children[first:last + 1]
+            stack.extend(children if reverse else reversed(children))
+
+    def range_query(self, start_key, end_key) -> List[Tuple]:
+        """Return all key-value pairs where start_key <= key <= end_key."""
+        return list(self.iter_range(start_key, end_key))
+
+    def get_all(self) -> List[Tuple]:
+        """Return all key-value pairs in the snapshot."""
+        return list(self.iter_range())
+
+    def close(self) -> None:
+        """Release the snapshot so the tree no longer preserves its nodes."""
+        if self.root is not None:
+            self.root = None
+            self.tree._unpin()
+
+    def __enter__(self) -> 'TreeSnapshot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
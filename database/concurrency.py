@@ -0,0 +1,557 @@
+# concurrency.py
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Tuple
+from bplustree import _MISSING, BPlusTree, InternalNode, LeafNode, WriteStatus
+
+class RWLatch:
+    """Reader/writer latch: many readers or one writer.
+
+    Built from two plain locks, so an uncontended acquire costs little more than
+    a Lock and every node can afford one. The first reader takes the writer
+    lock on behalf of all readers and the last one releases it; readers are
+    preferred, which is fine for latches held only across one tree step.
+    """
+    __slots__ = ('_mutex', '_writer', '_readers')
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._writer = threading.Lock()
+        self._readers = 0
+
+    def acquire_read(self) -> None:
+        with self._mutex:
+            self._readers += 1
+            if self._readers == 1:
+                self._writer.acquire()
+
+    def release_read(self) -> None:
+        with self._mutex:
+            self._readers -= 1
+            if not self._readers:
+                self._writer.release()
+
+    def acquire_write(self) -> None:
+        self._writer.acquire()
+
+    def release_write(self) -> None:
+        self._writer.release()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+class LatchedLeafNode(LeafNode):
+    __slots__ = ('latch',)
+
+    def __init__(self):
+        super().__init__()
+        self.latch = RWLatch()
+
+class LatchedInternalNode(InternalNode):
+    __slots__ = ('latch',)
+
+    def __init__(self):
+        super().__init__()
+        self.latch = RWLatch()
+
+class SeekingCursor:
+    """Cursor that copies one leaf at a time and finds the next leaf by descending again.
+
+    It never follows next/prev links or holds a latch between leaves, so it is
+    safe while other threads split and merge nodes. Each step resumes from the
+    routing bound of the leaf it just read, so no key present throughout the
+    scan is skipped. The tree provides _leaf_snapshot(key, before).
+    """
+
+    def __init__(self, tree, reverse: bool = False):
+        self.tree = tree
+        self.reverse = reverse
+        self.seek(None)
+
+    def seek(self, key, inclusive: bool = True) -> 'SeekingCursor':
+        """Move to the first key >= key (<= key when reversed); None means the start of the scan."""
+        self.pairs: List[Tuple] = []
+        self.pos = 0
+        self.bound = key
+        self.inclusive = inclusive
+        self.done = False
+        return self
+
+    def _load(self) -> None:
+        key, inclusive = self.bound, self.inclusive
+        if self.reverse:
+            # A bound of None starts from the rightmost leaf
+            keys, values, low, _ = self.tree._leaf_snapshot(key, before=key is None or not inclusive)
+            if key is None:
+                end = len(keys)
+            else:
+                end = (bisect_right if inclusive else bisect_left)(keys, key)
+            self.pairs = list(zip(keys[end - 1::-1], values[end - 1::-1])) if end else []
+            # Everything below this leaf's lower bound comes next
+            self.bound, self.inclusive, self.done = low, False, low is None
+        else:
+            keys, values, _, high = self.tree._leaf_snapshot(key)
+            start = 0 if key is None else (bisect_left if inclusive else bisect_right)(keys, key)
+            self.pairs = list(zip(keys[start:], values[start:]))
+            self.bound, self.inclusive, self.done = high, True, high is None
+        self.pos = 0
+
+    def __iter__(self) -> 'SeekingCursor':
+        return self
+
+    def __next__(self) -> Tuple[Any, Any]:
+        while self.pos >= len(self.pairs):
+            if self.done:
+                raise StopIteration
+            self._load()
+        pair = self.pairs[self.pos]
+        self.pos += 1
+        return pair
+
+class ConcurrentBPlusTree(BPlusTree):
+    """B+ tree that many threads can read and write at once.
+
+    Every node carries a reader/writer latch and operations crab down the tree:
+    a child is latched before its parent is released. Readers take shared
+    latches. Writers first descend with shared latches and write-latch only the
+    leaf; if the leaf would split or underflow they retry with write latches,
+    keeping only the ancestors a structure change could reach. The root is only
+    replaced by a thread holding its write latch, so a descent latches the root
+    and then checks it is still the root. Scans use SeekingCursor, so they never
+    hold a latch while the caller consumes results.
+
+    Writes to different leaves proceed in parallel; bulk_load, validate_tree
+    and the print/visualize helpers expect no concurrent writers.
+
+    While a snapshot is alive, writes skip the optimistic path and copy nodes
+    as they descend with write latches; snapshot() waits for in-flight writes
+    through snapshot_latch so it never captures a half-applied one. Writers
+    pass snapshot_gate first so a waiting snapshot() is not starved by them.
+    """
+    leaf_type = LatchedLeafNode
+    internal_type = LatchedInternalNode
+
+    def __init__(self, degree: int = 3):
+        self.snapshot_latch = RWLatch()  # Shared by writers, exclusive for snapshot()
+        self.snapshot_gate = threading.Lock()
+        self._detached = False  # Set while delete_range or compact builds its copy of the tree unlatched
+        # Epoch a detached write copies up to, or -1; _unpin keeps _pinned at least this high
+        self._detached_pin = -1
+        # Guards _pinned: snapshot finalizers run _unpin on whichever thread
+        # collects them, possibly in the middle of an operation holding it
+        self._pin_lock = threading.RLock()
+        super().__init__(degree)
+
+    def snapshot(self):
+        with self.snapshot_gate:
+            self.snapshot_latch.acquire_write()
+        try:
+            with self._pin_lock:
+                return super().snapshot()
+        finally:
+            self.snapshot_latch.release_write()
+
+    def _unpin(self) -> None:
+        with self._pin_lock:
+            super()._unpin()
+            self._pinned = max(self._pinned, self._detached_pin)
+
+    def _own_root(self):
+        """Copy the write-latched root if a snapshot can see it; the copy is returned write-latched."""
+        root = self.root
+        if root.epoch <= self._pinned:
+            copy = self._copy_node(root)
+            copy.latch.acquire_write()
+            self.root = copy
+            root.latch.release_write()
+        return self.root
+
+    def _own_child(self, parent, idx: int):
+        """Like BPlusTree._own_child for a write-latched parent and child; a copy is returned write-latched."""
+        if self._detached:
+            return super()._own_child(parent, idx)
+        child = parent.children[idx]
+        if child.epoch <= self._pinned:
+            copy = self._copy_node(child)
+            copy.latch.acquire_write()
+            parent.children[idx] = copy
+            child.latch.release_write()
+            child = copy
+        return child
+
+    # Descents
+
+    def _latch_root(self, write: bool = False, write_leaf: bool = False):
+        """Latch and return the root, write-latched if write is set or write_leaf is set and it is a leaf."""
+        self.descents += 1  # Approximate: concurrent increments may be lost
+        while True:
+            node = self.root
+            exclusive = write or (write_leaf and node.is_leaf)
+            if exclusive:
+                node.latch.acquire_write()
+            else:
+                node.latch.acquire_read()
+            if node is self.root:
+                return node
+            # The root was split or collapsed while we waited
+            if exclusive:
+                node.latch.release_write()
+            else:
+                node.latch.release_read()
+
+    def _read_leaf(self, key, before: bool = False):
+        """Crab down with shared latches to the leaf for key and return (leaf, low, high).
+
+        The leaf stays read-latched. [low, high) are its routing bounds (None =
+        unbounded). With before=True the descent goes to the leaf holding the
+        largest keys below key; key=None means the leftmost leaf, or the
+        rightmost with before=True.
+        """
+        node = self._latch_root()
+        low = high = None
+        while not node.is_leaf:
+            if key is None:
+                i = len(node.keys) if before else 0
+            else:
+                i = (bisect_left if before else bisect_right)(node.keys, key)
+            if i > 0:
+                low = node.keys[i - 1]
+            if i < len(node.keys):
+                high = node.keys[i]
+            child = node.children[i]
+            child.latch.acquire_read()
+            node.latch.release_read()
+            node = child
+        return node, low, high
+
+    def _leaf_snapshot(self, key, before: bool = False) -> Tuple[List, List, Any, Any]:
+        """Copy the keys and values of a leaf found as in _read_leaf, with its bounds."""
+        leaf, low, high = self._read_leaf(key, before)
+        try:
+            return list(leaf.keys), list(leaf.values), low, high
+        finally:
+            leaf.latch.release_read()
+
+    def _write_leaf(self, key) -> LeafNode:
+        """Crab down with shared latches and return the leaf for key, write-latched."""
+        node = self._latch_root(write_leaf=True)
+        while not node.is_leaf:
+            child = node.children[bisect_right(node.keys, key)]
+            if child.is_leaf:
+                child.latch.acquire_write()
+            else:
+                child.latch.acquire_read()
+            node.latch.release_read()
+            node = child
+        return node
+
+    # Reads
+
+    def search(self, key) -> bool:
+        leaf, _, _ = self._read_leaf(key)
+        try:
+            i = bisect_left(leaf.keys, key)
+            return i < len(leaf.keys) and leaf.keys[i] == key
+        finally:
+            leaf.latch.release_read()
+
+    def get(self, key) -> Optional[object]:
+        leaf, _, _ = self._read_leaf(key)
+        try:
+            i = bisect_left(leaf.keys, key)
+            return leaf.values[i] if i < len(leaf.keys) and leaf.keys[i] == key else None
+        finally:
+            leaf.latch.release_read()
+
+    def get_many(self, keys, default=None) -> List[Optional[object]]:
+        """Get the values for many keys (default where missing), in the order given.
+
+        Keys are visited in sorted order. Each leaf is reached by one descent
+        and stays read-latched while it answers every key below its upper
+        routing bound, so a sorted batch reads each leaf once.
+        """
+        keys = list(keys)
+        results = [default] * len(keys)
+        leaf = high = None
+        try:
+            for i in sorted(range(len(keys)), key=keys.__getitem__):
+                key = keys[i]
+                if leaf is None or (high is not None and key >= high):
+                    if leaf is not None:
+                        leaf.latch.release_read()
+                        leaf = None
+                    leaf, _, high = self._read_leaf(key)
+                j = bisect_left(leaf.keys, key)
+                if j < len(leaf.keys) and leaf.keys[j] == key:
+                    results[i] = leaf.values[j]
+        finally:
+            if leaf is not None:
+                leaf.latch.release_read()
+        return results
+
+    def cursor(self, reverse: bool = False) -> SeekingCursor:
+        return SeekingCursor(self, reverse)
+
+    def estimated_count(self) -> int:
+        # Crab down the middle path with shared latches, as _read_leaf does
+        estimate = 1
+        node = self._latch_root()
+        while not node.is_leaf:
+            estimate *= len(node.children)
+            child = node.children[len(node.children) // 2]
+            child.latch.acquire_read()
+            node.latch.release_read()
+            node = child
+        try:
+            return estimate * len(node.keys)
+        finally:
+            node.latch.release_read()
+
+    def range_query(self, start_key, end_key) -> List[Tuple]:
+        return list(self.iter_range(start_key, end_key))
+
+    def get_all(self) -> List[Tuple]:
+        return list(self.iter_range())
+
+    # Writes
+
+    def insert(self, key, value=None) -> WriteStatus:
+        return self._insert(key, value, replace=True)
+
+    def insert_if_absent(self, key, value=None) -> WriteStatus:
+        return self._insert(key, value, replace=False)
+
+    def _begin_write(self) -> None:
+        with self.snapshot_gate:
+            self.snapshot_latch.acquire_read()
+
+    def _insert(self, key, value, replace: bool) -> WriteStatus:
+        """Insert key, or replace its value if replace is set."""
+        self._begin_write()
+        try:
+            if self._pinned < 0:
+                leaf = self._write_leaf(key)
+                try:
+                    i = bisect_left(leaf.keys, key)
+                    if i < len(leaf.keys) and leaf.keys[i] == key:
+                        if not replace:
+                            return WriteStatus.EXISTS
+                        leaf.values[i] = value
+                        return WriteStatus.REPLACED
+                    if len(leaf.keys) < self.max_keys:
+                        leaf.keys.insert(i, key)
+                        leaf.values.insert(i, value)
+                        return WriteStatus.INSERTED
+                finally:
+                    leaf.latch.release_write()
+            return self._insert_splitting(key, value, replace)
+        finally:
+            self.snapshot_latch.release_read()
+
+    def _insert_splitting(self, key, value, replace: bool) -> WriteStatus:
+        """Insert with write latches, splitting full nodes on the way down.
+
+        Because full nodes are split before we enter them, each step holds only a
+        node and its child.
+        """
+        self._latch_root(write=True)
+        node = self._own_root()
+        if len(node.keys) == self.max_keys:
+            new_root = self._new_node(self.internal_type)
+            new_root.latch.acquire_write()
+            new_root.children.append(node)
+            self._split_child(new_root, 0)
+            self.root = new_root
+            node.latch.release_write()
+            node = new_root
+
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            node.children[idx].latch.acquire_write()
+            child = self._own_child(node, idx)
+            if len(child.keys) == self.max_keys:
+                self._split_child(node, idx)
+                if key >= node.keys[idx]:
+                    sibling = node.children[idx + 1]
+                    sibling.latch.acquire_write()
+                    child.latch.release_write()
+                    child = sibling
+            node.latch.release_write()
+            node = child
+
+        try:
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                if not replace:
+                    return WriteStatus.EXISTS
+                node.values[i] = value
+                return WriteStatus.REPLACED
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+            return WriteStatus.INSERTED
+        finally:
+            node.latch.release_write()
+
+    def insert_many(self, pairs) -> int:
+        batch = dict(pairs)
+        return sum(self._insert(key, batch[key], True) is WriteStatus.INSERTED for key in sorted(batch))
+
+    def _write_leaf_owned(self, key) -> LeafNode:
+        """Crab down with write latches, copying nodes a snapshot can see; returns the write-latched leaf."""
+        self._latch_root(write=True)
+        node = self._own_root()
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            node.children[idx].latch.acquire_write()
+            child = self._own_child(node, idx)
+            node.latch.release_write()
+            node = child
+        return node
+
+    def modify(self, key, func: Callable[[Any], Any]) -> WriteStatus:
+        """Like BPlusTree.modify; func runs with the leaf write-latched, so it must not use this tree."""
+        self._begin_write()
+        leaf = self._write_leaf(key) if self._pinned < 0 else self._write_leaf_owned(key)
+        try:
+            i = bisect_left(leaf.keys, key)
+            if i < len(leaf.keys) and leaf.keys[i] == key:
+                leaf.values[i] = func(leaf.values[i])
+                return WriteStatus.REPLACED
+            return WriteStatus.NOT_FOUND
+        finally:
+            leaf.latch.release_write()
+            self.snapshot_latch.release_read()
+
+    def _pop(self, key):
+        self._begin_write()
+        try:
+            if self._pinned < 0:
+                leaf = self._write_leaf(key)
+                try:
+                    i = bisect_left(leaf.keys, key)
+                    if i == len(leaf.keys) or leaf.keys[i] != key:
+                        return _MISSING
+                    if len(leaf.keys) > self.min_keys or leaf is self.root or self._defer(leaf, key):
+                        leaf.keys.pop(i)
+                        return leaf.values.pop(i)
+                finally:
+                    leaf.latch.release_write()
+            return self._delete_rebalancing(key)
+        finally:
+            self.snapshot_latch.release_read()
+
+    def _delete_rebalancing(self, key):
+        """Delete with write latches, then repair underflows bottom-up; returns the value or _MISSING.
+
+        Ancestors are released as soon as a child has a key to spare, since
+        nothing below can then propagate a merge past it.
+        """
+        self._latch_root(write=True)
+        node = self._own_root()
+        held = [node]  # Write-latched nodes that a merge may still reach
+        try:
+            while not node.is_leaf:
+                idx = bisect_right(node.keys, key)
+                node.children[idx].latch.acquire_write()
+                child = self._own_child(node, idx)
+                if len(child.keys) > self.min_keys:
+                    for ancestor in held:
+                        ancestor.latch.release_write()
+                    held = []
+                held.append(child)
+                node = child
+
+            i = bisect_left(node.keys, key)
+            value = _MISSING
+            if i < len(node.keys) and node.keys[i] == key:
+                node.keys.pop(i)
+                value = node.values.pop(i)
+
+            # Repair from the bottom; each step releases the child it fixed
+            while len(held) > 1:
+                child = held.pop()
+                parent = held[-1]
+                idx = bisect_right(parent.keys, key)
+                if len(child.keys) < self.min_keys and not self._defer(child, key):
+                    self._fill_child_latched(parent, idx)
+                else:
+                    child.latch.release_write()
+            # An emptied root is replaced by _merge while its write latch is held
+            return value
+        finally:
+            for node in held:
+                node.latch.release_write()
+
+    def _fill_child_latched(self, parent, idx: int) -> None:
+        """_fill_child with the siblings latched; releases the child and siblings afterwards."""
+        child = parent.children[idx]
+        first, last = max(idx - 1, 0), min(idx + 2, len(parent.children))
+        # Latch left to right like everyone else; the parent's write latch keeps
+        # other writers away from the child while it is briefly released.
+        child.latch.release_write()
+        for node in parent.children[first:last]:
+            node.latch.acquire_write()
+        siblings = [self._own_child(parent, i) for i in range(first, last)]
+        try:
+            self._fill_child(parent, idx)
+        finally:
+            for node in siblings:
+                node.latch.release_write()
+
+    def delete_many(self, keys) -> int:
+        return sum(1 for key in sorted(set(keys)) if self.delete(key))
+
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        """Like BPlusTree.delete_range, applied to a copy of the changed nodes and swapped in at the end.
+
+        Writers are held off through snapshot_latch, as for snapshot(). Every
+        node the delete changes is copied first, so readers already inside the
+        tree finish on the old version, and the old root stays write-latched
+        until the new one replaces it, so new readers wait for the result.
+        """
+        with self._detached_write():
+            return super().delete_range(start_key, end_key)
+
+    def compact(self, limit: Optional[int] = None) -> int:
+        """Like BPlusTree.compact, on a copy of the changed nodes swapped in at the end as for delete_range."""
+        if not self._sparse:
+            return 0
+        with self._detached_write():
+            return super().compact(limit)
+
+    @contextmanager
+    def _detached_write(self):
+        """Hold writers off and copy every node changed, leaving the old tree to the readers inside it."""
+        with self.snapshot_gate:
+            self.snapshot_latch.acquire_write()
+        try:
+            root = self._latch_root(write=True)
+            with self._pin_lock:
+                self._detached_pin = self._pinned = self.epoch
+                self.epoch += 1
+                self._detached = True
+            try:
+                yield
+            finally:
+                with self._pin_lock:
+                    self._detached = False
+                    self._detached_pin = -1
+                    # Snapshots may have been collected meanwhile, so recompute rather than restore
+                    self._unpin()
+                root.latch.release_write()
+        finally:
+            self.snapshot_latch.release_write()
@@ -1,87 +1,496 @@
 # db_manager.py
+import multiprocessing
 import os
-from typing import Dict, Optional, List
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Optional, List, Tuple
 from table import Table
+from pager import BUFFER_POOL_SIZE
+from partitioned import PartitionedTable
+from query import Join
+from wal import WriteAheadLog
+
+TABLE_EXTENSIONS = {'memory': '.tbl', 'paged': '.pages', 'frozen': '.frozen', 'partitioned': '.parts'}
+LEGACY_EXTENSION = '.pkl'  # pickled in-memory tables, rewritten as .tbl files on load
+CHECKPOINT_SIZE = 16 * 1024 * 1024  # log bytes that trigger a checkpoint on commit
+COMPACT_THRESHOLD = 1024  # underfull leaves that make commit compact a table
+QUARANTINE_LOG = 'quarantine.log'  # log records of tables whose replay failed, kept for inspection
+# Tables and snapshots for forked persist workers, set before the workers are forked
+_forked: Dict[int, Tuple[Table, Any]] = {}
+
+def _write_forked(key: int) -> Tuple[int, float]:
+    """Run in a forked worker: write a table file from the snapshot its parent took."""
+    table, (_, lsn, snapshot, _) = _forked[key]
+    start = time.perf_counter()
+    written = table.write_snapshot(snapshot, lsn)
+    return written, time.perf_counter() - start
+
+class ReplayError(RuntimeError):
+    """Raised by Database.load when write-ahead log records could not be replayed.
+
+    failures maps each affected table to the (record, error) that failed.
+    Those tables are left out of Database.tables and their records from the
+    failure on are appended to the quarantine log; the other tables load.
+    """
+
+    def __init__(self, failures: Dict[str, Tuple[Any, Exception]], quarantine: str):
+        self.failures = failures
+        self.quarantine = quarantine
+        details = '; '.join(f"{name}: {record[0]} failed with {error!r}"
+                            for name, (record, error) in failures.items())
+        super().__init__(f"Could not replay the log for {len(failures)} table(s), "
+                         f"quarantined in {quarantine}: {details}")
 
 class Database:
-    def __init__(self, name: str):
+    def __init__(self, name: str, buffer_pool_size: int = BUFFER_POOL_SIZE,
+                 sync_policy: str = 'always', group_commit_delay: float = 0.0,
+                 checkpoint_size: int = CHECKPOINT_SIZE, concurrent: bool = False, compress: bool = False,
+                 workers: int = 1, processes: bool = False, relaxed_deletes: bool = False,
+                 compact_threshold: int = COMPACT_THRESHOLD, write_buffer: int = 0):
         self.name = name
         self.tables: Dict[str, Table] = {}
         self.db_dir = f"{name}_db"
+        self.buffer_pool_size = buffer_pool_size  # Per paged table
+        self.checkpoint_size = checkpoint_size
+        self.concurrent = concurrent  # Tables accept reads and writes from many threads
+        self.compress = compress  # zlib-compress in-memory table files
+        # Deletes may leave leaves underfull; commit compacts a table once it
+        # has compact_threshold of them (see Table.compact)
+        self.relaxed_deletes = relaxed_deletes
+        self.compact_threshold = compact_threshold
+        # In-memory tables buffer this many writes in a memtable (0: off)
+        if concurrent and write_buffer:
+            raise ValueError("A database cannot combine concurrent and write_buffer")
+        self.write_buffer = write_buffer
+        # Tables loaded or persisted at once; with processes, persist encodes
+        # in-memory tables in forked worker processes rather than threads
+        self.workers = workers
+        self.processes = processes
+        self._checkpoint_lock = threading.Lock()
+        # Counters from the most recent load and persist, plus a running byte total
+        self.load_stats = {'tables_loaded': 0, 'seconds': 0.0, 'table_seconds': {}}
+        self.persist_stats = {'tables_written': 0, 'tables_skipped': 0, 'bytes_written': 0, 'table_seconds': {}}
+        self.bytes_written = 0
         
         # Create database directory if it doesn't exist
         os.makedirs(self.db_dir, exist_ok=True)
+        self.wal = WriteAheadLog(os.path.join(self.db_dir, 'wal.log'), sync_policy, group_commit_delay)
     
-    def create_table(self, name: str, columns: Dict[str, type], primary_key: str) -> bool:
-        """Create a new table in the database."""
+    def create_table(self, name: str, columns: Dict[str, type], primary_key: str,
+                     storage: str = 'memory', partitions: Optional[Dict[str, Any]] = None) -> bool:
+        """Create a new table in the database. storage='paged' keeps it in a page file.
+
+        partitions splits the table on its primary key, e.g. {'by': 'hash', 'count': 4}
+        or {'by': 'range', 'bounds': [1000, 2000]}; see PartitionedTable.
+        """
+        if storage in ('frozen', 'partitioned'):
+            raise ValueError(f"Storage type '{storage}' cannot be chosen when creating a table")
         if name in self.tables:
             return False
         
-        self.tables[name] = Table(name, columns, primary_key)
+        self._add_table(name, columns, primary_key, storage, partitions)
+        self.tables[name].wal = self.wal
+        self.wal.append('create_table', name, columns, primary_key, storage, partitions)
         return True
+
+    def _add_table(self, name: str, columns: Dict[str, type], primary_key: str, storage: str,
+                   partitions: Optional[Dict[str, Any]] = None) -> None:
+        if partitions is not None:
+            self.tables[name] = PartitionedTable(name, columns, primary_key, partitions, storage=storage,
+                                                 buffer_pool_size=self.buffer_pool_size,
+                                                 directory=self._table_file(name, 'partitioned'),
+                                                 concurrent=self.concurrent, compress=self.compress,
+                                                 workers=self.workers, relaxed_deletes=self.relaxed_deletes,
+                                                 write_buffer=self.write_buffer)
+            return
+        self.tables[name] = Table(name, columns, primary_key, storage=storage,
+                                  buffer_pool_size=self.buffer_pool_size,
+                                  page_file=self._table_file(name, storage), concurrent=self.concurrent,
+                                  compress=self.compress, relaxed_deletes=self.relaxed_deletes,
+                                  write_buffer=self.write_buffer)
+
+    def freeze_table(self, name: str) -> bool:
+        """Replace a table with a read-only copy that later loads open in constant time via mmap.
+
+        The database is checkpointed first, so the log holds no writes to the
+        table. Returns False if there is no such table.
+        """
+        table = self.tables.get(name)
+        if table is None:
+            return False
+        if table.storage == 'frozen':
+            return True
+        if table.storage == 'partitioned':
+            raise ValueError("Partitioned tables cannot be frozen")
+        with self._checkpoint_lock:
+            self._checkpoint()
+            path = self._table_file(name, 'frozen')
+            table.freeze(path)
+            frozen = Table(name, {}, '', storage='frozen', page_file=path)
+            frozen.load()
+            frozen.wal = self.wal
+            table.close()
+            os.remove(self._table_file(name, table.storage))
+            self.tables[name] = frozen
+        return True
+
+    def _table_file(self, name: str, storage: str) -> str:
+        return os.path.join(self.db_dir, f"{name}{TABLE_EXTENSIONS[storage]}")
     
     def delete_table(self, name: str) -> bool:
         """Delete a table from the database."""
         if name not in self.tables:
             return False
         
+        self._drop_table(name)
+        self.wal.append('drop_table', name)
+        return True
+
+    def _drop_table(self, name: str) -> None:
         # Remove the table file if it exists
-        table_file = os.path.join(self.db_dir, f"{name}.pkl")
-        if os.path.exists(table_file):
-            os.remove(table_file)
+        self.tables[name].close()
+        for storage in TABLE_EXTENSIONS:
+            table_file = self._table_file(name, storage)
+            if os.path.isdir(table_file):
+                shutil.rmtree(table_file)
+            elif os.path.exists(table_file):
+                os.remove(table_file)
         
         del self.tables[name]
-        return True
     
     def get_table(self, name: str) -> Optional[Table]:
         """Get a table by name."""
         return self.tables.get(name)
     
+    def join(self, left: str, right: str, left_on: Optional[str] = None, right_on: Optional[str] = None,
+             **options) -> Join:
+        """Plan an inner join of two tables by name; options are Join's columns, where and limit.
+
+        Iterate the result's records() to stream the joined records.
+        """
+        tables = []
+        for name in (left, right):
+            table = self.tables.get(name)
+            if table is None:
+                raise ValueError(f"Table '{name}' not found")
+            tables.append(table)
+        return Join(tables[0], tables[1], left_on, right_on, **options)
+
     def list_tables(self) -> List[str]:
         """List all tables in the database."""
         return list(self.tables.keys())
     
-    def persist(self) -> None:
-        """Persist all tables to disk."""
+    def commit(self) -> None:
+        """Make this thread's logged writes durable, checkpointing once the log grows large.
+
+        With relaxed deletes, tables past compact_threshold are compacted too.
+        """
+        self.wal.commit()
+        if self.relaxed_deletes:
+            self.compact()
+        if self.wal.size >= self.checkpoint_size and self._checkpoint_lock.acquire(blocking=False):
+            try:
+                self._checkpoint()
+            finally:
+                self._checkpoint_lock.release()
+
+    def compact(self, threshold: Optional[int] = None) -> Dict[str, int]:
+        """Compact the tables with at least threshold underfull leaves (default compact_threshold).
+
+        Returns the number of leaves repaired in each table compacted.
+        """
+        if threshold is None:
+            threshold = self.compact_threshold
+        return {name: table.compact() for name, table in list(self.tables.items())
+                if table.sparse_leaves and table.sparse_leaves >= threshold}
+
+    def persist(self, progress: Optional[Callable[[str, float], None]] = None) -> None:
+        """Persist all tables to disk (a checkpoint) and truncate the write-ahead log.
+
+        progress, if given, is called with each written table's name and
+        seconds as it finishes.
+        """
+        with self._checkpoint_lock:
+            self._checkpoint(progress)
+
+    def _each_table(self, func: Callable[[str, Table], Any], tables: List[Tuple[str, Table]],
+                    progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Tuple[Any, float]]:
+        """Call func(name, table) for each table and return {name: (result, seconds)}.
+
+        Up to self.workers tables are handled at once on a thread pool. File
+        reads and writes, fsync, zlib and CRCs release the GIL, so one
+        table's I/O overlaps another's decoding. progress is called in this
+        thread as each table finishes; the first error is raised once the
+        others are done.
+        """
+        def timed(name: str, table: Table) -> Tuple[Any, float]:
+            start = time.perf_counter()
+            result = func(name, table)
+            return result, time.perf_counter() - start
+
+        results = {}
+        if self.workers <= 1 or len(tables) <= 1:
+            for name, table in tables:
+                results[name] = timed(name, table)
+                if progress is not None:
+                    progress(name, results[name][1])
+            return results
+        with ThreadPoolExecutor(min(self.workers, len(tables))) as pool:
+            futures = {pool.submit(timed, name, table): name for name, table in tables}
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                if progress is not None:
+                    progress(name, results[name][1])
+        return results
+
+    def _persist_forked(self, tables: List[Tuple[str, Table]],
+                        progress: Optional[Callable[[str, float], None]]) -> Dict[str, Tuple[int, float]]:
+        """Write in-memory tables from forked worker processes, so their rows are encoded in parallel.
+
+        Each table is captured (Table._capture) here before the workers fork, so
+        a worker writes a consistent state even if a write was half done at the fork.
+        Workers read their copy-on-write view of this process's memory, so no
+        rows are sent to them.
+        """
+        results = {}
+        keys = {name: id(table) for name, table in tables}
+        try:
+            for name, table in tables:
+                _forked[keys[name]] = (table, table._capture())
+            with ProcessPoolExecutor(min(self.workers, len(tables)),
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = {pool.submit(_write_forked, keys[name]): (name, table) for name, table in tables}
+                for future in as_completed(futures):
+                    name, table = futures[future]
+                    results[name] = written, seconds = future.result()
+                    table._persisted(_forked[keys[name]][1], written)
+                    if progress is not None:
+                        progress(name, seconds)
+        finally:
+            for key in keys.values():
+                if key in _forked:
+                    _forked.pop(key)[1][2].close()
+        return results
+
+    def _checkpoint(self, progress: Optional[Callable[[str, float], None]] = None) -> None:
         # First ensure the database directory exists
         os.makedirs(self.db_dir, exist_ok=True)
+
+        # Writes logged after the rotation stay in the new log, so the old one
+        # can go as soon as every table has been saved. Tables are saved while
+        # writes go on, and each file records the LSN it is current to, so
+        # replay skips what a file already holds.
+        retired = self.wal.rotate()
         
-        # Save each table
-        for table_name, table in self.tables.items():
-            table.serialized_file = os.path.join(self.db_dir, f"{table_name}.pkl")
-            table.persist()
+        # Save each table that changed since it was last saved
+        tables = []
+        skipped = 0
+        for table_name, table in list(self.tables.items()):
+            table_file = self._table_file(table_name, table.storage)
+            if not table.dirty and table.serialized_file == table_file and os.path.exists(table_file):
+                skipped += 1
+                continue
+            table.serialized_file = table_file
+            tables.append((table_name, table))
+        forked = []
+        if self.processes and self.workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            forked = [(name, table) for name, table in tables if table.storage == 'memory']
+            tables = [(name, table) for name, table in tables if table.storage != 'memory']
+        results = self._each_table(lambda name, table: table.persist(), tables, progress)
+        if forked:
+            results.update(self._persist_forked(forked, progress))
+        os.remove(retired)
+
+        stats = {'tables_written': len(results), 'tables_skipped': skipped,
+                 'bytes_written': sum(written for written, _ in results.values()),
+                 'table_seconds': {name: seconds for name, (_, seconds) in results.items()}}
+        self.persist_stats = stats
+        self.bytes_written += stats['bytes_written']
+
+    def load(self, lazy: bool = True, warm: bool = False,
+             progress: Optional[Callable[[str, float], None]] = None) -> bool:
+        """Load all tables from disk, up to self.workers at a time.
 
-    def load(self) -> bool:
-        """Load all tables from disk."""
+        With lazy=True only each table's schema is read here and its rows are
+        loaded on first access; warm=True also starts loading them in the
+        background. progress, if given, is called with each table's name and
+        seconds as it finishes loading.
+
+        Returns False if the table files could not be read. Raises ReplayError,
+        once the other tables are loaded, if log records for some tables could
+        not be replayed.
+        """
         try:
+            start = time.perf_counter()
             # Clear existing tables
+            for table in self.tables.values():
+                table.close()
             self.tables.clear()
             
-            # Get all .pkl files in the db directory
+            # Get all table files in the db directory
             if not os.path.exists(self.db_dir):
                 return False
                 
-            table_files = [f for f in os.listdir(self.db_dir) if f.endswith('.pkl')]
-            
+            storage_types = {ext: storage for storage, ext in TABLE_EXTENSIONS.items()}
+            storage_types[LEGACY_EXTENSION] = 'memory'
+            table_files = [f for f in os.listdir(self.db_dir) if os.path.splitext(f)[1] in storage_types]
+
+            tables = []
+            legacy_tables = set()
             for table_file in table_files:
-                table_name = table_file[:-4]  # Remove .pkl extension
-                # Create temp table with proper file path
-                temp_table = Table(table_name, {}, '')
-                temp_table.serialized_file = os.path.join(self.db_dir, table_file)
-                
-                if temp_table.load():
-                    # Create a new table with the loaded schema
-                    self.tables[table_name] = Table(
-                        name=temp_table.name,
-                        columns=temp_table.columns,
-                        primary_key=temp_table.primary_key
-                    )
-                    # Set the correct serialized file path
-                    self.tables[table_name].serialized_file = os.path.join(self.db_dir, table_file)
-                    # Copy the loaded index
-                    self.tables[table_name].index = temp_table.index
-            
-            return True
+                table_name, ext = os.path.splitext(table_file)
+                legacy = ext == LEGACY_EXTENSION
+                if legacy and os.path.exists(self._table_file(table_name, 'memory')):
+                    continue  # Already migrated; the .tbl file is newer
+                if storage_types[ext] != 'frozen' and os.path.exists(self._table_file(table_name, 'frozen')):
+                    continue  # Left by a freeze_table() interrupted before it removed the old file
+                # Load straight into the table that will be served
+                if storage_types[ext] == 'partitioned':
+                    table = PartitionedTable(table_name, {}, '', buffer_pool_size=self.buffer_pool_size,
+                                             directory=os.path.join(self.db_dir, table_file),
+                                             concurrent=self.concurrent, compress=self.compress,
+                                             workers=self.workers, relaxed_deletes=self.relaxed_deletes,
+                                             write_buffer=self.write_buffer)
+                else:
+                    table = Table(table_name, {}, '', storage=storage_types[ext],
+                                  buffer_pool_size=self.buffer_pool_size,
+                                  page_file=os.path.join(self.db_dir, table_file), concurrent=self.concurrent,
+                                  compress=self.compress, relaxed_deletes=self.relaxed_deletes,
+                                  write_buffer=self.write_buffer)
+                table.serialized_file = os.path.join(self.db_dir, table_file)
+                tables.append((table_name, table))
+                if legacy:
+                    legacy_tables.add(table_name)
+
+            def load_table(name: str, table: Table) -> bool:
+                legacy = name in legacy_tables
+                if not table.load(lazy=lazy and not legacy):
+                    return False
+                if legacy:
+                    self._migrate(table)
+                return True
+
+            # Decoding rows holds the GIL, so threads mostly overlap file reads
+            # with it; rows decoded in other processes would cost more to send back
+            results = self._each_table(load_table, tables, progress)
+            for name, table in tables:
+                if results[name][0]:
+                    self.tables[name] = table
+            # Number new log records after every LSN a table file holds
+            saved = [table.checkpoint_lsn for _, table in tables]
+            saved += [partition.checkpoint_lsn for _, table in tables if isinstance(table, PartitionedTable)
+                      for partition in table.partitions]
+            self.wal.advance(max(saved, default=0))
+            self.load_stats = {'tables_loaded': len(self.tables), 'seconds': time.perf_counter() - start,
+                               'table_seconds': {name: seconds for name, (_, seconds) in results.items()}}
         except Exception as e:
             print(f"Error loading database: {e}")
-            return False
\ No newline at end of file
+            return False
+
+        failures = self._replay_logs()
+        for table in self.tables.values():
+            table.wal = self.wal
+        if warm:
+            threading.Thread(target=self._warm, daemon=True).start()
+        if failures:
+            raise ReplayError(failures, os.path.join(self.db_dir, QUARANTINE_LOG))
+        return True
+
+    def _replay_logs(self) -> Dict[str, Tuple[Any, Exception]]:
+        """Redo writes made since the last checkpoint, including one that was interrupted.
+
+        A table's file records the LSN of the last write it holds, and the
+        table's records up to that LSN are skipped: a checkpoint saves tables
+        while writes continue into the new log, and an interrupted one may
+        have saved some tables already.
+
+        Records are applied one at a time. When one fails, its table is
+        quarantined: it is dropped from self.tables, and that record and the
+        table's later ones are skipped and appended to the quarantine log.
+        Returns {table: (record, error)} for the first failure of each table.
+        """
+        failures = {}
+        quarantined = []
+        for log in (self.wal.path + '.ckpt', self.wal.path):
+            for lsn, record in WriteAheadLog.read_entries(log):
+                name = record[1]
+                table = self.tables.get(name)
+                if lsn is not None and table is not None and lsn <= table.checkpoint_lsn:
+                    continue  # Already in the table's file
+                if name not in failures:
+                    try:
+                        self._replay(record, lsn)
+                        continue
+                    except Exception as e:
+                        failures[name] = (record, e)
+                quarantined.append(record)
+        if not failures:
+            return failures
+        quarantine = WriteAheadLog(os.path.join(self.db_dir, QUARANTINE_LOG))
+        for record in quarantined:
+            quarantine.append(*record)
+        quarantine.commit()
+        quarantine.close()
+        for name in failures:
+            table = self.tables.pop(name, None)
+            if table is not None:
+                table.close()
+        return failures
+
+    def _migrate(self, table: Table) -> None:
+        """Rewrite a table loaded from a pickle file in the binary format and remove the pickle."""
+        pickle_file = table.serialized_file
+        table.serialized_file = self._table_file(table.name, 'memory')
+        table.persist()
+        os.remove(pickle_file)
+
+    def _warm(self) -> None:
+        """Materialize lazily loaded tables in the background."""
+        for table in list(self.tables.values()):
+            try:
+                table.materialize()
+            except Exception as e:
+                print(f"Error warming table {table.name}: {e}")
+
+    def _replay(self, record, lsn: Optional[int] = None) -> None:
+        """Apply one write-ahead log record, whose LSN is lsn, without logging it again."""
+        op, table_name, *args = record
+        if op == 'checkpoint':
+            return  # Marks where a log starts; see WriteAheadLog.rotate
+        if op == 'create_table':
+            if table_name not in self.tables:
+                self._add_table(table_name, *args)
+            return
+        if op == 'drop_table':
+            if table_name in self.tables:
+                self._drop_table(table_name)
+            return
+
+        table = self.tables.get(table_name)
+        if table is None:
+            return
+        if isinstance(table, PartitionedTable):
+            table.replay(lsn, op, args)  # Skips the partitions already holding it
+        elif op == 'insert':
+            table.insert(*args)
+        elif op == 'upsert':
+            table.upsert(*args)
+        elif op == 'update':
+            table.update(*args)
+        elif op == 'delete':
+            table.delete(*args)
+        elif op == 'insert_many':
+            table.insert_many(*args)
+        elif op == 'delete_many':
+            table.delete_many(*args)
+        elif op == 'delete_range':
+            table.delete_range(*args)
+        elif op == 'truncate':
+            table.truncate()
+        elif op == 'create_index':
+            table.create_index(*args)
+        elif op == 'create_aggregate':
+            table.create_aggregate(*args)
@@ -0,0 +1,207 @@
+# frozen.py
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from tablefile import TYPES, json_safe, tag_json, untag_json
+
+MAGIC = b'BPTS'
+VERSION = 2  # 2 added tagged rows
+FANOUT = 64  # keys per block under each fence key
+_HEADER = struct.Struct('<4sHcx7Q')  # magic, version, key code, count, section offsets, file size
+_ALIGN = 8
+
+def _key_code(keys: List) -> bytes:
+    if all(type(key) is int for key in keys):
+        if keys and not (-2 ** 63 <= keys[0] and keys[-1] < 2 ** 63):
+            raise ValueError("Frozen tables need int primary keys that fit in 8 bytes")
+        return b'q'
+    if all(type(key) is float for key in keys):
+        return b'd'
+    if all(type(key) is str for key in keys):
+        return b's'
+    raise ValueError("Frozen tables need int, float or str primary keys")
+
+def _pad(f: BinaryIO) -> int:
+    f.write(b'\0' * (-f.tell() % _ALIGN))
+    return f.tell()
+
+def _write_keys(f: BinaryIO, code: bytes, keys: List) -> int:
+    offset = _pad(f)
+    if code == b's':
+        data = [key.encode('utf-8', 'surrogatepass') for key in keys]
+        ends = array('Q', [0])
+        for item in data:
+            ends.append(ends[-1] + len(item))
+        f.write(ends.tobytes())
+        f.write(b''.join(data))
+    else:
+        f.write(array(code.decode(), keys).tobytes())
+    return offset
+
+def write_frozen(f: BinaryIO, schema: Dict[str, Any], pairs: Iterable[Tuple]) -> int:
+    """Write (key, row) pairs in key order and their schema as a frozen table file. Returns its size.
+
+    The file holds a header, the schema as JSON, the rows (one JSON array
+    each, or a tag_json() object for a row holding tuples or dicts with
+    non-str keys), the row offsets, the sorted keys and the fence keys (every
+    FANOUT-th key). Keys are int64 or float64 arrays, or for str keys an
+    offset array plus UTF-8 bytes. Rows are written as they come; only the
+    keys and row offsets are kept in memory until the end.
+    """
+    if sys.byteorder != 'little':
+        raise ValueError("Frozen table files are only supported on little-endian machines")
+    f.write(b'\0' * _HEADER.size)
+    payload = json.dumps(dict(schema, columns=[[name, column_type.__name__]
+                                               for name, column_type in schema['columns'].items()])).encode()
+    schema_offset = f.tell()
+    f.write(payload)
+
+    rows_offset = _pad(f)
+    keys = []
+    ends = array('Q', [0])
+    for key, row in pairs:
+        data = json.dumps(row if json_safe(row) else tag_json(row), separators=(',', ':')).encode()
+        f.write(data)
+        ends.append(ends[-1] + len(data))
+        keys.append(key)
+    ends_offset = _pad(f)
+    f.write(ends.tobytes())
+
+    code = _key_code(keys)
+    keys_offset = _write_keys(f, code, keys)
+    fence_offset = _write_keys(f, code, keys[::FANOUT])
+    size = f.tell()
+    f.seek(0)
+    f.write(_HEADER.pack(MAGIC, VERSION, code, len(keys), schema_offset, rows_offset, ends_offset,
+                         keys_offset, fence_offset, size))
+    f.seek(size)
+    return size
+
+class _StrKeys:
+    """Sequence view of str keys stored as an offset array plus UTF-8 bytes."""
+
+    def __init__(self, buf: memoryview, offset: int, count: int):
+        self.ends = buf[offset:offset + (count + 1) * 8].cast('Q')
+        start = offset + (count + 1) * 8
+        self.data = buf[start:start + self.ends[count]]
+
+    def __len__(self) -> int:
+        return len(self.ends) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.ends[i]:self.ends[i + 1]], 'utf-8', 'surrogatepass')
+
+    def release(self) -> None:
+        self.ends.release()
+        self.data.release()
+
+class FrozenIndex:
+    """Read-only index over a frozen table file, opened with mmap.
+
+    Opening reads the header and schema only, so it takes the same time
+    whatever the table size; keys are searched in place and rows decoded one
+    at a time as lookups and scans reach them. A lookup searches the small
+    fence array, which stays cached, then one block of FANOUT keys, so it
+    touches a few pages wherever the key falls. The file is mapped
+    read-only, so processes opening the same file share its pages in the OS
+    page cache. Offers the read side of the BPlusTree interface.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise ValueError("Frozen table files are only supported on little-endian machines")
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._buf = memoryview(self._mmap)
+        if len(buf) < _HEADER.size:
+            raise ValueError(f"{path} is not a frozen table file")
+        (magic, version, code, count, schema_offset, rows_offset, ends_offset,
+         keys_offset, fence_offset, size) = _HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a frozen table file")
+        if version > VERSION:
+            raise ValueError(f"Frozen table version {version} is newer than supported version {VERSION}")
+        if size != len(buf):
+            raise ValueError(f"{path} is truncated")
+        self.schema = json.loads(bytes(buf[schema_offset:rows_offset]).rstrip(b'\0'))
+        self.schema['columns'] = {name: TYPES[type_name] for name, type_name in self.schema['columns']}
+        self.count = count
+        self._rows = buf[rows_offset:ends_offset]
+        self._ends = buf[ends_offset:ends_offset + (count + 1) * 8].cast('Q')
+        fences = (count + FANOUT - 1) // FANOUT
+        if code == b's':
+            self._keys = _StrKeys(buf, keys_offset, count)
+            self._fence = _StrKeys(buf, fence_offset, fences)
+        else:
+            self._keys = buf[keys_offset:keys_offset + count * 8].cast(code.decode())
+            self._fence = buf[fence_offset:fence_offset + fences * 8].cast(code.decode())
+
+    def close(self) -> None:
+        if self._mmap.closed:
+            return
+        for view in (self._keys, self._fence):
+            view.release()
+        self._ends.release()
+        self._rows.release()
+        self._buf.release()
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _position(self, key, right: bool = False) -> int:
+        """Index of the first key >= key, or > key with right=True."""
+        search = bisect_right if right else bisect_left
+        # fence[i - 1] and fence[i] bound the block of FANOUT keys that holds the answer
+        i = search(self._fence, key)
+        return search(self._keys, key, max(0, (i - 1) * FANOUT), min(self.count, i * FANOUT))
+
+    def _row(self, i: int) -> Tuple:
+        row = json.loads(self._rows[self._ends[i]:self._ends[i + 1]].tobytes())
+        return tuple(row) if type(row) is list else untag_json(row)
+
+    def search(self, key) -> bool:
+        i = self._position(key)
+        return i < self.count and self._keys[i] == key
+
+    def get(self, key) -> Optional[Tuple]:
+        i = self._position(key)
+        if i < self.count and self._keys[i] == key:
+            return self._row(i)
+        return None
+
+    def get_many(self, keys, default=None) -> List[Optional[Tuple]]:
+        results = []
+        for key in keys:
+            i = self._position(key)
+            results.append(self._row(i) if i < self.count and self._keys[i] == key else default)
+        return results
+
+    def count_range(self, start_key=None, end_key=None) -> int:
+        """Number of keys with start_key <= key <= end_key; either bound may be None."""
+        low = 0 if start_key is None else self._position(start_key)
+        high = self.count if end_key is None else self._position(end_key, right=True)
+        return max(high - low, 0)
+
+    def estimated_count(self) -> int:
+        """Exact: the number of keys in the file."""
+        return self.count
+
+    def iter_range(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                   reverse: bool = False) -> Iterator[Tuple]:
+        """Lazily yield pairs with start_key <= key <= end_key, like BPlusTree.iter_range."""
+        low = 0 if start_key is None else self._position(start_key)
+        high = self.count if end_key is None else self._position(end_key, right=True)
+        positions = range(high - 1, low - 1, -1) if reverse else range(low, high)
+        if limit is not None:
+            positions = positions[:max(limit, 0)]
+        for i in positions:
+            yield self._keys[i], self._row(i)
+
+    def get_all(self) -> List[Tuple]:
+        return list(self.iter_range())
@@ -1,7 +1,9 @@
 # main.py
-from db_manager import Database
+from db_manager import Database, ReplayError
+from query import Query, parse_query
 from table import Table
 import cmd
+import re
 import sys
 
 class DBShell(cmd.Cmd):
@@ -11,17 +13,25 @@ class DBShell(cmd.Cmd):
     def __init__(self, db_name):
         super().__init__()
         self.db = Database(db_name)
-        self.db.load()
+        try:
+            self.db.load()
+        except ReplayError as e:
+            print(f"Warning: {e}")  # The other tables are loaded and usable
         self.current_table = None
     
     def do_create_table(self, arg):
         """
-        Create a new table: create_table <name> <col1:type1,col2:type2,...> <primary_key>
+        Create a new table:
+          create_table <name> <col1:type1,col2:type2,...> <primary_key> [memory|paged] [hash:<count>|range:<b1>,<b2>,...]
         Example: create_table users id:int,name:str,age:int id
+        A paged table keeps its index in a page file instead of in memory. A
+        partitioned table splits its rows by primary key hash or range, e.g.
+        create_table events id:int,kind:str id memory range:1000,2000
         """
         args = arg.split()
-        if len(args) != 3:
-            print("Usage: create_table <name> <col1:type1,col2:type2,...> <primary_key>")
+        if len(args) not in (3, 4, 5):
+            print("Usage: create_table <name> <col1:type1,col2:type2,...> <primary_key> [memory|paged] "
+                  "[hash:<count>|range:<b1>,<b2>,...]")
             return
         
         name = args[0]
@@ -40,8 +50,32 @@ class DBShell(cmd.Cmd):
             columns[col_name] = col_type
         
         primary_key = args[2]
+        storage = args[3] if len(args) >= 4 else 'memory'
+        if storage not in ('memory', 'paged'):
+            print(f"Unsupported storage: {storage}")
+            return
+        partitions = None
+        if len(args) == 5:
+            by, _, spec = args[4].partition(':')
+            try:
+                if by == 'hash':
+                    partitions = {'by': 'hash', 'count': int(spec)}
+                elif by == 'range':
+                    partitions = {'by': 'range', 'bounds': [columns[primary_key](bound) for bound in spec.split(',')]}
+                else:
+                    print(f"Unsupported partitioning: {by}")
+                    return
+            except (KeyError, ValueError):
+                print(f"Invalid partitioning: {args[4]}")
+                return
         
-        if self.db.create_table(name, columns, primary_key):
+        try:
+            created = self.db.create_table(name, columns, primary_key, storage=storage, partitions=partitions)
+        except ValueError as e:
+            print(e)
+            return
+        if created:
+            self.db.commit()
             print(f"Table '{name}' created successfully.")
         else:
             print(f"Table '{name}' already exists.")
@@ -70,6 +104,39 @@ class DBShell(cmd.Cmd):
             print("No table selected. Use 'use <table_name>' first.")
             return
         
+        record = self._parse_record(arg)
+        if record is None:
+            return
+        
+        if self.current_table.insert(record):
+            self.db.commit()
+            print("Record inserted successfully.")
+        else:
+            print("Failed to insert record (duplicate primary key?).")
+
+    def do_upsert(self, arg):
+        """
+        Insert a record, or replace the one with its primary key: upsert <col1=val1,col2=val2,...>
+        Example: upsert id=1,name="John Doe",age=31
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+
+        record = self._parse_record(arg)
+        if record is None:
+            return
+
+        try:
+            status = self.current_table.upsert(record)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        self.db.commit()
+        print(f"Record {status.name.lower()}.")
+
+    def _parse_record(self, arg):
+        """Parse <col1=val1,col2=val2,...> into a record typed by the current table; None if invalid."""
         record = {}
         for pair in arg.split(','):
             key, value = pair.split('=')
@@ -83,20 +150,17 @@ class DBShell(cmd.Cmd):
                     record[key] = value.strip('"\'')
             except ValueError:
                 print(f"Invalid value for column {key}. Expected {col_type.__name__}.")
-                return
-        
-        if self.current_table.insert(record):
-            print("Record inserted successfully.")
-        else:
-            print("Failed to insert record (duplicate primary key?).")
+                return None
+        return record
     
     def do_select(self, arg):
         """
-        Select records: select [<primary_key_value> | range <start> <end> | all]
+        Select records: select [<primary_key_value> | range <start> <end> | all] [desc] [limit <n>] [offset <n>]
         Examples:
           select 42
           select range 10 20
           select all
+          select all desc limit 10 offset 20
         """
         if not self.current_table:
             print("No table selected. Use 'use <table_name>' first.")
@@ -104,22 +168,23 @@ class DBShell(cmd.Cmd):
         
         args = arg.split()
         if not args:
-            print("Usage: select [<primary_key_value> | range <start> <end> | all]")
+            print("Usage: select [<primary_key_value> | range <start> <end> | all] [desc] [limit <n>] [offset <n>]")
             return
         
-        if args[0] == 'all':
-            records = self.current_table.select_all()
-            for record in records:
-                print(record)
-        elif args[0] == 'range' and len(args) == 3:
+        if args[0] in ('all', 'range'):
+            bounds = args[1:3] if args[0] == 'range' else []
+            options = self._parse_scan_options(args[1 + len(bounds):])
+            if options is None or len(bounds) != (2 if args[0] == 'range' else 0):
+                print("Usage: select [<primary_key_value> | range <start> <end> | all] [desc] [limit <n>] [offset <n>]")
+                return
             try:
-                start = int(args[1])
-                end = int(args[2])
-                records = self.current_table.select_range(start, end)
-                for record in records:
-                    print(record)
+                start, end = (int(bounds[0]), int(bounds[1])) if bounds else (None, None)
             except ValueError:
                 print("Range values must be integers for this implementation.")
+                return
+            # Records are printed as the cursor reaches them
+            for record in self.current_table.scan(start, end, **options):
+                print(record)
         else:
             try:
                 key = int(arg) if self.current_table.columns[self.current_table.primary_key] == int else arg
@@ -130,6 +195,88 @@ class DBShell(cmd.Cmd):
                     print("Record not found.")
             except ValueError:
                 print("Invalid key format.")
+
+    def do_query(self, arg):
+        """
+        Query the current table:
+          query [explain] [* | <column>, ... | <function>(<column>|*), ...] [where <column> <op> <value> [and ...]]
+                [order by <column> [asc|desc]] [limit <n>]
+        Functions are count, sum, min, max and avg; operators are =, !=, <, <=, > and >=.
+        Predicates on the primary key or an indexed column use the index; explain shows the plan.
+        Examples:
+          query name, age where age > 20 order by name limit 10
+          query count(*), avg(gpa) where age >= 20
+          query explain * where id >= 100 and name = 'Alice'
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+
+        words = arg.split(None, 1)
+        explain = bool(words) and words[0] == 'explain'
+        if explain:
+            arg = words[1] if len(words) > 1 else ''
+        try:
+            query = Query(self.current_table, **parse_query(arg))
+            if explain:
+                print(query.explain())
+            elif query.aggregates:
+                for name, value in query.run().items():
+                    print(f"{name}: {value}")
+            else:
+                # Records are printed as the scan reaches them
+                for record in query.records():
+                    print(record)
+        except (ValueError, TypeError) as e:
+            print(f"Query error: {e}")
+
+    def do_join(self, arg):
+        """
+        Join two tables on equal column values:
+          join [explain] <left_table> <right_table> [on <left_column>=<right_column>]
+               [* | <column>, ...] [where <column> <op> <value> [and ...]] [limit <n>]
+        Columns default to each table's primary key and are named <table>.<column> in results
+        (the bare name works when only one table has it). explain shows the chosen strategy.
+        Examples:
+          join students courses on id=student_id
+          join explain students courses on id=student_id students.name, courses.title where age > 20
+        """
+        match = re.match(r"\s*(explain\s+)?(\S+)\s+(\S+)(?:\s+on\s+([^\s=]+)\s*=\s*([^\s=]+))?(.*)$", arg, re.S)
+        if not match:
+            print("Usage: join [explain] <left_table> <right_table> [on <left_column>=<right_column>] [query clauses]")
+            return
+        explain, left, right, left_on, right_on, rest = match.groups()
+        try:
+            options = parse_query(rest)
+            if 'aggregates' in options or 'order_by' in options:
+                raise ValueError("Joins support column lists, where and limit only")
+            join = self.db.join(left, right, left_on, right_on, **options)
+            if explain:
+                print(join.explain())
+            else:
+                for record in join.records():
+                    print(record)
+        except (ValueError, TypeError) as e:
+            print(f"Join error: {e}")
+
+    @staticmethod
+    def _parse_scan_options(args):
+        """Parse trailing [desc] [limit <n>] [offset <n>] words; None if malformed."""
+        options = {'limit': None, 'offset': 0, 'reverse': False}
+        i = 0
+        try:
+            while i < len(args):
+                if args[i] == 'desc':
+                    options['reverse'] = True
+                    i += 1
+                elif args[i] in ('limit', 'offset'):
+                    options[args[i]] = int(args[i + 1])
+                    i += 2
+                else:
+                    return None
+        except (IndexError, ValueError):
+            return None
+        return options
     
     def do_update(self, arg):
         """
@@ -169,31 +316,195 @@ class DBShell(cmd.Cmd):
                 return
         
         if self.current_table.update(pk_value, new_values):
+            self.db.commit()
             print("Record updated successfully.")
         else:
             print("Record not found.")
     
     def do_delete(self, arg):
         """
-        Delete a record: delete <primary_key_value>
+        Delete records: delete <primary_key_value> | delete range <start> <end>
+        A range includes both ends; * leaves an end open.
+        Examples:
+          delete 42
+          delete range 1000 1999
+          delete range * 500
         """
         if not self.current_table:
             print("No table selected. Use 'use <table_name>' first.")
             return
         
         if not arg:
-            print("Usage: delete <primary_key_value>")
+            print("Usage: delete <primary_key_value> | delete range <start> <end>")
             return
-        
+
+        args = arg.split()
+        pk_type = self.current_table.columns[self.current_table.primary_key]
+        if args[0] == 'range':
+            if len(args) != 3:
+                print("Usage: delete range <start> <end>")
+                return
+            try:
+                start, end = (None if bound == '*' else (int(bound) if pk_type == int else bound)
+                              for bound in args[1:])
+                deleted = self.current_table.delete_range(start, end)
+                self.db.commit()
+                print(f"{deleted} records deleted.")
+            except ValueError as e:
+                print(f"Invalid range: {e}")
+            return
+
         try:
-            key = int(arg) if self.current_table.columns[self.current_table.primary_key] == int else arg
+            key = int(arg) if pk_type == int else arg
             if self.current_table.delete(key):
+                self.db.commit()
                 print("Record deleted successfully.")
             else:
                 print("Record not found.")
         except ValueError:
             print("Invalid key format.")
     
+    def do_truncate(self, arg):
+        """
+        Delete every record of the current table, keeping its schema and indexes: truncate
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        try:
+            deleted = self.current_table.truncate()
+            self.db.commit()
+            print(f"{deleted} records deleted.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    def do_compact(self, arg):
+        """
+        Rebalance the leaves deletes left underfull in the current table and show its leaf occupancy: compact
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        sparse = self.current_table.sparse_leaves
+        repaired = self.current_table.compact()
+        print(f"{sparse} underfull leaves noted; {repaired} rebalanced.")
+        fill = self.current_table.compaction_stats()['leaf_fill']
+        if fill is not None:
+            print(f"Leaf occupancy: {fill:.0%}")
+
+    def do_create_index(self, arg):
+        """
+        Index a column of the current table: create_index <column> [unique]
+        Example: create_index email unique
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        
+        args = arg.split()
+        if len(args) not in (1, 2) or (len(args) == 2 and args[1] != 'unique'):
+            print("Usage: create_index <column> [unique]")
+            return
+        
+        try:
+            if self.current_table.create_index(args[0], unique=len(args) == 2):
+                self.db.commit()
+                print(f"Index on '{args[0]}' created successfully.")
+            else:
+                print(f"Column '{args[0]}' is already indexed.")
+        except ValueError as e:
+            print(e)
+    
+    def do_create_aggregate(self, arg):
+        """
+        Keep sum/min/max of a numeric column of the current table: create_aggregate <column>
+        Example: create_aggregate age
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        
+        args = arg.split()
+        if len(args) != 1:
+            print("Usage: create_aggregate <column>")
+            return
+        
+        try:
+            if self.current_table.create_aggregate(args[0]):
+                self.db.commit()
+                print(f"Aggregate on '{args[0]}' created successfully.")
+            else:
+                print(f"Column '{args[0]}' is already aggregated.")
+        except ValueError as e:
+            print(e)
+    
+    def do_aggregate(self, arg):
+        """
+        Aggregate over a primary key range: aggregate count [<start> <end>]
+        or aggregate <sum|min|max> <column> [<start> <end>]
+        Examples:
+          aggregate count 1 100
+          aggregate sum age
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        
+        args = arg.split()
+        table = self.current_table
+        if args and args[0] == 'count':
+            column, bounds = None, args[1:]
+        elif len(args) >= 2 and args[0] in ('sum', 'min', 'max'):
+            column, bounds = args[1], args[2:]
+        else:
+            print("Usage: aggregate count [<start> <end>] | aggregate <sum|min|max> <column> [<start> <end>]")
+            return
+        if len(bounds) not in (0, 2):
+            print("Give both <start> and <end>, or neither.")
+            return
+        
+        try:
+            pk_type = table.columns[table.primary_key]
+            start, end = (pk_type(bounds[0]), pk_type(bounds[1])) if bounds else (None, None)
+            if column is None:
+                print(table.count(start, end))
+            else:
+                print(getattr(table, args[0])(column, start, end))
+        except ValueError as e:
+            print(e)
+    
+    def do_find(self, arg):
+        """
+        Find records by an indexed column: find <column> [<value> | range <start> <end>]
+        Examples:
+          find email a@b.com
+          find age range 20 30
+        """
+        if not self.current_table:
+            print("No table selected. Use 'use <table_name>' first.")
+            return
+        
+        args = arg.split()
+        if len(args) < 2 or args[0] not in self.current_table.columns:
+            print("Usage: find <column> [<value> | range <start> <end>]")
+            return
+        
+        col_type = self.current_table.columns[args[0]]
+        try:
+            if args[1] == 'range' and len(args) == 4:
+                records = self.current_table.select_by_range(args[0], col_type(args[2]), col_type(args[3]))
+            else:
+                value = arg.split(maxsplit=1)[1].strip('"\'')
+                records = self.current_table.select_by(args[0], col_type(value))
+        except ValueError as e:
+            print(e)
+            return
+        
+        if not records:
+            print("No records found.")
+        for record in records:
+            print(record)
+    
     def do_list_tables(self, arg):
         """List all tables in the database."""
         tables = self.db.list_tables()
@@ -213,6 +524,25 @@ class DBShell(cmd.Cmd):
         self.current_table.visualize_index()
         print(f"Index visualization saved as '{self.current_table.name}_index.png'")
     
+    def do_freeze(self, arg):
+        """
+        Make a table read-only and memory-mapped, so later loads open it instantly: freeze <table_name>
+        """
+        if not arg:
+            print("Usage: freeze <table_name>")
+            return
+
+        try:
+            if not self.db.freeze_table(arg):
+                print(f"Table '{arg}' not found.")
+                return
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if self.current_table is not None and self.current_table.name == arg:
+            self.current_table = self.db.get_table(arg)
+        print(f"Table '{arg}' frozen.")
+
     def do_persist(self, arg):
         """Persist the database to disk."""
         self.db.persist()
@@ -0,0 +1,340 @@
+# memtable.py
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from bplustree import _MISSING, BPlusTree, Cursor, TreeSnapshot, WriteStatus
+
+MEMTABLE_SIZE = 4096  # buffered keys that trigger a flush into the tree
+
+_TOMBSTONE = object()  # Buffered in place of a value for a deleted key
+
+def _merged(pairs: Iterator[Tuple], buffered: Iterator[Tuple], reverse: bool,
+            limit: Optional[int] = None) -> Iterator[Tuple]:
+    """Merge tree pairs with buffered pairs in the same key order.
+
+    A buffered pair replaces a tree pair with the same key, and a buffered
+    tombstone hides it. At most limit pairs are produced.
+    """
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+    buffered = iter(buffered)
+    head = next(buffered, None)
+    for key, value in pairs:
+        while head is not None and (head[0] > key if reverse else head[0] < key):
+            if head[1] is not _TOMBSTONE:
+                yield head
+                count += 1
+                if count == limit:
+                    return
+            head = next(buffered, None)
+        if head is not None and head[0] == key:
+            value = head[1]
+            head = next(buffered, None)
+            if value is _TOMBSTONE:
+                continue
+        yield key, value
+        count += 1
+        if count == limit:
+            return
+    while head is not None:
+        if head[1] is not _TOMBSTONE:
+            yield head
+            count += 1
+            if count == limit:
+                return
+        head = next(buffered, None)
+
+def _slice(keys: List, values: Dict, start_key, end_key, reverse: bool) -> List[Tuple]:
+    """Buffered pairs with start_key <= key <= end_key from sorted keys, in scan order."""
+    low = 0 if start_key is None else bisect_left(keys, start_key)
+    high = len(keys) if end_key is None else bisect_right(keys, end_key)
+    pairs = [(key, values[key]) for key in keys[low:high]]
+    if reverse:
+        pairs.reverse()
+    return pairs
+
+class BufferedCursor:
+    """A Cursor over the tree merged with the buffered pairs from the same position.
+
+    Like Cursor it reads the live tree and buffer, so writes made while it
+    is in use may or may not be seen.
+    """
+
+    def __init__(self, tree: 'BufferedBPlusTree', reverse: bool = False):
+        self.tree = tree
+        self.reverse = reverse
+        self._cursor = Cursor(tree, reverse)
+        self.seek(None)
+
+    def seek(self, key, inclusive: bool = True) -> 'BufferedCursor':
+        """Move to the first key >= key (<= key when reversed), like Cursor.seek."""
+        self._cursor.seek(key, inclusive)
+        keys, buffer = self.tree._buffer_keys, self.tree._buffer
+        if self.reverse:
+            end = len(keys) if key is None else (bisect_right if inclusive else bisect_left)(keys, key)
+            positions = range(end - 1, -1, -1)
+        else:
+            start = 0 if key is None else (bisect_left if inclusive else bisect_right)(keys, key)
+            positions = range(start, len(keys))
+        self._pairs = _merged(self._cursor, ((keys[i], buffer[keys[i]]) for i in positions), self.reverse)
+        return self
+
+    def __iter__(self) -> 'BufferedCursor':
+        return self
+
+    def __next__(self) -> Tuple[Any, Any]:
+        return next(self._pairs)
+
+class BufferedBPlusTree(BPlusTree):
+    """B+ tree with a sorted in-memory write buffer (a memtable) in front of it.
+
+    Inserts and deletes land in the buffer, a dict kept alongside a sorted
+    list of its keys; a delete of a key the tree may hold buffers a
+    tombstone. Once buffer_size keys are buffered, flush() applies them to
+    the tree as one sorted delete_many and insert_many batch, so runs of
+    nearby keys share descents and fill leaves in order, and a key written
+    or deleted several times between flushes reaches the tree once or not
+    at all. Point reads check the buffer first; cursors, and so range
+    reads, merge it with the tree.
+
+    Write results still say whether the key existed, which takes a read of
+    the tree unless the buffer answers it or the key is above every key
+    flushed so far (_high), as in append-heavy ingest. Updates of keys not
+    in the buffer change the tree in place, since that read has found the
+    leaf already. Range deletes flush first.
+    """
+
+    def __init__(self, degree: int = 3, buffer_size: int = MEMTABLE_SIZE):
+        super().__init__(degree)
+        self.buffer_size = buffer_size
+        self._buffer: Dict[Any, Any] = {}
+        self._buffer_keys: List = []  # The buffer's keys in order
+        # No key in the tree is greater than this (None while it is empty)
+        self._high = None
+        self._flushing = False  # Set while flush() writes through the tree's own methods
+        self.flushes = 0
+
+    @property
+    def buffered(self) -> int:
+        """Writes waiting in the buffer."""
+        return len(self._buffer)
+
+    def _buffer_write(self, key, value) -> None:
+        if key not in self._buffer:
+            insort(self._buffer_keys, key)
+        self._buffer[key] = value
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def _may_hold(self, key) -> bool:
+        """Whether the tree may hold key, without reading it."""
+        return self._high is not None and key <= self._high
+
+    def _tree_value(self, key):
+        """key's value in the tree, or _MISSING."""
+        if not self._may_hold(key):
+            return _MISSING
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        return leaf.values[i] if i < len(leaf.keys) and leaf.keys[i] == key else _MISSING
+
+    def _tree_values(self, keys: List) -> List:
+        """Tree values for many keys (_MISSING where absent), in one sorted batch."""
+        values = [_MISSING] * len(keys)
+        maybe = [i for i, key in enumerate(keys) if self._may_hold(key)]
+        found = super().get_many([keys[i] for i in maybe], _MISSING)
+        for i, value in zip(maybe, found):
+            values[i] = value
+        return values
+
+    def flush(self) -> int:
+        """Apply the buffered writes to the tree in key order. Returns the number applied."""
+        if not self._buffer:
+            return 0
+        buffer, keys = self._buffer, self._buffer_keys
+        self._buffer, self._buffer_keys = {}, []
+        # Keys past the tree's last key are appended one by one, which keeps the
+        # tail fast path and 90/10 splits that insert_many's even splits would lose
+        split = len(keys) if self._high is None else bisect_right(keys, self._high)
+        self._flushing = True
+        try:
+            super().delete_many([key for key in keys[:split] if buffer[key] is _TOMBSTONE])
+            super().insert_many([(key, buffer[key]) for key in keys[:split] if buffer[key] is not _TOMBSTONE])
+            for key in keys[split:]:
+                super()._put(key, buffer[key], True)
+        finally:
+            self._flushing = False
+        if self._high is None or keys[-1] > self._high:
+            self._high = keys[-1]
+        self.flushes += 1
+        return len(keys)
+
+    # Reads
+
+    def search(self, key) -> bool:
+        value = self._buffer.get(key, _MISSING)
+        if value is _MISSING:
+            return super().search(key)
+        return value is not _TOMBSTONE
+
+    def get(self, key) -> Optional[object]:
+        value = self._buffer.get(key, _MISSING)
+        if value is _MISSING:
+            return super().get(key)
+        return None if value is _TOMBSTONE else value
+
+    def get_many(self, keys, default=None) -> List[Optional[object]]:
+        keys = list(keys)
+        results = [default] * len(keys)
+        misses = []
+        for i, key in enumerate(keys):
+            value = self._buffer.get(key, _MISSING)
+            if value is _MISSING:
+                misses.append(i)
+            elif value is not _TOMBSTONE:
+                results[i] = value
+        if misses:
+            for i, value in zip(misses, super().get_many([keys[i] for i in misses], default)):
+                results[i] = value
+        return results
+
+    def cursor(self, reverse: bool = False) -> Cursor:
+        return BufferedCursor(self, reverse) if self._buffer else super().cursor(reverse)
+
+    def range_query(self, start_key, end_key) -> List[Tuple]:
+        return list(self.iter_range(start_key, end_key))
+
+    def get_all(self) -> List[Tuple]:
+        return list(self.iter_range()) if self._buffer else super().get_all()
+
+    def estimated_count(self) -> int:
+        """The tree's estimate, plus the buffered writes less twice the tombstones.
+
+        A buffered update of a key already in the tree is counted twice.
+        """
+        tombstones = sum(1 for value in self._buffer.values() if value is _TOMBSTONE)
+        return max(super().estimated_count() + len(self._buffer) - 2 * tombstones, 0)
+
+    def snapshot(self) -> 'BufferedSnapshot':
+        """A snapshot of the tree together with a copy of the buffer."""
+        return BufferedSnapshot(super().snapshot(), list(self._buffer_keys), dict(self._buffer))
+
+    # Writes
+
+    def _put(self, key, value, replace: bool) -> WriteStatus:
+        if self._flushing:
+            return super()._put(key, value, replace)
+        old = self._buffer.get(key, _MISSING)
+        exists = self._tree_value(key) is not _MISSING if old is _MISSING else old is not _TOMBSTONE
+        if exists and not replace:
+            return WriteStatus.EXISTS
+        self._buffer_write(key, value)
+        return WriteStatus.REPLACED if exists else WriteStatus.INSERTED
+
+    def _pop(self, key):
+        if self._flushing:
+            return super()._pop(key)
+        value = self._buffer.get(key, _MISSING)
+        if value is _TOMBSTONE:
+            return _MISSING
+        if value is _MISSING:
+            value = self._tree_value(key)
+            if value is _MISSING:
+                return _MISSING
+        self._delete_existing(key)
+        return value
+
+    def _delete_existing(self, key) -> None:
+        """Delete key, known to exist, with a tombstone unless it has only ever been buffered."""
+        if self._may_hold(key):
+            self._buffer_write(key, _TOMBSTONE)
+        else:
+            # Never flushed, so the insert and the delete cancel out
+            del self._buffer[key]
+            del self._buffer_keys[bisect_left(self._buffer_keys, key)]
+
+    def modify(self, key, func: Callable[[Any], Any]) -> WriteStatus:
+        value = self._buffer.get(key, _MISSING)
+        if value is _MISSING:
+            return super().modify(key, func)
+        if value is _TOMBSTONE:
+            return WriteStatus.NOT_FOUND
+        self._buffer[key] = func(value)
+        return WriteStatus.REPLACED
+
+    def insert_many(self, pairs) -> int:
+        batch = dict(pairs)
+        keys = sorted(batch)
+        # Decide which keys are new before any write can trigger a flush
+        unknown = [key for key in keys if key not in self._buffer]
+        inserted = sum(1 for value in self._tree_values(unknown) if value is _MISSING)
+        inserted += sum(1 for key in keys if self._buffer.get(key) is _TOMBSTONE)
+        for key in keys:
+            self._buffer_write(key, batch[key])
+        return inserted
+
+    def delete_many(self, keys) -> int:
+        keys = sorted(set(keys))
+        unknown = [key for key in keys if key not in self._buffer]
+        in_tree = {key for key, value in zip(unknown, self._tree_values(unknown)) if value is not _MISSING}
+        doomed = [key for key in keys if key in in_tree or
+                  (key in self._buffer and self._buffer[key] is not _TOMBSTONE)]
+        for key in doomed:
+            self._delete_existing(key)
+        return len(doomed)
+
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        self.flush()
+        return super().delete_range(start_key, end_key)
+
+    def bulk_load(self, sorted_pairs, fill_factor: float = 1.0) -> None:
+        self._buffer, self._buffer_keys = {}, []
+        super().bulk_load(sorted_pairs, fill_factor)
+        leaf = self._last_leaf()
+        self._high = leaf.keys[-1] if leaf.keys else None
+
+    def validate_tree(self) -> bool:
+        return super().validate_tree() and self._buffer_keys == sorted(self._buffer)
+
+class BufferedSnapshot:
+    """Read-only view of a BufferedBPlusTree: a TreeSnapshot plus a copy of the buffer."""
+
+    def __init__(self, snapshot: TreeSnapshot, keys: List, buffer: Dict[Any, Any]):
+        self.snapshot = snapshot
+        self._keys = keys
+        self._buffer = buffer
+
+    @property
+    def root(self):
+        return self.snapshot.root
+
+    def search(self, key) -> bool:
+        value = self._buffer.get(key, _MISSING)
+        return self.snapshot.search(key) if value is _MISSING else value is not _TOMBSTONE
+
+    def get(self, key) -> Optional[object]:
+        value = self._buffer.get(key, _MISSING)
+        if value is _MISSING:
+            return self.snapshot.get(key)
+        return None if value is _TOMBSTONE else value
+
+    def iter_range(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                   reverse: bool = False) -> Iterator[Tuple]:
+        """Lazily yield pairs with start_key <= key <= end_key, like BPlusTree.iter_range."""
+        pairs = self.snapshot.iter_range(start_key, end_key, None, reverse)
+        return _merged(pairs, _slice(self._keys, self._buffer, start_key, end_key, reverse), reverse, limit)
+
+    def range_query(self, start_key, end_key) -> List[Tuple]:
+        return list(self.iter_range(start_key, end_key))
+
+    def get_all(self) -> List[Tuple]:
+        return list(self.iter_range())
+
+    def close(self) -> None:
+        self.snapshot.close()
+
+    def __enter__(self) -> 'BufferedSnapshot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
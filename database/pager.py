@@ -0,0 +1,807 @@
+# pager.py
+import functools
+import os
+import pickle
+import struct
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from bplustree import _MISSING, BPlusTree, LeafNode, InternalNode, WriteStatus
+from concurrency import SeekingCursor
+
+PAGE_SIZE = 4096
+BUFFER_POOL_SIZE = 4 * 1024 * 1024  # bytes of pages kept in memory
+MAGIC = b'BPTP'
+_HEADER = struct.Struct('<4sI')  # magic, page size
+_LEN = struct.Struct('<I')
+_PAGE_OVERHEAD = 64  # room for the node tuple around its entries
+_JOURNAL_SLOT = struct.Struct('<Q')  # page id ahead of each page image in a journal
+_JOURNAL_SEAL = struct.Struct('<QQI')  # seal marker, number of slots, CRC32 of the slots
+_SEAL_MARKER = 2 ** 64 - 1
+
+class PagedLeaf(LeafNode):
+    __slots__ = ('page_id',)
+
+class PagedInternal(InternalNode):
+    __slots__ = ('page_id',)
+
+class Pager:
+    """Fixed-size page I/O on a single file. Page 0 holds the header.
+
+    Pages below durable_pages belong to the last checkpoint, so writes to
+    them go to a journal file beside the page file and reads see them there.
+    sync() seals the journal with its slot count and CRC, copies its pages
+    into place and empties it. Opening a file finishes a sealed journal a
+    crash left behind and drops an unsealed one, so the file always holds
+    one whole checkpoint.
+    """
+
+    def __init__(self, path: str, page_size: int = PAGE_SIZE):
+        self.path = path
+        self.journal_path = path + '-journal'
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, page_size = _HEADER.unpack(self.file.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a page file")
+        self.page_size = page_size
+        self.is_new = not exists
+        self.bytes_written = 0
+        self.durable_pages = 0  # Pages in the last checkpoint; set by the tree
+        self.journal = None
+        self._staged: Dict[int, int] = {}  # page id -> journal slot
+        self._recover()
+
+    @property
+    def _slot_size(self) -> int:
+        return _JOURNAL_SLOT.size + self.page_size
+
+    def _recover(self) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+        if not self.is_new:
+            with open(self.journal_path, 'rb') as journal:
+                slots = self._sealed_slots(journal)
+                if slots:
+                    self._apply(journal, slots)
+        os.remove(self.journal_path)
+
+    def _sealed_slots(self, journal) -> int:
+        """Number of page images in a sealed journal; 0 if it was never sealed or is torn."""
+        size = journal.seek(0, os.SEEK_END)
+        slots, rest = divmod(size - _JOURNAL_SEAL.size, self._slot_size)
+        if size < _JOURNAL_SEAL.size or rest:
+            return 0
+        journal.seek(slots * self._slot_size)
+        marker, count, crc = _JOURNAL_SEAL.unpack(journal.read(_JOURNAL_SEAL.size))
+        if marker != _SEAL_MARKER or count != slots or self._crc(journal, slots) != crc:
+            return 0
+        return slots
+
+    def _crc(self, journal, slots: int) -> int:
+        journal.seek(0)
+        crc = 0
+        for _ in range(slots):
+            crc = zlib.crc32(journal.read(self._slot_size), crc)
+        return crc
+
+    def _apply(self, journal, slots: int) -> None:
+        """Copy the page images of a sealed journal into the page file and sync it."""
+        journal.seek(0)
+        for _ in range(slots):
+            entry = journal.read(self._slot_size)
+            (page_id,) = _JOURNAL_SLOT.unpack_from(entry)
+            self.file.seek(page_id * self.page_size)
+            self.file.write(entry[_JOURNAL_SLOT.size:])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def read(self, page_id: int) -> bytes:
+        slot = self._staged.get(page_id)
+        if slot is not None:
+            self.journal.seek(slot * self._slot_size + _JOURNAL_SLOT.size)
+            return self.journal.read(self.page_size)
+        self.file.seek(page_id * self.page_size)
+        return self.file.read(self.page_size)
+
+    def write(self, page_id: int, data: bytes) -> None:
+        if len(data) > self.page_size:
+            raise ValueError(f"Page {page_id} overflows the {self.page_size}-byte page size")
+        data = data.ljust(self.page_size, b'\0')
+        if page_id < self.durable_pages:
+            if self.journal is None:
+                self.journal = open(self.journal_path, 'w+b')
+            slot = self._staged.setdefault(page_id, len(self._staged))
+            self.journal.seek(slot * self._slot_size)
+            self.journal.write(_JOURNAL_SLOT.pack(page_id) + data)
+        else:
+            # Not part of the last checkpoint, so it can be written in place
+            self.file.seek(page_id * self.page_size)
+            self.file.write(data)
+        self.bytes_written += self.page_size
+
+    def sync(self) -> None:
+        """Make every write so far durable at once, as the new checkpoint."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if not self._staged:
+            return
+        slots = len(self._staged)
+        self.journal.flush()
+        crc = self._crc(self.journal, slots)
+        self.journal.seek(slots * self._slot_size)
+        self.journal.write(_JOURNAL_SEAL.pack(_SEAL_MARKER, slots, crc))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self._apply(self.journal, slots)
+        # Empty it before the next in-place write, so a crash never replays it over newer pages
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        self._staged.clear()
+
+    def close(self) -> None:
+        self.file.close()
+        if self.journal is not None:
+            # Anything still staged was never sealed, which a reopen would drop too
+            self.journal.close()
+            os.remove(self.journal_path)
+
+class BufferPool:
+    """LRU cache of decoded pages with write-back of dirty pages on eviction.
+
+    Eviction only happens in evict(), which the tree calls between operations,
+    so a node object stays unique for its page while an operation is using it.
+    Pages of the last checkpoint are written back to the pager's journal, so
+    the page file only changes at the next checkpoint.
+    """
+
+    def __init__(self, pager: Pager, capacity: int):
+        self.pager = pager
+        self.capacity = max(capacity, 1)
+        self.pages: 'OrderedDict[int, Any]' = OrderedDict()
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, page_id: int):
+        node = self.pages.get(page_id)
+        if node is not None:
+            self.pages.move_to_end(page_id)
+            self.hits += 1
+            return node
+        self.misses += 1
+        node = _decode(page_id, self.pager.read(page_id))
+        self.pages[page_id] = node
+        return node
+
+    def add(self, node) -> None:
+        self.pages[node.page_id] = node
+        self.dirty.add(node.page_id)
+
+    def mark_dirty(self, *nodes) -> None:
+        for node in nodes:
+            self.dirty.add(node.page_id)
+
+    def discard(self, page_id: int) -> None:
+        self.pages.pop(page_id, None)
+        self.dirty.discard(page_id)
+
+    def evict(self) -> None:
+        while len(self.pages) > self.capacity:
+            page_id, node = self.pages.popitem(last=False)
+            if page_id in self.dirty:
+                self.pager.write(page_id, _encode(node))
+                self.dirty.discard(page_id)
+
+    def flush(self) -> None:
+        for page_id in sorted(self.dirty):
+            self.pager.write(page_id, _encode(self.pages[page_id]))
+        self.dirty.clear()
+
+def _encode(node) -> bytes:
+    if node.is_leaf:
+        payload = pickle.dumps((True, node.keys, node.values, (node.next, node.prev)))
+    else:
+        payload = pickle.dumps((False, node.keys, node.children, None))
+    return _LEN.pack(len(payload)) + payload
+
+def _decode(page_id: int, data: bytes):
+    (length,) = _LEN.unpack_from(data)
+    is_leaf, keys, items, links = pickle.loads(data[_LEN.size:_LEN.size + length])
+    if is_leaf:
+        node = PagedLeaf()
+        node.values = items
+        node.next, node.prev = links
+    else:
+        node = PagedInternal()
+        node.children = items
+    node.keys = keys
+    node.page_id = page_id
+    return node
+
+def _locked(method):
+    """Run a PagedBPlusTree method under the tree's lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class PagedBPlusTree:
+    """B+ tree stored as fixed-size pages in one file, served through a bounded buffer pool.
+
+    It offers the same interface as BPlusTree, but child and leaf links are page
+    ids and only buffer_pool_size bytes of pages are held in memory. Modified
+    pages are written back when evicted or on flush(), which is the
+    checkpoint: the header and every page reachable from it change together
+    (see Pager), so a crash between flushes reopens the last flushed tree.
+
+    The buffer pool is shared by every operation, so public methods run one at a
+    time under self.lock. Cursors copy a leaf at a time and re-descend for the
+    next one, so writes between their steps cannot leave them on a freed page.
+    """
+
+    def __init__(self, path: str, degree: int = 8, page_size: int = PAGE_SIZE,
+                 buffer_pool_size: int = BUFFER_POOL_SIZE):
+        self.lock = threading.RLock()
+        self.pager = Pager(path, page_size)
+        self.pool = BufferPool(self.pager, buffer_pool_size // self.pager.page_size)
+        if self.pager.is_new:
+            self.degree = degree
+            self.meta: Dict[str, Any] = {}
+            self.page_count = 1
+            self.free_head = 0
+            root = self._allocate(PagedLeaf)
+            self.root_id = root.page_id
+            self.flush()
+        else:
+            header = self._read_header()
+            self.degree = header['degree']
+            self.meta = header['meta']
+            self.page_count = header['page_count']
+            self.free_head = header['free_head']
+            self.root_id = header['root']
+            self.pager.durable_pages = self.page_count
+        self.min_keys = self.degree - 1
+        self.max_keys = 2 * self.degree - 1
+        # Largest pickled (key, value) that still lets a full node fit in a page
+        self.max_entry_size = (self.pager.page_size - _LEN.size - _PAGE_OVERHEAD) // self.max_keys
+
+    # Page management
+
+    def _read_header(self) -> Dict[str, Any]:
+        data = self.pager.read(0)
+        (length,) = _LEN.unpack_from(data, _HEADER.size)
+        start = _HEADER.size + _LEN.size
+        return pickle.loads(data[start:start + length])
+
+    def _write_header(self) -> None:
+        payload = pickle.dumps({
+            'degree': self.degree,
+            'root': self.root_id,
+            'page_count': self.page_count,
+            'free_head': self.free_head,
+            'meta': self.meta
+        })
+        self.pager.write(0, _HEADER.pack(MAGIC, self.pager.page_size) + _LEN.pack(len(payload)) + payload)
+
+    def _allocate(self, node_type):
+        node = node_type()
+        if self.free_head:
+            node.page_id = self.free_head
+            data = self.pager.read(self.free_head)
+            (length,) = _LEN.unpack_from(data)
+            _, self.free_head = pickle.loads(data[_LEN.size:_LEN.size + length])
+        else:
+            node.page_id = self.page_count
+            self.page_count += 1
+        self.pool.add(node)
+        return node
+
+    def _free(self, node) -> None:
+        self.pool.discard(node.page_id)
+        payload = pickle.dumps(('free', self.free_head))
+        self.pager.write(node.page_id, _LEN.pack(len(payload)) + payload)
+        self.free_head = node.page_id
+
+    def _node(self, page_id: int):
+        return self.pool.get(page_id)
+
+    @property
+    def root(self):
+        return self._node(self.root_id)
+
+    def _check_entry(self, key, value) -> None:
+        if len(pickle.dumps((key, value))) > self.max_entry_size:
+            raise ValueError(f"Entry for key {key!r} exceeds {self.max_entry_size} bytes; "
+                             "use a larger page_size or a smaller degree")
+
+    @_locked
+    def flush(self) -> None:
+        """Write dirty pages and the header back to the file and sync it."""
+        self.pool.flush()
+        self._write_header()
+        self.pager.sync()
+        self.pager.durable_pages = self.page_count
+
+    @_locked
+    def close(self) -> None:
+        self.flush()
+        self.pager.close()
+
+    # Reads
+
+    def _find_leaf(self, key):
+        node = self.root
+        while not node.is_leaf:
+            node = self._node(node.children[bisect_right(node.keys, key)])
+        return node
+
+    @_locked
+    def search(self, key) -> bool:
+        """Search for a key in the B+ tree. Return True if found, False otherwise."""
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        found = i < len(leaf.keys) and leaf.keys[i] == key
+        self.pool.evict()
+        return found
+
+    @_locked
+    def get(self, key) -> Optional[object]:
+        """Get the value associated with a key, or None if not found."""
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        value = leaf.values[i] if i < len(leaf.keys) and leaf.keys[i] == key else None
+        self.pool.evict()
+        return value
+
+    @_locked
+    def range_query(self, start_key, end_key) -> List[Tuple]:
+        """Return all key-value pairs where start_key <= key <= end_key."""
+        results = []
+        node = self._find_leaf(start_key)
+        i = bisect_left(node.keys, start_key)
+        while True:
+            stop = bisect_right(node.keys, end_key, i)
+            results.extend(zip(node.keys[i:stop], node.values[i:stop]))
+            if stop < len(node.keys) or node.next is None:
+                break
+            node = self._node(node.next)
+            i = 0
+            self.pool.evict()
+        self.pool.evict()
+        return results
+
+    @_locked
+    def _leaf_snapshot(self, key, before: bool = False) -> Tuple[List, List, Any, Any]:
+        """Copy the leaf for key with its routing bounds [low, high), for SeekingCursor.
+
+        With before=True the leaf holding the largest keys below key is used;
+        key=None means the leftmost leaf, or the rightmost with before=True.
+        """
+        node = self.root
+        low = high = None
+        while not node.is_leaf:
+            if key is None:
+                i = len(node.keys) if before else 0
+            else:
+                i = (bisect_left if before else bisect_right)(node.keys, key)
+            if i > 0:
+                low = node.keys[i - 1]
+            if i < len(node.keys):
+                high = node.keys[i]
+            node = self._node(node.children[i])
+        snapshot = list(node.keys), list(node.values), low, high
+        self.pool.evict()
+        return snapshot
+
+    def cursor(self, reverse: bool = False) -> SeekingCursor:
+        """Return a cursor positioned at the first key (the last key if reverse)."""
+        return SeekingCursor(self, reverse)
+
+    iter_range = BPlusTree.iter_range
+
+    @_locked
+    def get_all(self) -> List[Tuple]:
+        """Return all key-value pairs in the tree."""
+        results = []
+        node = self.root
+        while not node.is_leaf:
+            node = self._node(node.children[0])
+        while True:
+            results.extend(zip(node.keys, node.values))
+            if node.next is None:
+                break
+            node = self._node(node.next)
+            self.pool.evict()
+        self.pool.evict()
+        return results
+
+    @_locked
+    def get_many(self, keys, default=None) -> List[Optional[object]]:
+        """Get the values for many keys (default where missing), in the order given."""
+        keys = list(keys)
+        found = {}
+        # Sorted lookups touch neighbouring pages while they are still cached
+        for key in sorted(set(keys)):
+            leaf = self._find_leaf(key)
+            i = bisect_left(leaf.keys, key)
+            if i < len(leaf.keys) and leaf.keys[i] == key:
+                found[key] = leaf.values[i]
+            self.pool.evict()
+        return [found.get(key, default) for key in keys]
+
+    @_locked
+    def estimated_count(self) -> int:
+        """Approximate number of keys from the fan-out on one root-to-leaf path, like BPlusTree.estimated_count."""
+        estimate = 1
+        node = self.root
+        while not node.is_leaf:
+            estimate *= len(node.children)
+            node = self._node(node.children[len(node.children) // 2])
+        self.pool.evict()
+        return estimate * len(node.keys)
+
+    # Writes
+
+    @_locked
+    def insert(self, key, value=None) -> WriteStatus:
+        """Insert a key-value pair, replacing the value if the key exists. Returns INSERTED or REPLACED."""
+        return self._put(key, value, replace=True)
+
+    @_locked
+    def insert_if_absent(self, key, value=None) -> WriteStatus:
+        """Insert a key-value pair unless the key exists. Returns INSERTED or EXISTS."""
+        return self._put(key, value, replace=False)
+
+    def _put(self, key, value, replace: bool) -> WriteStatus:
+        """Insert key, or replace its value if replace is set, in one descent (see BPlusTree._put)."""
+        self._check_entry(key, value)
+        root = self.root
+        if len(root.keys) == self.max_keys:
+            new_root = self._allocate(PagedInternal)
+            new_root.children.append(root.page_id)
+            self.root_id = new_root.page_id
+            self._split_child(new_root, 0, appending=key > root.keys[-1])
+            root = new_root
+
+        node = root
+        rightmost = True
+        while not node.is_leaf:
+            idx = bisect_right(node.keys, key)
+            child = self._node(node.children[idx])
+            if len(child.keys) == self.max_keys:
+                self._split_child(node, idx, appending=rightmost and idx == len(node.keys)
+                                  and key > child.keys[-1])
+                if key >= node.keys[idx]:
+                    idx += 1
+                    child = self._node(node.children[idx])
+            rightmost = rightmost and idx == len(node.keys)
+            node = child
+
+        idx = bisect_left(node.keys, key)
+        if idx < len(node.keys) and node.keys[idx] == key:
+            status = WriteStatus.REPLACED if replace else WriteStatus.EXISTS
+            if replace:
+                node.values[idx] = value
+                self.pool.mark_dirty(node)
+        else:
+            node.keys.insert(idx, key)
+            node.values.insert(idx, value)
+            self.pool.mark_dirty(node)
+            status = WriteStatus.INSERTED
+        self.pool.evict()
+        return status
+
+    _split_point = staticmethod(BPlusTree._split_point)
+
+    def _split_child(self, parent, child_idx: int, appending: bool = False) -> None:
+        child = self._node(parent.children[child_idx])
+        new_node = self._allocate(type(child))
+
+        split_point = self._split_point(len(child.keys), child.is_leaf, appending)
+        mid_key = child.keys[split_point]
+
+        new_node.keys = child.keys[split_point + (0 if child.is_leaf else 1):]
+        child.keys = child.keys[:split_point]
+
+        if not child.is_leaf:
+            new_node.children = child.children[split_point + 1:]
+            child.children = child.children[:split_point + 1]
+        else:
+            new_node.values = child.values[split_point:]
+            child.values = child.values[:split_point]
+            new_node.next = child.next
+            new_node.prev = child.page_id
+            if child.next is not None:
+                following = self._node(child.next)
+                following.prev = new_node.page_id
+                self.pool.mark_dirty(following)
+            child.next = new_node.page_id
+
+        parent.keys.insert(child_idx, mid_key)
+        parent.children.insert(child_idx + 1, new_node.page_id)
+        self.pool.mark_dirty(parent, child, new_node)
+
+    @_locked
+    def update(self, key, new_value) -> WriteStatus:
+        """Update the value associated with a key. Returns REPLACED, or NOT_FOUND if the key is absent."""
+        self._check_entry(key, new_value)
+        return self.modify(key, lambda _: new_value)
+
+    @_locked
+    def modify(self, key, func) -> WriteStatus:
+        """Replace the value of key with func(old value) in one descent. Returns REPLACED or NOT_FOUND."""
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        status = WriteStatus.NOT_FOUND
+        try:
+            if i < len(leaf.keys) and leaf.keys[i] == key:
+                new_value = func(leaf.values[i])
+                self._check_entry(key, new_value)
+                leaf.values[i] = new_value
+                self.pool.mark_dirty(leaf)
+                status = WriteStatus.REPLACED
+        finally:
+            self.pool.evict()
+        return status
+
+    @_locked
+    def insert_many(self, pairs) -> int:
+        """Insert or replace many key-value pairs; later pairs win. Returns the number of new keys."""
+        batch = dict(pairs)
+        return sum(self._put(key, batch[key], True) is WriteStatus.INSERTED for key in sorted(batch))
+
+    @_locked
+    def delete_many(self, keys) -> int:
+        """Delete many keys in key order. Returns the number deleted."""
+        return sum(1 for key in sorted(set(keys)) if self.delete(key))
+
+    @_locked
+    def delete(self, key) -> WriteStatus:
+        """Delete a key from the B+ tree. Returns DELETED, or NOT_FOUND if the key is absent."""
+        return WriteStatus.NOT_FOUND if self._pop(key) is _MISSING else WriteStatus.DELETED
+
+    @_locked
+    def pop(self, key, default=None):
+        """Delete a key and return its value, or default if the key is absent."""
+        value = self._pop(key)
+        return default if value is _MISSING else value
+
+    def _pop(self, key):
+        value = self._delete(self.root, key)
+
+        root = self.root
+        if not root.is_leaf and not root.keys:
+            self.root_id = root.children[0]
+            self._free(root)
+        self.pool.evict()
+        return value
+
+    def _delete(self, node, key):
+        if node.is_leaf:
+            idx = bisect_left(node.keys, key)
+            if idx < len(node.keys) and node.keys[idx] == key:
+                node.keys.pop(idx)
+                self.pool.mark_dirty(node)
+                return node.values.pop(idx)
+            return _MISSING
+
+        idx = bisect_right(node.keys, key)
+        child = self._node(node.children[idx])
+        value = self._delete(child, key)
+
+        if len(child.keys) < self.min_keys:
+            self._fill_child(node, idx)
+        return value
+
+    def _fill_child(self, parent, child_idx: int) -> None:
+        children = parent.children
+        if child_idx > 0 and len(self._node(children[child_idx - 1]).keys) > self.min_keys:
+            self._borrow_from_prev(parent, child_idx)
+        elif child_idx < len(children) - 1 and len(self._node(children[child_idx + 1]).keys) > self.min_keys:
+            self._borrow_from_next(parent, child_idx)
+        elif child_idx == len(children) - 1:
+            self._merge(parent, child_idx - 1)
+        else:
+            self._merge(parent, child_idx)
+
+    def _borrow_from_prev(self, parent, child_idx: int) -> None:
+        child = self._node(parent.children[child_idx])
+        left_sibling = self._node(parent.children[child_idx - 1])
+
+        if child.is_leaf:
+            child.keys.insert(0, left_sibling.keys.pop())
+            child.values.insert(0, left_sibling.values.pop())
+            parent.keys[child_idx - 1] = child.keys[0]
+        else:
+            child.keys.insert(0, parent.keys[child_idx - 1])
+            child.children.insert(0, left_sibling.children.pop())
+            parent.keys[child_idx - 1] = left_sibling.keys.pop()
+        self.pool.mark_dirty(parent, child, left_sibling)
+
+    def _borrow_from_next(self, parent, child_idx: int) -> None:
+        child = self._node(parent.children[child_idx])
+        right_sibling = self._node(parent.children[child_idx + 1])
+
+        if child.is_leaf:
+            child.keys.append(right_sibling.keys.pop(0))
+            child.values.append(right_sibling.values.pop(0))
+            parent.keys[child_idx] = right_sibling.keys[0]
+        else:
+            child.keys.append(parent.keys[child_idx])
+            child.children.append(right_sibling.children.pop(0))
+            parent.keys[child_idx] = right_sibling.keys.pop(0)
+        self.pool.mark_dirty(parent, child, right_sibling)
+
+    def _merge(self, parent, child_idx: int) -> None:
+        left_child = self._node(parent.children[child_idx])
+        right_child = self._node(parent.children[child_idx + 1])
+        separator = parent.keys.pop(child_idx)
+
+        if left_child.is_leaf:
+            left_child.keys += right_child.keys
+            left_child.values += right_child.values
+            left_child.next = right_child.next
+            if right_child.next is not None:
+                following = self._node(right_child.next)
+                following.prev = left_child.page_id
+                self.pool.mark_dirty(following)
+        else:
+            left_child.keys.append(separator)
+            left_child.keys += right_child.keys
+            left_child.children += right_child.children
+
+        parent.children.pop(child_idx + 1)
+        self.pool.mark_dirty(parent, left_child)
+        self._free(right_child)
+
+    @_locked
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        """Delete every key with start_key <= key <= end_key, like BPlusTree.delete_range. Returns the number deleted.
+
+        The pages of subtrees inside the range go straight onto the free list
+        (their leaves are read only to count the keys), and only the pages on
+        the paths to the two ends of the range are rewritten.
+        """
+        if start_key is not None and end_key is not None and start_key > end_key:
+            return 0
+        root = self.root
+        deleted = self._delete_range(root, start_key, end_key)
+        while not root.is_leaf and len(root.children) == 1:
+            self.root_id = root.children[0]
+            self._free(root)
+            root = self.root
+        self.pool.evict()
+        return deleted
+
+    def _delete_range(self, node, start_key, end_key) -> int:
+        if node.is_leaf:
+            low = 0 if start_key is None else bisect_left(node.keys, start_key)
+            high = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+            if high <= low:
+                return 0
+            del node.keys[low:high]
+            del node.values[low:high]
+            self.pool.mark_dirty(node)
+            return high - low
+        first = 0 if start_key is None else bisect_right(node.keys, start_key)
+        last = len(node.keys) if end_key is None else bisect_right(node.keys, end_key)
+        if last > first + 1:
+            # Close the leaf chain over the leaves dropped before their pages are freed
+            head, tail = self._node(node.children[first + 1]), self._node(node.children[last - 1])
+            while not head.is_leaf:
+                head, tail = self._node(head.children[0]), self._node(tail.children[-1])
+            if head.prev is not None:
+                before = self._node(head.prev)
+                before.next = tail.next
+                self.pool.mark_dirty(before)
+            if tail.next is not None:
+                after = self._node(tail.next)
+                after.prev = head.prev
+                self.pool.mark_dirty(after)
+        deleted = sum(self._free_subtree(page_id) for page_id in node.children[first + 1:last])
+        if last > first + 1:
+            del node.children[first + 1:last]
+            del node.keys[first:last - 1]
+            self.pool.mark_dirty(node)
+        deleted += self._delete_range(self._node(node.children[first]), start_key, end_key)
+        if last > first:
+            deleted += self._delete_range(self._node(node.children[first + 1]), start_key, end_key)
+            self._repair(node, first + 1)
+        self._repair(node, min(first, len(node.children) - 1))
+        return deleted
+
+    def _free_subtree(self, page_id: int) -> int:
+        """Free every page under page_id; returns the number of keys they held."""
+        count = 0
+        stack = [page_id]
+        while stack:
+            node = self._node(stack.pop())
+            if node.is_leaf:
+                count += len(node.keys)
+            else:
+                stack.extend(node.children)
+            self._free(node)
+        return count
+
+    def _repair(self, parent, idx: int) -> None:
+        """Merge or refill the child at idx after a range delete, as BPlusTree._repair does."""
+        floor = max(self.min_keys, 1)
+        child = self._node(parent.children[idx])
+        if len(parent.children) == 1 or len(child.keys) >= floor:
+            return
+        while len(parent.children) > 1 and len(child.keys) < floor:
+            i = idx - 1 if idx > 0 else idx
+            left, right = self._node(parent.children[i]), self._node(parent.children[i + 1])
+            if len(left.keys) + len(right.keys) + (0 if left.is_leaf else 1) <= self.max_keys:
+                self._merge(parent, i)
+                idx = i
+            elif idx > i:
+                while len(child.keys) < floor:
+                    self._borrow_from_prev(parent, idx)
+            else:
+                while len(child.keys) < floor:
+                    self._borrow_from_next(parent, idx)
+            child = self._node(parent.children[idx])
+            if child.is_leaf:
+                continue
+            j = 0
+            while j < len(child.children):
+                count = len(child.children)
+                self._repair(child, j)
+                if len(child.children) == count:
+                    j += 1
+
+    # Diagnostics
+
+    @_locked
+    def validate_tree(self) -> bool:
+        """Check tree invariants"""
+        valid = self._validate_node(self.root, None, None)
+        self.pool.evict()
+        return valid
+
+    def _validate_node(self, node, low, high) -> bool:
+        # Nodes on the right edge (no high bound) may be thinned by appends
+        if len(node.keys) > self.max_keys or (high is not None and len(node.keys) < self.min_keys):
+            return False
+        if any(a >= b for a, b in zip(node.keys, node.keys[1:])):
+            return False
+        if node.keys and ((low is not None and node.keys[0] < low) or
+                          (high is not None and node.keys[-1] >= high)):
+            return False
+        if node.is_leaf:
+            return len(node.values) == len(node.keys)
+        if len(node.children) != len(node.keys) + 1:
+            return False
+        # Read-only, so pages can be evicted while walking the children
+        bounds = [low] + node.keys + [high]
+        for i, child in enumerate(list(node.children)):
+            if not self._validate_node(self._node(child), bounds[i], bounds[i + 1]):
+                return False
+            self.pool.evict()
+        return True
+
+    def visualize_tree(self, filename: str = 'bplustree') -> None:
+        """Paged trees are printed rather than rendered, to avoid loading every page at once."""
+        print(f"Visualization of paged tree {self.pager.path} is text-only:")
+        self.print_tree()
+
+    @_locked
+    def print_tree(self) -> None:
+        """Print a text representation of the tree"""
+        nodes = [(self.root_id, 0)]
+        while nodes:
+            page_id, level = nodes.pop()
+            node = self._node(page_id)
+            prefix = "  " * level
+            if node.is_leaf:
+                print(f"{prefix}Leaf #{page_id}: {node.keys}")
+            else:
+                print(f"{prefix}Node #{page_id}: {node.keys}")
+                nodes.extend((child, level + 1) for child in reversed(node.children))
+            self.pool.evict()
@@ -0,0 +1,502 @@
+# partitioned.py
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from bplustree import WriteStatus
+from pager import BUFFER_POOL_SIZE
+from table import Table
+
+MANIFEST = 'manifest.json'
+PARTITION_EXTENSIONS = {'memory': '.tbl', 'paged': '.pages'}
+# Rows the partitions must hold before an aggregate forks workers: a fork
+# costs tens of milliseconds, about what summarizing 10k rows here does
+FORK_ROWS = 100000
+# Partition snapshots for forked aggregate workers, set before the workers are forked
+_forked: Dict[int, Any] = {}
+
+def _stable_hash(key) -> int:
+    """Hash of a primary key that every process agrees on (str hashes are salted per process)."""
+    if isinstance(key, (int, float)):
+        return hash(key)
+    return zlib.crc32(str(key).encode('utf-8', 'surrogatepass'))
+
+def _normalize(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Check a partitioning spec and return it in the form kept in the manifest."""
+    by = spec.get('by')
+    if by == 'hash':
+        count = int(spec.get('count', 0))
+        if count < 1:
+            raise ValueError("Hash partitioning needs a count of at least 1")
+        return {'by': 'hash', 'count': count}
+    if by == 'range':
+        bounds = list(spec.get('bounds', []))
+        if any(low >= high for low, high in zip(bounds, bounds[1:])):
+            raise ValueError("Range partition bounds must be strictly increasing")
+        return {'by': 'range', 'bounds': bounds}
+    raise ValueError(f"Unknown partitioning: {by}")
+
+def _summarize(pairs, position: Optional[int]) -> Dict[str, Any]:
+    """count, sum, min and max of the row field at position (just count if None), skipping None values."""
+    count = 0
+    total, low, high = 0, None, None
+    for _, row in pairs:
+        count += 1
+        if position is None or row[position] is None:
+            continue
+        value = row[position]
+        total += value
+        low = value if low is None or value < low else low
+        high = value if high is None or value > high else high
+    return {'count': count, 'sum': total, 'min': low, 'max': high}
+
+def _aggregate_forked(key: int, args: Tuple) -> Dict[str, Any]:
+    """Run in a forked worker: _summarize() over a range of a partition snapshot."""
+    position, start_key, end_key = args
+    return _summarize(_forked[key].iter_range(start_key, end_key), position)
+
+class PartitionedTable:
+    """A table split on its primary key into partitions, each a Table with its own index and file.
+
+    Range partitioning ({'by': 'range', 'bounds': [b1, b2, ...]}) puts keys
+    below b1 in partition 0, keys in [b1, b2) in partition 1 and so on;
+    hash partitioning ({'by': 'hash', 'count': n}) spreads keys by a hash
+    that is the same in every process. Point operations go to one
+    partition. Scans and aggregates visit the partitions a key range can
+    reach: range partitions in order, hash partitions merged by key.
+
+    With workers > 1, scans read the partitions a range reaches on a thread
+    pool, which overlaps the page reads of paged partitions. Aggregates
+    without subtree summaries over large in-memory partitions run in forked
+    worker processes instead, each summarizing a snapshot taken before the
+    fork, so only a summary comes back. The partitions live in
+    a directory, with a manifest holding the partitioning. Unique secondary
+    indexes are not supported, since each partition's index sees only its
+    own rows.
+    """
+    storage = 'partitioned'
+
+    def __init__(self, name: str, columns: Dict[str, type], primary_key: str,
+                 partitions: Optional[Dict[str, Any]] = None, storage: str = 'memory',
+                 buffer_pool_size: int = BUFFER_POOL_SIZE, directory: Optional[str] = None,
+                 concurrent: bool = False, compress: bool = False, workers: int = 1,
+                 relaxed_deletes: bool = False, write_buffer: int = 0):
+        if storage not in PARTITION_EXTENSIONS:
+            raise ValueError(f"Partitions cannot use storage type: {storage}")
+        self.name = name
+        self.columns = columns
+        self.primary_key = primary_key
+        self.partition_storage = storage
+        self.buffer_pool_size = buffer_pool_size  # Per paged partition
+        self.concurrent = concurrent
+        self.compress = compress
+        self.relaxed_deletes = relaxed_deletes
+        self.write_buffer = write_buffer
+        self.workers = workers  # Partitions read at once
+        self.serialized_file = directory or f"{name}.parts"  # This will be updated by the Database class
+        self.bytes_written = 0
+        self._wal = None
+        # Without a spec the partitioning is read from the manifest by load()
+        self.spec = None
+        self.partitions: List[Table] = []
+        if partitions is not None:
+            self._partition(_normalize(partitions), storage)
+
+    def _partition(self, spec: Dict[str, Any], storage: str) -> None:
+        self.spec = spec
+        self.partition_storage = storage
+        os.makedirs(self.serialized_file, exist_ok=True)
+        count = spec['count'] if spec['by'] == 'hash' else len(spec['bounds']) + 1
+        self.partitions = []
+        for i in range(count):
+            partition = Table(self.name, self.columns, self.primary_key, storage=storage,
+                              buffer_pool_size=self.buffer_pool_size, page_file=self._partition_file(i),
+                              concurrent=self.concurrent, compress=self.compress,
+                              relaxed_deletes=self.relaxed_deletes, write_buffer=self.write_buffer)
+            partition.serialized_file = self._partition_file(i)
+            partition.wal = self._wal
+            self.partitions.append(partition)
+
+    def _partition_file(self, i: int) -> str:
+        return os.path.join(self.serialized_file, f"{i}{PARTITION_EXTENSIONS[self.partition_storage]}")
+
+    def _partition_of(self, key) -> int:
+        """Index of the partition that holds key."""
+        if self.spec['by'] == 'hash':
+            return _stable_hash(key) % len(self.partitions)
+        return bisect_right(self.spec['bounds'], key)
+
+    def _locate(self, key) -> Table:
+        return self.partitions[self._partition_of(key)]
+
+    def _reaching(self, start_key, end_key) -> List[Table]:
+        """The partitions that may hold keys in [start_key, end_key], in key order for range partitioning."""
+        if self.spec['by'] == 'hash':
+            return list(self.partitions)
+        bounds = self.spec['bounds']
+        first = 0 if start_key is None else bisect_right(bounds, start_key)
+        last = len(bounds) if end_key is None else bisect_right(bounds, end_key)
+        return self.partitions[first:last + 1]
+
+    def _check(self, record: Dict[str, Any]) -> None:
+        if not all(col in record for col in self.columns):
+            raise ValueError("Missing columns in record")
+
+    # Table state, combined over the partitions
+
+    @property
+    def wal(self):
+        return self._wal
+
+    @wal.setter
+    def wal(self, wal) -> None:
+        # Partitions log writes under the table's name, so replay routes them again
+        self._wal = wal
+        for partition in self.partitions:
+            partition.wal = wal
+
+    @property
+    def generation(self) -> int:
+        return sum(partition.generation for partition in self.partitions)
+
+    @property
+    def dirty(self) -> bool:
+        """Whether any partition changed since it was last loaded or persisted."""
+        return any(partition.dirty for partition in self.partitions)
+
+    @property
+    def checkpoint_lsn(self) -> int:
+        # Each partition's file has its own LSN; replay() skips per partition above the lowest
+        return min((partition.checkpoint_lsn for partition in self.partitions), default=0)
+
+    @property
+    def secondary_indexes(self) -> Dict[str, Any]:
+        return self.partitions[0].secondary_indexes if self.partitions else {}
+
+    @property
+    def aggregates(self) -> List[str]:
+        return self.partitions[0].aggregates if self.partitions else []
+
+    @property
+    def materialized(self) -> bool:
+        return all(partition.materialized for partition in self.partitions)
+
+    def materialize(self) -> None:
+        for partition in self.partitions:
+            partition.materialize()
+
+    # Point operations go to the partition holding the key
+
+    def insert(self, record: Dict[str, Any]) -> bool:
+        """Insert a record into the table. Returns False if its primary key already exists."""
+        self._check(record)
+        return self._locate(record[self.primary_key]).insert(record)
+
+    def insert_if_absent(self, record: Dict[str, Any]) -> WriteStatus:
+        """Insert a record unless its primary key exists. Returns INSERTED or EXISTS."""
+        self._check(record)
+        return self._locate(record[self.primary_key]).insert_if_absent(record)
+
+    def upsert(self, record: Dict[str, Any]) -> WriteStatus:
+        """Insert a record, or replace the row with its primary key. Returns INSERTED or REPLACED."""
+        self._check(record)
+        return self._locate(record[self.primary_key]).upsert(record)
+
+    def select(self, primary_key_value) -> Optional[Dict[str, Any]]:
+        """Select a record by primary key."""
+        return self._locate(primary_key_value).select(primary_key_value)
+
+    def update(self, primary_key_value, new_values: Dict[str, Any]) -> bool:
+        """Update a record by primary key."""
+        return self._locate(primary_key_value).update(primary_key_value, new_values)
+
+    def delete(self, primary_key_value) -> bool:
+        """Delete a record by primary key."""
+        return self._locate(primary_key_value).delete(primary_key_value)
+
+    def _group(self, keys: List) -> Dict[int, List[int]]:
+        """Positions in keys grouped by the index of the partition holding each key."""
+        groups: Dict[int, List[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self._partition_of(key), []).append(i)
+        return groups
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> int:
+        """Insert many records, one batch per partition. Returns the number inserted."""
+        for record in records:
+            self._check(record)
+        groups = self._group([record[self.primary_key] for record in records])
+        return sum(self.partitions[p].insert_many([records[i] for i in positions])
+                   for p, positions in groups.items())
+
+    def select_many(self, primary_key_values: List) -> List[Optional[Dict[str, Any]]]:
+        """Select records for many primary keys (None where missing), in the order given."""
+        return [None if row is None else self._unpack(row) for row in self.get_rows(primary_key_values)]
+
+    def get_rows(self, primary_key_values: List) -> List[Optional[Tuple]]:
+        """Rows for many primary keys (None where missing), in the order given, one batch per partition."""
+        keys = list(primary_key_values)
+        rows: List[Optional[Tuple]] = [None] * len(keys)
+        for p, positions in self._group(keys).items():
+            found = self.partitions[p].get_rows([keys[i] for i in positions])
+            for i, row in zip(positions, found):
+                rows[i] = row
+        return rows
+
+    def delete_many(self, primary_key_values: List) -> int:
+        """Delete records for many primary keys. Returns the number deleted."""
+        keys = list(primary_key_values)
+        return sum(self.partitions[p].delete_many([keys[i] for i in positions])
+                   for p, positions in self._group(keys).items())
+
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        """Delete records with primary keys in [start_key, end_key] from each partition the range reaches."""
+        return sum(partition.delete_range(start_key, end_key) for partition in self._reaching(start_key, end_key))
+
+    def truncate(self) -> int:
+        """Delete every record from every partition. Returns the number deleted."""
+        return sum(partition.truncate() for partition in self.partitions)
+
+    @property
+    def sparse_leaves(self) -> int:
+        return sum(partition.sparse_leaves for partition in self.partitions)
+
+    def compaction_stats(self) -> Dict[str, Any]:
+        """Underfull leaves summed over the partitions and their mean leaf occupancy."""
+        stats = [partition.compaction_stats() for partition in self.partitions]
+        fills = [s['leaf_fill'] for s in stats if s['leaf_fill'] is not None]
+        return {'sparse_leaves': sum(s['sparse_leaves'] for s in stats),
+                'leaf_fill': sum(fills) / len(fills) if fills else None}
+
+    def compact(self, limit: Optional[int] = None) -> int:
+        """Compact each partition, with limit applying to each. Returns the number of leaves repaired."""
+        return sum(partition.compact(limit) for partition in self.partitions)
+
+    def create_index(self, column: str, unique: bool = False) -> bool:
+        """Index a non-primary-key column in every partition. Returns False if it is already indexed."""
+        if unique:
+            raise ValueError("Unique indexes are not supported on partitioned tables")
+        return any([partition.create_index(column) for partition in self.partitions])
+
+    def create_aggregate(self, column: str) -> bool:
+        """Keep the sum, min and max of a numeric column in every partition. Returns False if already kept."""
+        return any([partition.create_aggregate(column) for partition in self.partitions])
+
+    def replay(self, lsn: Optional[int], op: str, args: List) -> None:
+        """Redo a logged write on the partitions whose files do not hold it yet.
+
+        Partitions are saved one at a time, each file with its own LSN (see
+        Database._replay_logs); lsn None, from a log that kept no LSNs, redoes
+        the write everywhere. Partitions log their own writes, so a record's
+        keys all belong to the partition that logged it.
+        """
+        behind = [lsn is None or partition.checkpoint_lsn < lsn for partition in self.partitions]
+        if op in ('insert', 'upsert', 'update', 'delete'):
+            key = args[0][self.primary_key] if op in ('insert', 'upsert') else args[0]
+            p = self._partition_of(key)
+            if behind[p]:
+                getattr(self.partitions[p], op)(*args)
+        elif op in ('insert_many', 'delete_many'):
+            items = list(args[0])
+            keys = [item[self.primary_key] for item in items] if op == 'insert_many' else items
+            for p, positions in self._group(keys).items():
+                if behind[p]:
+                    getattr(self.partitions[p], op)([items[i] for i in positions])
+        else:
+            # delete_range, truncate, create_index and create_aggregate
+            for partition, redo in zip(self.partitions, behind):
+                if redo:
+                    getattr(partition, op)(*args)
+
+    # Range operations visit every partition the range reaches
+
+    def _map(self, func, partitions: List[Table]) -> List:
+        """func(partition) for each partition, in partition order, on a thread pool when workers > 1."""
+        if self.workers <= 1 or len(partitions) <= 1:
+            return [func(partition) for partition in partitions]
+        with ThreadPoolExecutor(min(self.workers, len(partitions))) as pool:
+            return list(pool.map(func, partitions))
+
+    def _forkable(self, partitions: List[Table]) -> bool:
+        """Whether to summarize partitions in forked worker processes.
+
+        Only large in-memory partitions pay for the fork, and only while this
+        is the process's sole thread: a child forked while another thread
+        holds a latch or the log's lock would inherit it locked.
+        """
+        return (self.workers > 1 and len(partitions) > 1 and self.partition_storage == 'memory'
+                and 'fork' in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+                and sum(partition.estimated_rows() for partition in partitions) >= FORK_ROWS)
+
+    def _fan_out(self, partitions: List[Table], func, args: Tuple) -> List:
+        """Call func(snapshot key, args) for each partition in forked workers; results come in partition order.
+
+        The snapshots are taken before the workers fork, so each worker reads
+        a consistent partition even if a write was half done at the fork.
+        """
+        keys = []
+        try:
+            for partition in partitions:
+                snapshot = partition.index.snapshot()
+                _forked[id(snapshot)] = snapshot
+                keys.append(id(snapshot))
+            with ProcessPoolExecutor(min(self.workers, len(keys)),
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                return list(pool.map(func, keys, [args] * len(keys)))
+        finally:
+            for key in keys:
+                _forked.pop(key).close()
+
+    def _unpack(self, row: Tuple) -> Dict[str, Any]:
+        return dict(zip(self.columns, row))
+
+    def scan(self, start_key=None, end_key=None, limit: Optional[int] = None, offset: int = 0,
+             reverse: bool = False) -> Iterator[Dict[str, Any]]:
+        """Stream records with primary keys in [start_key, end_key] (None = unbounded), like Table.scan."""
+        stop = None if limit is None else offset + limit
+        for row in islice(self.scan_rows(start_key, end_key, stop, reverse), offset, None):
+            yield self._unpack(row)
+
+    def scan_rows(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                  reverse: bool = False) -> Iterator[Tuple]:
+        """Stream rows, as tuples in column order, with primary keys in [start_key, end_key], like Table.scan_rows."""
+        partitions = self._reaching(start_key, end_key)
+        if reverse:
+            partitions.reverse()
+        if self.workers > 1 and len(partitions) > 1 and limit is not None:
+            # Each partition reads at most limit rows, so a limited scan stays
+            # small; an unlimited one streams the partitions lazily instead
+            streams = self._map(lambda partition: list(partition.scan_rows(start_key, end_key, limit, reverse)),
+                                partitions)
+        else:
+            streams = [partition.scan_rows(start_key, end_key, limit, reverse) for partition in partitions]
+        if self.spec['by'] == 'hash':
+            rows = heapq.merge(*streams, key=itemgetter(list(self.columns).index(self.primary_key)), reverse=reverse)
+        else:
+            rows = chain.from_iterable(streams)
+        yield from islice(rows, limit)
+
+    def select_range(self, start_key, end_key) -> List[Dict[str, Any]]:
+        """Select records within a range of primary keys."""
+        return list(self.scan(start_key, end_key))
+
+    def select_all(self) -> List[Dict[str, Any]]:
+        """Select all records in the table."""
+        return list(self.scan())
+
+    def select_by(self, column: str, value) -> List[Dict[str, Any]]:
+        """Select records whose indexed column equals value."""
+        if column == self.primary_key:
+            record = self.select(value)
+            return [record] if record is not None else []
+        return [record for partition in self.partitions for record in partition.select_by(column, value)]
+
+    def select_by_range(self, column: str, start, end) -> List[Dict[str, Any]]:
+        """Select records whose indexed column lies in [start, end], ordered by that column."""
+        if column == self.primary_key:
+            return self.select_range(start, end)
+        return list(heapq.merge(*[partition.select_by_range(column, start, end) for partition in self.partitions],
+                                key=itemgetter(column)))
+
+    def _summaries(self, column: Optional[str], start_key, end_key) -> List[Dict[str, Any]]:
+        partitions = self._reaching(start_key, end_key)
+        # Partitions with subtree summaries answer from them without reading rows
+        if partitions and not partitions[0]._summarized() and self._forkable(partitions):
+            position = None if column is None else list(self.columns).index(column)
+            return self._fan_out(partitions, _aggregate_forked, (position, start_key, end_key))
+        if column is None:
+            return self._map(lambda partition: {'count': partition.count(start_key, end_key)}, partitions)
+        return self._map(lambda partition: partition.aggregate(column, start_key, end_key), partitions)
+
+    def aggregate(self, column: str, start_key=None, end_key=None) -> Dict[str, Any]:
+        """count, sum, min and max of an aggregated column over primary keys in [start_key, end_key]."""
+        if column not in self.aggregates:
+            raise ValueError(f"Column '{column}' is not aggregated")
+        summaries = self._summaries(column, start_key, end_key)
+        lows = [summary['min'] for summary in summaries if summary['min'] is not None]
+        highs = [summary['max'] for summary in summaries if summary['max'] is not None]
+        return {'count': sum(summary['count'] for summary in summaries),
+                'sum': sum(summary['sum'] for summary in summaries),
+                'min': min(lows, default=None), 'max': max(highs, default=None)}
+
+    def count(self, start_key=None, end_key=None) -> int:
+        """Number of records with primary keys in [start_key, end_key] (None = unbounded)."""
+        return sum(summary['count'] for summary in self._summaries(None, start_key, end_key))
+
+    def estimated_rows(self) -> int:
+        """Approximate number of records: the sum of the partitions' estimates."""
+        return sum(partition.estimated_rows() for partition in self.partitions)
+
+    def sum(self, column: str, start_key=None, end_key=None):
+        """Sum of an aggregated column over primary keys in [start_key, end_key]; None values are skipped."""
+        return self.aggregate(column, start_key, end_key)['sum']
+
+    def min(self, column: Optional[str] = None, start_key=None, end_key=None):
+        """Smallest value of an aggregated column (the primary key by default) over [start_key, end_key]."""
+        if column is None or column == self.primary_key:
+            record = next(self.scan(start_key, end_key, limit=1), None)
+            return None if record is None else record[self.primary_key]
+        return self.aggregate(column, start_key, end_key)['min']
+
+    def max(self, column: Optional[str] = None, start_key=None, end_key=None):
+        """Largest value of an aggregated column (the primary key by default) over [start_key, end_key]."""
+        if column is None or column == self.primary_key:
+            record = next(self.scan(start_key, end_key, limit=1, reverse=True), None)
+            return None if record is None else record[self.primary_key]
+        return self.aggregate(column, start_key, end_key)['max']
+
+    # Files
+
+    def persist(self) -> int:
+        """Persist changed partitions and the manifest. Returns the number of bytes written."""
+        os.makedirs(self.serialized_file, exist_ok=True)
+        written = 0
+        for i, partition in enumerate(self.partitions):
+            path = self._partition_file(i)
+            if partition.dirty or partition.serialized_file != path or not os.path.exists(path):
+                partition.serialized_file = path
+                written += partition.persist()
+        manifest = json.dumps({'storage': self.partition_storage, 'partitions': self.spec}).encode()
+        path = os.path.join(self.serialized_file, MANIFEST)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(manifest)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        written += len(manifest)
+        self.bytes_written += written
+        return written
+
+    def load(self, lazy: bool = False) -> bool:
+        """Load the partitions named in the manifest. With lazy=True only their schemas are read until first use."""
+        try:
+            with open(os.path.join(self.serialized_file, MANIFEST), 'rb') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return False
+        self._partition(_normalize(manifest['partitions']), manifest['storage'])
+        if not all([partition.load(lazy=lazy) for partition in self.partitions]):
+            return False
+        first = self.partitions[0]
+        self.name, self.columns, self.primary_key = first.name, first.columns, first.primary_key
+        return True
+
+    def freeze(self, path: str) -> int:
+        raise ValueError("Partitioned tables cannot be frozen")
+
+    def close(self) -> None:
+        """Release the partitions' page files, if they have any."""
+        for partition in self.partitions:
+            partition.close()
+
+    def visualize_index(self, filename: str) -> None:
+        """Visualize each partition's B+ tree index, as filename_0, filename_1 and so on."""
+        for i, partition in enumerate(self.partitions):
+            partition.visualize_index(f"{filename}_{i}")
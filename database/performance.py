@@ -1,11 +1,81 @@
 # performance.py
+import gc
+import heapq
+import os
 import time
 import random
 import sys
+import pickle
+import tempfile
+import threading
 from typing import Callable, Tuple, List
-from bplustree import BPlusTree
+from augmented import AugmentedBPlusTree
+from bplustree import BPlusTree, LeafNode
+from concurrency import ConcurrentBPlusTree
+from pager import PagedBPlusTree
 from bruteforce import BruteForceDB
-import matplotlib.pyplot as plt
+from table import Table
+from partitioned import PartitionedTable
+from query import Join
+from tablefile import read_rows, read_schema
+from db_manager import COMPACT_THRESHOLD, Database
+from memtable import MEMTABLE_SIZE, BufferedBPlusTree
+
+class _DictNode:
+    """The original __dict__-based node layout, kept as a memory baseline."""
+    def __init__(self, is_leaf: bool = False):
+        self.keys = []
+        self.children = []
+        self.is_leaf = is_leaf
+        self.next = None
+        self.values = []
+
+def _linear_get(tree: BPlusTree, key):
+    """Lookup using the original linear key scan at every level."""
+    node = tree.root
+    while not node.is_leaf:
+        i = 0
+        while i < len(node.keys) and key >= node.keys[i]:
+            i += 1
+        node = node.children[i]
+    for i, k in enumerate(node.keys):
+        if k == key:
+            return node.values[i]
+    return None
+
+def _node_footprint(node) -> int:
+    """Bytes used by a node object and its own containers (not the keys/values themselves)."""
+    size = sys.getsizeof(node)
+    attrs = getattr(node, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        size += sum(sys.getsizeof(v) for v in attrs.values() if isinstance(v, list))
+    else:
+        size += sum(sys.getsizeof(getattr(node, s)) for s in ('keys', 'values', 'children')
+                    if isinstance(getattr(node, s, None), list))
+    return size
+
+def _deep_size(root) -> int:
+    """Bytes used by root and every object reachable from it, each object counted once."""
+    seen = set()
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__slots__') or hasattr(obj, '__dict__'):
+            for cls in type(obj).__mro__:
+                stack.extend(getattr(obj, name) for name in getattr(cls, '__slots__', ()) if hasattr(obj, name))
+            stack.extend(getattr(obj, '__dict__', {}).values())
+    return size
 
 class PerformanceAnalyzer:
     def __init__(self):
@@ -14,7 +84,37 @@ class PerformanceAnalyzer:
             'search': {'bptree': [], 'bruteforce': [], 'sizes': []},
             'delete': {'bptree': [], 'bruteforce': [], 'sizes': []},
             'range_query': {'bptree': [], 'bruteforce': [], 'sizes': []},
-            'memory': {'bptree': [], 'bruteforce': [], 'sizes': []}
+            'memory': {'bptree': [], 'bruteforce': [], 'sizes': []},
+            'lookup': {'bisect': [], 'linear': [], 'degrees': []},
+            'node_memory': {'slotted': [], 'dict': [], 'degrees': []},
+            'cold_start': {'insert': [], 'bulk_load': [], 'sizes': []},
+            'startup': {'eager': [], 'lazy': [], 'tables': []},
+            'batch': {'insert': [], 'insert_many': [], 'get': [], 'get_many': [],
+                      'delete': [], 'delete_many': [], 'commit': [], 'commit_many': [], 'sizes': []},
+            'concurrency': {'latched': [], 'global_lock': [], 'threads': []},
+            'snapshot': {'scan_writes': [], 'locked_writes': [], 'update': [], 'cow_update': [], 'sizes': []},
+            'aggregate': {'count_range': [], 'range_count': [], 'sum': [], 'scan_sum': [],
+                          'insert': [], 'augmented_insert': [], 'sizes': []},
+            'append': {'sequential': [], 'random': [], 'sequential_fill': [], 'random_fill': [], 'sizes': []},
+            'write_path': {'memory': {'insert': [], 'update': [], 'delete': []},
+                           'memory_old': {'insert': [], 'update': [], 'delete': []},
+                           'paged': {'insert': [], 'update': [], 'delete': []},
+                           'paged_old': {'insert': [], 'update': [], 'delete': []}, 'sizes': []},
+            'row_memory': {'dict': [], 'tuple': [], 'payload': [], 'sizes': []},
+            'table_file': {'pickle': {'bytes': [], 'write': [], 'load': []},
+                           'binary': {'bytes': [], 'write': [], 'load': []},
+                           'zlib': {'bytes': [], 'write': [], 'load': []}, 'sizes': []},
+            'frozen': {'load': [], 'open': [], 'tree_get': [], 'frozen_get': [], 'sizes': []},
+            'numpy': {'build': [], 'refresh': [], 'loop_get': [], 'view_get': [],
+                      'loop_filter': [], 'view_filter': [], 'sizes': []},
+            'parallel_io': {'persist_threads': [], 'persist_processes': [], 'load': [], 'workers': []},
+            'partitioned': {'count': [], 'select_range': [], 'layouts': []},
+            'join': {'client_merge': [], 'merge': [], 'client_probe': [], 'nested_loop': [], 'sizes': []},
+            'range_delete': {'per_key': [], 'delete_many': [], 'delete_range': [], 'sizes': []},
+            'churn': {'eager': [], 'relaxed': [], 'compact': [], 'eager_rebalances': [], 'relaxed_rebalances': [],
+                      'eager_fill': [], 'relaxed_fill': [], 'sizes': []},
+            'memtable': {'sequential': [], 'buffered_sequential': [], 'random': [], 'buffered_random': [],
+                         'hot': [], 'buffered_hot': [], 'get': [], 'buffered_get': [], 'scan': [], 'buffered_scan': [], 'sizes': []}
         }
     
     def _measure_time(self, func: Callable, *args) -> float:
@@ -130,6 +230,820 @@ class PerformanceAnalyzer:
             
             self.results['range_query']['sizes'].append(size)
     
+    def run_node_layout_test(self, degrees: List[int], size: int = 100000, lookups: int = 10000) -> None:
+        """Compare bisect vs linear-scan lookups and slotted vs __dict__ node memory per degree."""
+        data = self.generate_test_data(size)
+        search_keys = random.choices(data, k=lookups)
+        for degree in degrees:
+            bptree = BPlusTree(degree=degree)
+            for key in data:
+                bptree.insert(key, key)
+
+            # Per-lookup time for both descents over the same tree
+            time_taken = self._measure_time(lambda: [bptree.get(key) for key in search_keys])
+            self.results['lookup']['bisect'].append(time_taken / lookups)
+            time_taken = self._measure_time(lambda: [_linear_get(bptree, key) for key in search_keys])
+            self.results['lookup']['linear'].append(time_taken / lookups)
+
+            # Memory of one full leaf in each layout
+            keys = list(range(bptree.max_keys))
+            leaf = LeafNode()
+            leaf.keys, leaf.values = list(keys), list(keys)
+            old_leaf = _DictNode(is_leaf=True)
+            old_leaf.keys, old_leaf.values = list(keys), list(keys)
+            self.results['node_memory']['slotted'].append(_node_footprint(leaf))
+            self.results['node_memory']['dict'].append(_node_footprint(old_leaf))
+
+            self.results['lookup']['degrees'].append(degree)
+            self.results['node_memory']['degrees'].append(degree)
+
+    def print_node_layout_report(self) -> None:
+        """Print per-lookup speedup and per-node memory saving for each degree tested."""
+        lookup, memory = self.results['lookup'], self.results['node_memory']
+        print(f"{'degree':>8} {'bisect us':>10} {'linear us':>10} {'speedup':>8} {'slotted B':>10} {'dict B':>8} {'saved':>6}")
+        for i, degree in enumerate(lookup['degrees']):
+            fast, slow = lookup['bisect'][i] * 1e6, lookup['linear'][i] * 1e6
+            slotted, old = memory['slotted'][i], memory['dict'][i]
+            print(f"{degree:>8} {fast:>10.2f} {slow:>10.2f} {slow / fast:>7.1f}x "
+                  f"{slotted:>10} {old:>8} {1 - slotted / old:>6.0%}")
+
+    def run_cold_start_test(self, sizes: List[int]) -> None:
+        """Compare Table.load (bulk_load) against rebuilding the index one insert at a time."""
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                table = Table('bench', {'id': int, 'name': str}, 'id')
+                table.serialized_file = os.path.join(tmp, 'bench.tbl')
+                for key in self.generate_test_data(size):
+                    table.insert({'id': key, 'name': f'row{key}'})
+                table.persist()
+
+                def load_with_inserts():
+                    with open(table.serialized_file, 'rb') as f:
+                        read_schema(f)
+                        pairs = list(read_rows(f, key=0))
+                    bptree = BPlusTree(degree=3)
+                    for key, value in pairs:
+                        bptree.insert(key, value)
+
+                time_taken = self._measure_time(load_with_inserts)
+                self.results['cold_start']['insert'].append(time_taken)
+                time_taken = self._measure_time(table.load)
+                self.results['cold_start']['bulk_load'].append(time_taken)
+
+            self.results['cold_start']['sizes'].append(size)
+
+    def print_cold_start_report(self) -> None:
+        """Print table load time via per-key inserts vs bulk_load."""
+        results = self.results['cold_start']
+        print(f"{'rows':>10} {'insert s':>10} {'bulk s':>10} {'speedup':>8}")
+        for i, size in enumerate(results['sizes']):
+            slow, fast = results['insert'][i], results['bulk_load'][i]
+            print(f"{size:>10} {slow:>10.3f} {fast:>10.3f} {slow / fast:>7.1f}x")
+
+    def run_startup_test(self, table_counts: List[int], rows: int = 20000) -> None:
+        """Time-to-first-query for a database directory with many large tables, eager vs lazy load."""
+        cwd = os.getcwd()
+        for count in table_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    db = Database('bench')
+                    for t in range(count):
+                        db.create_table(f't{t}', {'id': int, 'name': str}, 'id')
+                        table = db.get_table(f't{t}')
+                        table.index.bulk_load((key, (key, f'row{key}')) for key in range(rows))
+                        table.generation += 1
+                    db.persist()
+
+                    for mode, lazy in (('eager', False), ('lazy', True)):
+                        def first_query():
+                            db = Database('bench')
+                            db.load(lazy=lazy)
+                            db.get_table('t0').select(rows // 2)
+                        self.results['startup'][mode].append(self._measure_time(first_query))
+                finally:
+                    os.chdir(cwd)
+            self.results['startup']['tables'].append(count)
+
+    def print_startup_report(self) -> None:
+        """Print time-to-first-query for eager and lazy database loading."""
+        results = self.results['startup']
+        print(f"{'tables':>8} {'eager s':>10} {'lazy s':>10} {'speedup':>8}")
+        for i, count in enumerate(results['tables']):
+            slow, fast = results['eager'][i], results['lazy'][i]
+            print(f"{count:>8} {slow:>10.3f} {fast:>10.3f} {slow / fast:>7.1f}x")
+
+    def run_batch_test(self, sizes: List[int], batch: int = 2000) -> None:
+        """Compare per-key loops against the batched *_many calls on a batch of neighbouring keys.
+
+        The tree holds the even keys; the batch inserts, reads and deletes a run of
+        odd keys in random order. 'commit' times the endpoint pattern: one logged
+        insert and WAL commit per record versus one insert_many and one commit.
+        """
+        results = self.results['batch']
+        for size in sizes:
+            def build():
+                bptree = BPlusTree(degree=3)
+                bptree.bulk_load((key, key) for key in range(0, 2 * size, 2))
+                return bptree
+            start = random.randrange(max(1, size - batch)) | 1
+            keys = list(range(start, min(start + 2 * batch, 2 * size), 2))
+            random.shuffle(keys)
+
+            loop_tree, batch_tree = build(), build()
+            results['insert'].append(self._measure_time(lambda: [loop_tree.insert(k, k) for k in keys]))
+            results['insert_many'].append(self._measure_time(batch_tree.insert_many, [(k, k) for k in keys]))
+            results['get'].append(self._measure_time(lambda: [loop_tree.get(k) for k in keys]))
+            results['get_many'].append(self._measure_time(batch_tree.get_many, keys))
+            results['delete'].append(self._measure_time(lambda: [loop_tree.delete(k) for k in keys]))
+            results['delete_many'].append(self._measure_time(batch_tree.delete_many, keys))
+
+            records = [{'id': key, 'name': f'row{key}'} for key in keys]
+            with tempfile.TemporaryDirectory() as tmp:
+                loop_db = Database(os.path.join(tmp, 'loop'))
+                batch_db = Database(os.path.join(tmp, 'batch'))
+                for db in (loop_db, batch_db):
+                    db.create_table('bench', {'id': int, 'name': str}, 'id')
+
+                def insert_loop():
+                    table = loop_db.get_table('bench')
+                    for record in records:
+                        table.insert(record)
+                        loop_db.commit()
+                def insert_batch():
+                    batch_db.get_table('bench').insert_many(records)
+                    batch_db.commit()
+                results['commit'].append(self._measure_time(insert_loop))
+                results['commit_many'].append(self._measure_time(insert_batch))
+                for db in (loop_db, batch_db):
+                    db.wal.close()
+
+            results['sizes'].append(size)
+
+    def print_batch_report(self) -> None:
+        """Print per-key loop vs batched operation times."""
+        results = self.results['batch']
+        print(f"{'size':>10} {'op':>8} {'loop s':>10} {'batch s':>10} {'speedup':>8}")
+        for i, size in enumerate(results['sizes']):
+            for op in ('insert', 'get', 'delete', 'commit'):
+                slow, fast = results[op][i], results[f'{op}_many'][i]
+                print(f"{size:>10} {op:>8} {slow:>10.4f} {fast:>10.4f} {slow / fast:>7.1f}x")
+
+    def _run_mixed_workload(self, get, insert, delete, threads: int, ops: int, keys: int) -> Tuple[float, List[dict]]:
+        """Run a mixed workload on threads; each thread writes only keys == its number mod threads.
+
+        Returns the elapsed time and each thread's expected final contents for its keys.
+        """
+        expected = [{key: key for key in range(t, keys, threads)} for t in range(threads)]
+        errors = []
+
+        def worker(t):
+            rng = random.Random(t)
+            mine = expected[t]
+            try:
+                for i in range(ops):
+                    key = rng.randrange(keys // threads) * threads + t
+                    op = rng.random()
+                    if op < 0.6:
+                        # Read anywhere; only our own keys have a known value
+                        other = rng.randrange(keys)
+                        value = get(other)
+                        assert other % threads != t or value == mine.get(other)
+                    elif op < 0.8:
+                        insert(key, i)
+                        mine[key] = i
+                    else:
+                        assert bool(delete(key)) == (key in mine)
+                        mine.pop(key, None)
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        return elapsed, expected
+
+    def run_concurrency_test(self, thread_counts: List[int], ops: int = 20000, keys: int = 20000) -> None:
+        """Stress ConcurrentBPlusTree with mixed reads and writes, and compare with one global lock.
+
+        After each run the tree must pass validate_tree and hold exactly what the
+        threads wrote. Results are operations per second.
+        """
+        for threads in thread_counts:
+            tree = ConcurrentBPlusTree(degree=3)
+            tree.bulk_load((key, key) for key in range(keys))
+            elapsed, expected = self._run_mixed_workload(tree.get, tree.insert, tree.delete, threads, ops, keys)
+            assert tree.validate_tree(), "tree invariants broken by concurrent writes"
+            contents = {}
+            for part in expected:
+                contents.update(part)
+            assert dict(tree.get_all()) == contents, "concurrent writes were lost"
+            self.results['concurrency']['latched'].append(threads * ops / elapsed)
+
+            plain = BPlusTree(degree=3)
+            plain.bulk_load((key, key) for key in range(keys))
+            lock = threading.Lock()
+            def locked(method):
+                def call(*args):
+                    with lock:
+                        return method(*args)
+                return call
+            elapsed, _ = self._run_mixed_workload(locked(plain.get), locked(plain.insert), locked(plain.delete),
+                                                  threads, ops, keys)
+            self.results['concurrency']['global_lock'].append(threads * ops / elapsed)
+            self.results['concurrency']['threads'].append(threads)
+
+    def print_concurrency_report(self) -> None:
+        """Print throughput of the latched tree vs a plain tree behind one lock."""
+        results = self.results['concurrency']
+        print(f"{'threads':>8} {'latched op/s':>14} {'locked op/s':>14} {'ratio':>7}")
+        for i, threads in enumerate(results['threads']):
+            latched, locked = results['latched'][i], results['global_lock'][i]
+            print(f"{threads:>8} {latched:>14.0f} {locked:>14.0f} {latched / locked:>6.2f}x")
+
+    def _writes_during_scan(self, tree: ConcurrentBPlusTree, size: int, scan: Callable) -> float:
+        """Run scan() while another thread updates keys; returns the writer's updates per second."""
+        done = threading.Event()
+        count = [0]
+        def writer():
+            key = 0
+            while not done.is_set():
+                tree.update(key, -key)
+                key = (key + 7919) % size
+                count[0] += 1
+        thread = threading.Thread(target=writer)
+        thread.start()
+        elapsed = self._measure_time(scan)
+        done.set()
+        thread.join()
+        return count[0] / elapsed
+
+    def run_snapshot_test(self, sizes: List[int], updates: int = 20000) -> None:
+        """Compare a snapshot scan with a scan that locks writers out, and measure copy-on-write cost.
+
+        scan_writes/locked_writes are updates per second a concurrent writer gets
+        through during a full scan; update/cow_update time a run of updates
+        without and with a snapshot pinned.
+        """
+        for size in sizes:
+            tree = ConcurrentBPlusTree(degree=3)
+            tree.bulk_load((key, key) for key in range(size))
+
+            def snapshot_scan():
+                with tree.snapshot() as snapshot:
+                    rows = snapshot.get_all()
+                assert len(rows) == size and all(key == abs(value) for key, value in rows)
+            self.results['snapshot']['scan_writes'].append(self._writes_during_scan(tree, size, snapshot_scan))
+
+            # Without snapshots a consistent scan has to keep writers out meanwhile
+            lock = threading.Lock()
+            update = tree.update
+            def locked_update(key, value):
+                with lock:
+                    return update(key, value)
+            tree.update = locked_update
+            def locked_scan():
+                with lock:
+                    tree.get_all()
+            self.results['snapshot']['locked_writes'].append(self._writes_during_scan(tree, size, locked_scan))
+            del tree.update
+
+            keys = random.sample(range(size), min(size, updates))
+            def update_all():
+                for key in keys:
+                    tree.update(key, key)
+            self.results['snapshot']['update'].append(self._measure_time(update_all))
+            with tree.snapshot():
+                self.results['snapshot']['cow_update'].append(self._measure_time(update_all))
+            self.results['snapshot']['sizes'].append(size)
+
+    def print_snapshot_report(self) -> None:
+        """Print writer throughput during scans and the copy-on-write overhead."""
+        results = self.results['snapshot']
+        print(f"{'size':>10} {'snapshot upd/s':>15} {'locked upd/s':>13} {'update (s)':>11} {'pinned (s)':>11}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['scan_writes'][i]:>15.0f} {results['locked_writes'][i]:>13.0f} "
+                  f"{results['update'][i]:>11.4f} {results['cow_update'][i]:>11.4f}")
+
+    def run_aggregate_test(self, sizes: List[int], queries: int = 200) -> None:
+        """Compare range counts and sums from subtree summaries with scanning the range.
+
+        Also times building each tree by single inserts, to show what keeping
+        the summaries costs writers.
+        """
+        for size in sizes:
+            data = self.generate_test_data(size)
+            plain = BPlusTree(degree=3)
+            augmented = AugmentedBPlusTree(degree=3, fields={'value': lambda value: value})
+            self.results['aggregate']['insert'].append(
+                self._measure_time(lambda: [plain.insert(key, key) for key in data]))
+            self.results['aggregate']['augmented_insert'].append(
+                self._measure_time(lambda: [augmented.insert(key, key) for key in data]))
+
+            bounds = [sorted(random.sample(range(size * 10), 2)) for _ in range(queries)]
+            def count_range():
+                for start, end in bounds:
+                    augmented.count_range(start, end)
+            def range_count():
+                for start, end in bounds:
+                    len(plain.range_query(start, end))
+            def summed():
+                for start, end in bounds:
+                    augmented.aggregate('value', start, end)
+            def scan_sum():
+                for start, end in bounds:
+                    sum(value for _, value in plain.range_query(start, end))
+            for start, end in bounds[:10]:
+                expected = plain.range_query(start, end)
+                assert augmented.count_range(start, end) == len(expected)
+                assert augmented.aggregate('value', start, end)['sum'] == sum(value for _, value in expected)
+            self.results['aggregate']['count_range'].append(self._measure_time(count_range) / queries)
+            self.results['aggregate']['range_count'].append(self._measure_time(range_count) / queries)
+            self.results['aggregate']['sum'].append(self._measure_time(summed) / queries)
+            self.results['aggregate']['scan_sum'].append(self._measure_time(scan_sum) / queries)
+            self.results['aggregate']['sizes'].append(size)
+
+    def print_aggregate_report(self) -> None:
+        """Print per-query times of summary-based and scan-based range aggregates."""
+        results = self.results['aggregate']
+        print(f"{'size':>10} {'count_range':>12} {'len(range)':>12} {'aggregate':>12} {'scan sum':>12} "
+              f"{'insert (s)':>11} {'augmented (s)':>14}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['count_range'][i]:>12.6f} {results['range_count'][i]:>12.6f} "
+                  f"{results['sum'][i]:>12.6f} {results['scan_sum'][i]:>12.6f} "
+                  f"{results['insert'][i]:>11.3f} {results['augmented_insert'][i]:>14.3f}")
+
+    def run_append_test(self, sizes: List[int]) -> None:
+        """Insert throughput and leaf fill factor for increasing keys vs random keys.
+
+        Increasing keys take the tail-leaf append path and split 90/10; random
+        keys descend and split 50/50. Results are inserts per second.
+        """
+        for size in sizes:
+            for workload, keys in (('sequential', list(range(size))), ('random', self.generate_test_data(size))):
+                tree = BPlusTree(degree=3)
+                elapsed = self._measure_time(lambda: [tree.insert(key, key) for key in keys])
+                assert tree.validate_tree()
+                self.results['append'][workload].append(size / elapsed)
+                self.results['append'][workload + '_fill'].append(tree.leaf_fill_factor())
+            self.results['append']['sizes'].append(size)
+
+    def print_append_report(self) -> None:
+        """Print insert throughput and leaf fill factor per workload."""
+        results = self.results['append']
+        print(f"{'size':>10} {'sequential/s':>13} {'fill':>6} {'random/s':>10} {'fill':>6}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['sequential'][i]:>13.0f} {results['sequential_fill'][i]:>6.0%} "
+                  f"{results['random'][i]:>10.0f} {results['random_fill'][i]:>6.0%}")
+
+    # The calls Table and the tree used to make for each write, before writes took one descent
+    _OLD_WRITES = {
+        'insert': lambda tree, key, row: (tree.search(key), tree.search(key), tree.insert(key, row)),
+        'update': lambda tree, key, row: (tree.get(key), tree.update(key, row)),
+        'delete': lambda tree, key, row: (tree.search(key), tree.delete(key)),
+    }
+
+    def run_write_path_test(self, sizes: List[int]) -> None:
+        """Node visits per table write on the single-descent path vs the old call sequence.
+
+        In memory the counter is the tree's root-to-leaf descents; on paged
+        storage it is the pages read through the buffer pool, i.e. every node
+        visited. Keys are random so inserts do not take the append path.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            for size in sizes:
+                keys = random.sample(range(size * 10), size)
+                for storage in ('memory', 'paged'):
+                    table = Table(f'writes_{size}', {'id': int, 'value': int}, 'id', storage=storage,
+                                  page_file=os.path.join(tmp, f'new_{size}.pages'))
+                    old = (BPlusTree(degree=3) if storage == 'memory'
+                           else PagedBPlusTree(os.path.join(tmp, f'old_{size}.pages')))
+                    def visits(tree) -> int:
+                        return tree.descents if storage == 'memory' else tree.pool.hits + tree.pool.misses
+                    new_writes = {
+                        'insert': lambda key: table.insert({'id': key, 'value': key}),
+                        'update': lambda key: table.update(key, {'value': -key}),
+                        'delete': lambda key: table.delete(key),
+                    }
+                    for op in ('insert', 'update', 'delete'):
+                        before = visits(table.index)
+                        for key in keys:
+                            assert new_writes[op](key)
+                        self.results['write_path'][storage][op].append((visits(table.index) - before) / size)
+
+                        before = visits(old)
+                        for key in keys:
+                            self._OLD_WRITES[op](old, key, {'id': key, 'value': -key if op == 'update' else key})
+                        self.results['write_path'][storage + '_old'][op].append((visits(old) - before) / size)
+                    if storage == 'paged':
+                        table.close()
+                        old.close()
+                self.results['write_path']['sizes'].append(size)
+
+    def print_write_path_report(self) -> None:
+        """Print descents (memory) and page reads (paged) per write, new path vs old."""
+        results = self.results['write_path']
+        for storage, unit in (('memory', 'descents'), ('paged', 'page reads')):
+            print(f"{unit} per write ({storage}):")
+            print(f"{'size':>10}" + ''.join(f" {op:>8} {'old':>6}" for op in ('insert', 'update', 'delete')))
+            for i, size in enumerate(results['sizes']):
+                print(f"{size:>10}" + ''.join(f" {results[storage][op][i]:>8.2f} {results[storage + '_old'][op][i]:>6.2f}"
+                                              for op in ('insert', 'update', 'delete')))
+
+    def run_row_memory_test(self, sizes: List[int] = (1_000_000,)) -> None:
+        """Deep size of a students-like table's index with tuple rows vs the old per-record dicts.
+
+        Everything reachable from the index root is counted once, keys and
+        column values included. The payload is the size of the column values alone.
+        """
+        columns = {'id': int, 'name': str, 'age': int, 'gpa': float}
+        for size in sizes:
+            records = [{'id': i, 'name': f'student{i}', 'age': 18 + i % 10, 'gpa': i % 400 / 100}
+                       for i in range(size)]
+            table = Table('students', columns, 'id')
+            table.insert_many(records)
+            dict_rows = BPlusTree(degree=3)
+            dict_rows.bulk_load((record['id'], record) for record in records)
+
+            self.results['row_memory']['tuple'].append(_deep_size(table.index.root) / size)
+            self.results['row_memory']['dict'].append(_deep_size(dict_rows.root) / size)
+            self.results['row_memory']['payload'].append(
+                sum(sys.getsizeof(value) for record in records for value in record.values()) / size)
+            self.results['row_memory']['sizes'].append(size)
+
+    def print_row_memory_report(self) -> None:
+        """Print index bytes per row for dict and tuple rows next to the payload size."""
+        results = self.results['row_memory']
+        print(f"{'rows':>10} {'dict B/row':>11} {'tuple B/row':>12} {'payload B/row':>14} {'saved':>7}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['dict'][i]:>11.0f} {results['tuple'][i]:>12.0f} "
+                  f"{results['payload'][i]:>14.0f} {1 - results['tuple'][i] / results['dict'][i]:>7.0%}")
+
+    def run_table_file_test(self, sizes: List[int]) -> None:
+        """File size, persist time and load time of the binary table format vs pickle.
+
+        The pickle file is what persist() used to write: the schema, then the
+        list of (key, row) pairs. Load times include rebuilding the index.
+        """
+        columns = {'id': int, 'name': str, 'age': int, 'gpa': float}
+        with tempfile.TemporaryDirectory() as tmp:
+            for size in sizes:
+                table = Table('students', columns, 'id')
+                table.insert_many([{'id': i, 'name': f'student{i}', 'age': 18 + i % 10, 'gpa': i % 400 / 100}
+                                   for i in range(size)])
+                for fmt in ('pickle', 'binary', 'zlib'):
+                    path = os.path.join(tmp, f'students_{fmt}')
+                    table.serialized_file = path
+                    table.compress = fmt == 'zlib'
+                    if fmt == 'pickle':
+                        def persist():
+                            with open(path, 'wb') as f:
+                                pickle.dump(table._schema(), f)
+                                pickle.dump(table.index.get_all(), f)
+                    else:
+                        persist = table.persist
+                    self.results['table_file'][fmt]['write'].append(self._measure_time(persist))
+                    self.results['table_file'][fmt]['bytes'].append(os.path.getsize(path))
+
+                    loaded = Table('students', {}, '')
+                    loaded.serialized_file = path
+                    gc.collect()  # Leave no garbage from the previous format to collect mid-load
+                    self.results['table_file'][fmt]['load'].append(self._measure_time(loaded.load))
+                    assert loaded.count() == size
+                    del loaded
+                self.results['table_file']['sizes'].append(size)
+
+    def print_table_file_report(self) -> None:
+        """Print file size, write and load time per table file format."""
+        results = self.results['table_file']
+        print(f"{'rows':>10} {'format':>7} {'MB':>8} {'write s':>8} {'load s':>8}")
+        for i, size in enumerate(results['sizes']):
+            for fmt in ('pickle', 'binary', 'zlib'):
+                print(f"{size:>10} {fmt:>7} {results[fmt]['bytes'][i] / 2 ** 20:>8.2f} "
+                      f"{results[fmt]['write'][i]:>8.3f} {results[fmt]['load'][i]:>8.3f}")
+
+    def run_frozen_test(self, sizes: List[int], lookups: int = 20000) -> None:
+        """Time to open a table from its .tbl file vs a frozen file, and point lookups on each.
+
+        Loading a .tbl file rebuilds the tree; opening a frozen file only maps
+        it. Lookup results are lookups per second on random existing keys.
+        """
+        columns = {'id': int, 'name': str, 'age': int, 'gpa': float}
+        with tempfile.TemporaryDirectory() as tmp:
+            for size in sizes:
+                table = Table('students', columns, 'id')
+                table.insert_many([{'id': i, 'name': f'student{i}', 'age': 18 + i % 10, 'gpa': i % 400 / 100}
+                                   for i in range(size)])
+                table.serialized_file = os.path.join(tmp, 'students.tbl')
+                table.persist()
+                table.freeze(os.path.join(tmp, 'students.frozen'))
+                del table
+
+                loaded = Table('students', {}, '')
+                loaded.serialized_file = os.path.join(tmp, 'students.tbl')
+                frozen = Table('students', {}, '', storage='frozen', page_file=os.path.join(tmp, 'students.frozen'))
+                self.results['frozen']['load'].append(self._measure_time(loaded.load))
+                self.results['frozen']['open'].append(self._measure_time(frozen.load))
+
+                keys = [random.randrange(size) for _ in range(lookups)]
+                for name, table in (('tree_get', loaded), ('frozen_get', frozen)):
+                    gc.collect()  # The first full collection after a load would land in the timing
+                    elapsed = self._measure_time(lambda: [table.select(key) for key in keys])
+                    self.results['frozen'][name].append(lookups / elapsed)
+                frozen.close()
+                self.results['frozen']['sizes'].append(size)
+
+    def print_frozen_report(self) -> None:
+        """Print open times and lookup rates for loaded and frozen tables."""
+        results = self.results['frozen']
+        print(f"{'rows':>10} {'load s':>8} {'open s':>9} {'tree get/s':>11} {'frozen get/s':>13}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['load'][i]:>8.3f} {results['open'][i]:>9.5f} "
+                  f"{results['tree_get'][i]:>11.0f} {results['frozen_get'][i]:>13.0f}")
+
+    def run_numpy_test(self, sizes: List[int], lookups: int = 100_000, updates: int = 100) -> None:
+        """Batch lookups and a filtered range aggregate on a NumPy view vs per-key loops over the tree (needs numpy).
+
+        Lookup results are lookups per second on random keys, half of them
+        present. The filter sums gpa over the middle half of the keys for rows
+        with age > 22. refresh is the time to bring the view up to date after
+        updates random writes.
+        """
+        from vectorized import NumpyView  # Optional dependency, only needed here
+        for size in sizes:
+            tree = BPlusTree(degree=3)
+            tree.bulk_load((i * 2, (i * 2, 18 + i % 10, i % 400 / 100)) for i in range(size))
+            start = time.perf_counter()
+            view = NumpyView(tree, {'age': 1, 'gpa': 2})
+            self.results['numpy']['build'].append(time.perf_counter() - start)
+
+            keys = [random.randrange(size * 2) for _ in range(lookups)]
+            elapsed = self._measure_time(lambda: [tree.get(key) for key in keys])
+            self.results['numpy']['loop_get'].append(lookups / elapsed)
+            elapsed = self._measure_time(view.get_many, keys)
+            self.results['numpy']['view_get'].append(lookups / elapsed)
+
+            low, high = size // 2, size * 3 // 2
+            self.results['numpy']['loop_filter'].append(self._measure_time(
+                lambda: sum(row[2] for _, row in tree.iter_range(low, high) if row[1] > 22)))
+            self.results['numpy']['view_filter'].append(self._measure_time(
+                lambda: view.aggregate('gpa', low, high, where=view.column('age') > 22)['sum']))
+
+            for _ in range(updates):
+                key = random.randrange(size) * 2
+                tree.insert(key, (key, 30, 1.0))
+            self.results['numpy']['refresh'].append(self._measure_time(view.refresh))
+            view.close()
+            self.results['numpy']['sizes'].append(size)
+
+    def print_numpy_report(self) -> None:
+        """Print NumPy view build and refresh times, lookup rates and filter times next to the per-key loops."""
+        results = self.results['numpy']
+        print(f"{'rows':>10} {'build s':>8} {'refresh s':>10} {'loop get/s':>11} {'view get/s':>11} "
+              f"{'loop filter s':>14} {'view filter s':>14}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['build'][i]:>8.3f} {results['refresh'][i]:>10.4f} "
+                  f"{results['loop_get'][i]:>11.0f} {results['view_get'][i]:>11.0f} "
+                  f"{results['loop_filter'][i]:>14.4f} {results['view_filter'][i]:>14.5f}")
+
+    def run_parallel_io_test(self, workers: List[int], tables: int = 16, rows: int = 50_000) -> None:
+        """Time to persist and eagerly load a database of many tables with each worker count.
+
+        Persists are timed with the thread pool and with forked processes;
+        every table is dirtied first so each persist writes them all.
+        """
+        columns = {'id': int, 'name': str, 'age': int, 'gpa': float}
+        records = [{'id': i, 'name': f'student{i}', 'age': 18 + i % 10, 'gpa': i % 400 / 100} for i in range(rows)]
+        with tempfile.TemporaryDirectory() as tmp:
+            name = os.path.join(tmp, 'tenants')
+            db = Database(name)
+            for i in range(tables):
+                db.create_table(f'tenant{i}', columns, 'id')
+                db.get_table(f'tenant{i}').insert_many(records)
+            for count in workers:
+                for processes in (False, True):
+                    db.workers, db.processes = count, processes
+                    for table in db.tables.values():
+                        table.upsert(records[0])
+                    elapsed = self._measure_time(db.persist)
+                    self.results['parallel_io']['persist_processes' if processes else 'persist_threads'].append(elapsed)
+                loaded = Database(name, workers=count)
+                self.results['parallel_io']['load'].append(self._measure_time(loaded.load, False))
+                loaded.tables.clear()
+                gc.collect()
+                self.results['parallel_io']['workers'].append(count)
+
+    def print_parallel_io_report(self) -> None:
+        """Print persist and load times of a many-table database for each worker count."""
+        results = self.results['parallel_io']
+        print(f"{'workers':>8} {'persist threads s':>18} {'persist procs s':>16} {'load s':>8}")
+        for i, count in enumerate(results['workers']):
+            print(f"{count:>8} {results['persist_threads'][i]:>18.3f} {results['persist_processes'][i]:>16.3f} "
+                  f"{results['load'][i]:>8.3f}")
+
+    def run_partitioned_test(self, size: int, partitions: int = 4, workers: List[int] = (1, 4)) -> None:
+        """count() and a select_range over half the keys, on one table vs hash and range partitioned ones.
+
+        The tables keep no aggregates, so count() reads every row; with more
+        than one worker the partitions are read on threads, and a count over
+        enough rows forks a process per partition.
+        """
+        columns = {'id': int, 'name': str, 'age': int, 'gpa': float}
+        records = [{'id': i, 'name': f'student{i}', 'age': 18 + i % 10, 'gpa': i % 400 / 100} for i in range(size)]
+        bounds = [size * i // partitions for i in range(1, partitions)]
+        with tempfile.TemporaryDirectory() as tmp:
+            layouts = [('single', 1, Table('students', columns, 'id'))]
+            for count in workers:
+                for spec in ({'by': 'hash', 'count': partitions}, {'by': 'range', 'bounds': bounds}):
+                    layouts.append((spec['by'], count, PartitionedTable(
+                        'students', columns, 'id', spec, directory=os.path.join(tmp, f"{spec['by']}{count}"),
+                        workers=count)))
+            for name, count, table in layouts:
+                table.insert_many(records)
+                self.results['partitioned']['count'].append(self._measure_time(table.count))
+                self.results['partitioned']['select_range'].append(
+                    self._measure_time(table.select_range, size // 4, size * 3 // 4))
+                self.results['partitioned']['layouts'].append(f"{name} x{count}" if name != 'single' else name)
+
+    def print_partitioned_report(self) -> None:
+        """Print count and range select times for each table layout."""
+        results = self.results['partitioned']
+        print(f"{'layout':>10} {'count s':>9} {'select_range s':>15}")
+        for i, layout in enumerate(results['layouts']):
+            print(f"{layout:>10} {results['count'][i]:>9.3f} {results['select_range'][i]:>15.3f}")
+
+    def run_join_test(self, sizes: List[int], probes: int = 100) -> None:
+        """Joins through Join vs select_all() on both tables and a dict join in client code.
+
+        Two tables of size rows joined on their primary keys (a merge join),
+        and a table of probes rows joined to a table of size rows on its
+        primary key (an index nested loop join from the small table).
+        """
+        for size in sizes:
+            students = Table('students', {'id': int, 'name': str, 'age': int}, 'id')
+            students.insert_many([{'id': i, 'name': f'student{i}', 'age': 18 + i % 10} for i in range(size)])
+            grades = Table('grades', {'student_id': int, 'gpa': float}, 'student_id')
+            grades.insert_many([{'student_id': i, 'gpa': i % 400 / 100} for i in range(0, size, 2)])
+            honors = Table('honors', {'hid': int, 'student_id': int}, 'hid')
+            honors.insert_many([{'hid': i, 'student_id': random.randrange(size)} for i in range(probes)])
+
+            def client_join(left, right, left_on, right_on):
+                by_key = {record[right_on]: record for record in right.select_all()}
+                return [(record, by_key[record[left_on]]) for record in left.select_all()
+                        if record[left_on] in by_key]
+
+            results = self.results['join']
+            results['client_merge'].append(self._measure_time(client_join, students, grades, 'id', 'student_id'))
+            results['merge'].append(self._measure_time(Join(students, grades).run))
+            results['client_probe'].append(self._measure_time(client_join, honors, students, 'student_id', 'id'))
+            results['nested_loop'].append(self._measure_time(Join(honors, students, 'student_id').run))
+            results['sizes'].append(size)
+
+    def print_join_report(self) -> None:
+        """Print client-side and planned join times for each size."""
+        results = self.results['join']
+        print(f"{'size':>10} {'client pk join s':>17} {'merge join s':>13} {'client probe s':>15} {'nested loop s':>14}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['client_merge'][i]:>17.4f} {results['merge'][i]:>13.4f} "
+                  f"{results['client_probe'][i]:>15.4f} {results['nested_loop'][i]:>14.4f}")
+
+    def run_range_delete_test(self, sizes: List[int]) -> None:
+        """Delete the middle half of a tree's keys one by one, as one delete_many batch and with delete_range."""
+        for size in sizes:
+            keys = list(range(size))
+            doomed = keys[size // 4:size * 3 // 4]
+            trees = []
+            for _ in range(3):
+                tree = BPlusTree(degree=3)
+                tree.bulk_load([(key, key) for key in keys])
+                trees.append(tree)
+
+            def per_key(tree: BPlusTree) -> None:
+                for key in doomed:
+                    tree.delete(key)
+
+            results = self.results['range_delete']
+            results['per_key'].append(self._measure_time(per_key, trees[0]))
+            results['delete_many'].append(self._measure_time(trees[1].delete_many, doomed))
+            results['delete_range'].append(self._measure_time(trees[2].delete_range, doomed[0], doomed[-1]))
+            results['sizes'].append(size)
+
+    def print_range_delete_report(self) -> None:
+        """Print the time to delete half the keys each way."""
+        results = self.results['range_delete']
+        print(f"{'size':>10} {'per key s':>10} {'delete_many s':>14} {'delete_range s':>15}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['per_key'][i]:>10.4f} {results['delete_many'][i]:>14.4f} "
+                  f"{results['delete_range'][i]:>15.6f}")
+
+    def run_churn_test(self, sizes: List[int]) -> None:
+        """Churn session rows through a tree with eager and with relaxed deletes.
+
+        size sessions are live at once; each step expires one (ids are
+        assigned in order, lifetimes are random) and opens the next, for
+        2 * size steps. The relaxed tree is compacted whenever it has
+        COMPACT_THRESHOLD underfull leaves, as Database.commit would.
+        Rebalances count borrow/merge fixes made inline by the eager tree and
+        leaves repaired by compact() for the relaxed one.
+        """
+        for size in sizes:
+            results = self.results['churn']
+            for mode in ('eager', 'relaxed'):
+                tree = BPlusTree(degree=3)
+                tree.relaxed_deletes = mode == 'relaxed'
+                rng = random.Random(size)
+                expiry = [(rng.randrange(size * 2), key) for key in range(size)]
+                heapq.heapify(expiry)
+                tree.bulk_load((key, key) for key in range(size))
+                rebalances = [0]
+                fill_child = tree._fill_child
+
+                def counted_fill(parent, idx):
+                    rebalances[0] += 1
+                    fill_child(parent, idx)
+                tree._fill_child = counted_fill
+                compacting = [0.0]
+
+                def churn():
+                    for step in range(size * 2):
+                        _, key = heapq.heappop(expiry)
+                        tree.delete(key)
+                        tree.insert(size + step, step)
+                        heapq.heappush(expiry, (step + rng.randrange(size * 2), size + step))
+                        if tree.sparse_leaves >= COMPACT_THRESHOLD:
+                            start = time.perf_counter()
+                            rebalances[0] += tree.compact()
+                            compacting[0] += time.perf_counter() - start
+                results[mode].append(self._measure_time(churn))
+                results[mode + '_rebalances'].append(rebalances[0])
+                results[mode + '_fill'].append(tree.leaf_fill_factor())
+            results['compact'].append(compacting[0])
+            results['sizes'].append(size)
+
+    def print_churn_report(self) -> None:
+        """Print churn time, rebalancing work and final leaf occupancy with eager and relaxed deletes."""
+        results = self.results['churn']
+        print(f"{'size':>10} {'eager s':>9} {'relaxed s':>10} {'compact s':>10} "
+              f"{'eager fixes':>12} {'compacted':>10} {'eager fill':>11} {'relaxed fill':>13}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['eager'][i]:>9.3f} {results['relaxed'][i]:>10.3f} "
+                  f"{results['compact'][i]:>10.3f} {results['eager_rebalances'][i]:>12} "
+                  f"{results['relaxed_rebalances'][i]:>10} {results['eager_fill'][i]:>11.2f} "
+                  f"{results['relaxed_fill'][i]:>13.2f}")
+
+    def run_memtable_test(self, sizes: List[int], buffer_size: int = MEMTABLE_SIZE,
+                          lookups: int = 10000) -> None:
+        """Compare ingest into a plain tree with ingest through a memtable, and the reads that pay for it.
+
+        Ingest writes size keys in ascending order, in shuffled order and as
+        overwrites of a hot set of buffer_size // 2 keys, including the final
+        flush. The read test fills both trees with the shuffled keys, leaves
+        the buffered one holding half a buffer of updates, then times random
+        gets and 10-row range scans against each.
+        """
+        for size in sizes:
+            results = self.results['memtable']
+            ordered = list(range(size))
+            shuffled = self.generate_test_data(size)
+            hot = [random.randrange(buffer_size // 2) for _ in range(size)]
+            for order, keys in (('hot', hot), ('sequential', ordered), ('random', shuffled)):
+                tree = BPlusTree(degree=3)
+                results[order].append(self._measure_time(lambda: [tree.insert(key, key) for key in keys]))
+                buffered = BufferedBPlusTree(degree=3, buffer_size=buffer_size)
+
+                def ingest():
+                    for key in keys:
+                        buffered.insert(key, key)
+                    buffered.flush()
+                results['buffered_' + order].append(self._measure_time(ingest))
+            for key in random.sample(shuffled, min(buffer_size // 2, size)):
+                buffered.update(key, -key)
+            probes = random.choices(shuffled, k=lookups)
+            for name, reader in (('', tree), ('buffered_', buffered)):
+                results[name + 'get'].append(self._measure_time(
+                    lambda: [reader.get(key) for key in probes]) / lookups)
+                results[name + 'scan'].append(self._measure_time(
+                    lambda: [list(reader.iter_range(key, None, 10)) for key in probes]) / lookups)
+            results['sizes'].append(size)
+
+    def print_memtable_report(self) -> None:
+        """Print ingest time with and without a memtable, and per-read latency it adds."""
+        results = self.results['memtable']
+        print(f"{'size':>10} {'seq s':>8} {'buf seq s':>10} {'rand s':>8} {'buf rand s':>11} "
+              f"{'hot s':>8} {'buf hot s':>10} {'get us':>8} {'buf get us':>11} {'scan us':>8} {'buf scan us':>12}")
+        for i, size in enumerate(results['sizes']):
+            print(f"{size:>10} {results['sequential'][i]:>8.3f} {results['buffered_sequential'][i]:>10.3f} "
+                  f"{results['random'][i]:>8.3f} {results['buffered_random'][i]:>11.3f} "
+                  f"{results['hot'][i]:>8.3f} {results['buffered_hot'][i]:>10.3f} "
+                  f"{results['get'][i] * 1e6:>8.2f} {results['buffered_get'][i] * 1e6:>11.2f} "
+                  f"{results['scan'][i] * 1e6:>8.2f} {results['buffered_scan'][i] * 1e6:>12.2f}")
+
     def run_all_tests(self, sizes: List[int]) -> None:
         """Run all performance tests."""
         self.run_insertion_test(sizes)
@@ -139,6 +1053,8 @@ class PerformanceAnalyzer:
     
     def plot_results(self) -> None:
         """Plot the performance comparison results."""
+        import matplotlib.pyplot as plt  # Optional dependency, only needed here
+
         plt.figure(figsize=(15, 10))
         
         # Insertion Performance
@@ -0,0 +1,529 @@
+# query.py
+import heapq
+import math
+import re
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+OPERATORS = {'=': '==', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+FUNCTIONS = ('count', 'sum', 'min', 'max', 'avg')
+
+def compile_filter(predicates: Sequence[Tuple[int, str, Any]]) -> Callable[[Tuple], bool]:
+    """Compile AND-ed (column position, operator, value) predicates into one function over row tuples.
+
+    The function is generated once as a single expression, so testing a row
+    costs one call rather than one per predicate. Ordering comparisons are
+    false for None values instead of raising.
+    """
+    if not predicates:
+        return lambda row: True
+    terms = []
+    constants = {}
+    for i, (position, op, value) in enumerate(predicates):
+        constants[f'_v{i}'] = value
+        term = f'row[{position}] {OPERATORS[op]} _v{i}'
+        if op not in ('=', '!='):
+            term = f'(row[{position}] is not None and {term})'
+        terms.append(term)
+    return eval(f"lambda row: {' and '.join(terms)}", constants)
+
+def _sort_key(position: int) -> Callable[[Tuple], Tuple]:
+    # None sorts after every value instead of failing to compare
+    return lambda row: (row[position] is None, row[position])
+
+def _checked(table, column: str, op: str, value):
+    """value for a predicate on table's column, converted from text to the column's numeric type."""
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator: {op}")
+    if value is None and op not in ('=', '!='):
+        raise ValueError("Only = and != compare with null")
+    column_type = table.columns[column]
+    if isinstance(value, str) and column_type in (int, float):
+        try:
+            value = column_type(value)
+        except ValueError:
+            raise ValueError(f"Value for column '{column}' must be {column_type.__name__}") from None
+    return value
+
+class Query:
+    """A query over one table: AND-ed predicates, projection, ordering, a limit and aggregates.
+
+    where holds (column, operator, value) triples with operators =, !=, <,
+    <=, > and >=. Planning picks one access path: a primary key lookup or
+    range scan, or an equality or range lookup on a secondary index, in that
+    order of preference, else a full scan. Predicates the access path
+    already enforces are dropped and the rest are compiled once into a row
+    filter (compile_filter) applied to row tuples as the scan streams them,
+    so only matching rows become dicts. A limit ends the scan early when the
+    rows already come in the requested order. aggregates holds (function,
+    column) pairs, column None or '*' for count(*); sums, minimums and
+    maximums over a key range with no other predicates are read from the
+    table's subtree summaries when it keeps them.
+    """
+
+    def __init__(self, table, where: Sequence[Tuple[str, str, Any]] = (), columns: Optional[Sequence[str]] = None,
+                 order_by: Optional[str] = None, descending: bool = False, limit: Optional[int] = None,
+                 aggregates: Sequence[Tuple[str, Optional[str]]] = ()):
+        self.table = table
+        self.positions = {column: i for i, column in enumerate(table.columns)}
+        self.where = [self._predicate(*predicate) for predicate in where]
+        self.columns = list(columns) if columns else list(table.columns)
+        for column in self.columns + ([order_by] if order_by else []):
+            self._position(column)
+        self.aggregates = [(function, None if column in (None, '*') else column) for function, column in aggregates]
+        for function, column in self.aggregates:
+            if function not in FUNCTIONS:
+                raise ValueError(f"Unknown aggregate: {function}")
+            if column is not None:
+                self._position(column)
+            elif function != 'count':
+                raise ValueError(f"{function}() needs a column")
+        if self.aggregates and columns:
+            raise ValueError("Cannot select columns alongside aggregates")
+        if limit is not None and limit < 0:
+            raise ValueError("LIMIT must not be negative")
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+        self._plan()
+
+    def _position(self, column: str) -> int:
+        if column not in self.positions:
+            raise ValueError(f"Column '{column}' not found")
+        return self.positions[column]
+
+    def _predicate(self, column: str, op: str, value) -> Tuple[str, str, Any]:
+        self._position(column)
+        return column, op, _checked(self.table, column, op, value)
+
+    def _bounds(self, column: str) -> Tuple[Any, Any, bool]:
+        """Inclusive bounds the predicates put on column, and whether it is pinned to one value."""
+        low = high = None
+        equal = False
+        for name, op, value in self.where:
+            if name != column or value is None:
+                continue  # None orders against nothing, so the row filter tests it
+            if op in ('=', '>=', '>') and (low is None or value > low):
+                low = value
+            if op in ('=', '<=', '<') and (high is None or value < high):
+                high = value
+            equal = equal or op == '='
+        return low, high, equal
+
+    def _plan(self) -> None:
+        """Choose the access path and the predicates left for the row filter."""
+        primary_key = self.table.primary_key
+        candidates = [(primary_key, self._bounds(primary_key))]
+        candidates += [(column, self._bounds(column)) for column in self.table.secondary_indexes]
+        # Equality beats a range, the primary key beats a secondary index; index ranges need both bounds
+        ranked = [(not equal, column != primary_key, column, low, high)
+                  for column, (low, high, equal) in candidates
+                  if equal or (column == primary_key and (low is not None or high is not None))
+                  or (low is not None and high is not None)]
+        if ranked:
+            _, _, self.access, self.low, self.high = min(ranked, key=itemgetter(0, 1))
+        else:
+            self.access, self.low, self.high = None, None, None
+        # Inclusive bounds and equalities on the access column are enforced by the access path itself
+        residual = [(column, op, value) for column, op, value in self.where
+                    if not (column == self.access and op in ('=', '>=', '<=') and value is not None)]
+        self.residual = residual
+        self.filter = compile_filter([(self.positions[column], op, value) for column, op, value in residual])
+
+    def explain(self) -> str:
+        """One line describing the access path and the filter."""
+        if self.access is None:
+            path = "full scan"
+        elif self.low is not None and self.low == self.high:
+            path = f"{'primary key' if self.access == self.table.primary_key else 'index'} lookup {self.access} = {self.low!r}"
+        else:
+            kind = 'primary key range scan' if self.access == self.table.primary_key else 'index range scan'
+            path = f"{kind} {self.access} in [{self.low!r}, {self.high!r}]"
+        if self.residual:
+            path += " filter " + " and ".join(f"{column} {op} {value!r}" for column, op, value in self.residual)
+        return path
+
+    def _ordered(self) -> bool:
+        """Whether the access path yields rows in the requested order."""
+        if self.order_by is None:
+            return True
+        if self.access in (None, self.table.primary_key):
+            return self.order_by == self.table.primary_key
+        return self.order_by == self.access and not self.descending
+
+    def _source(self, limit: Optional[int]) -> Iterator[Tuple]:
+        """Rows from the access path; limit caps them only when no filter can drop rows."""
+        table = self.table
+        if self.access is None or self.access == table.primary_key:
+            reverse = self.descending and self.order_by == table.primary_key
+            return table.scan_rows(self.low, self.high, limit if not self.residual else None, reverse)
+        if self.low == self.high:
+            records = table.select_by(self.access, self.low)
+        else:
+            records = table.select_by_range(self.access, self.low, self.high)
+        return (tuple(record.values()) for record in records)
+
+    def _rows(self) -> Iterator[Tuple]:
+        ordered = self._ordered()
+        rows = filter(self.filter, self._source(self.limit if ordered else None))
+        if not ordered:
+            key = _sort_key(self.positions[self.order_by])
+            if self.limit is not None:
+                select = heapq.nlargest if self.descending else heapq.nsmallest
+                return iter(select(self.limit, rows, key=key))
+            return iter(sorted(rows, key=key, reverse=self.descending))
+        return islice(rows, self.limit)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Stream the matching records, projected to the selected columns."""
+        if self.aggregates:
+            raise ValueError("Aggregate queries return one result; use run()")
+        positions = [self.positions[column] for column in self.columns]
+        for row in self._rows():
+            yield {column: row[position] for column, position in zip(self.columns, positions)}
+
+    def _pushed_down(self) -> Optional[Dict[str, Any]]:
+        """Aggregates answered from the table's summaries without reading rows, if possible."""
+        if self.residual or self.access not in (None, self.table.primary_key):
+            return None
+        if any(function == 'avg' or (function == 'count' and column is not None)
+               or (function != 'count' and column not in self.table.aggregates)
+               for function, column in self.aggregates):
+            return None
+        results = {}
+        for function, column in self.aggregates:
+            if function == 'count':
+                results['count(*)'] = self.table.count(self.low, self.high)
+            else:
+                results[f'{function}({column})'] = self.table.aggregate(column, self.low, self.high)[function]
+        return results
+
+    def run(self):
+        """The matching records as a list, or for an aggregate query a dict of results by name."""
+        if not self.aggregates:
+            return list(self.records())
+        results = self._pushed_down()
+        if results is not None:
+            return results
+        counts = [0] * len(self.aggregates)
+        values = [None] * len(self.aggregates)
+        # Like SQL, ORDER BY and LIMIT apply to the single result row, not to the rows aggregated
+        for row in filter(self.filter, self._source(None)):
+            for i, (function, column) in enumerate(self.aggregates):
+                value = None if column is None else row[self.positions[column]]
+                if column is not None and value is None:
+                    continue
+                counts[i] += 1
+                if function in ('sum', 'avg'):
+                    values[i] = value if values[i] is None else values[i] + value
+                elif function == 'min' and (values[i] is None or value < values[i]):
+                    values[i] = value
+                elif function == 'max' and (values[i] is None or value > values[i]):
+                    values[i] = value
+        results = {}
+        for (function, column), count, value in zip(self.aggregates, counts, values):
+            name = f"{function}({column or '*'})"
+            if function == 'count':
+                results[name] = count
+            elif function == 'sum':
+                results[name] = value if value is not None else 0
+            elif function == 'avg':
+                results[name] = value / count if count else None
+            else:
+                results[name] = value
+        return results
+
+JOIN_BATCH = 256  # outer rows whose join keys are probed together in one sorted get_rows batch
+
+class Join:
+    """An inner equi-join of two tables, streaming combined records.
+
+    Rows match when left's left_on column equals right's right_on column
+    (each defaults to the table's primary key); None matches nothing.
+    Result records are keyed 'table.column', and columns, where and limit
+    take those names, or bare column names that only one table has. Each
+    predicate in where tests one table's column, so it is compiled into
+    that table's row filter and applied before rows are joined.
+
+    The planner picks one of three strategies from the tables' estimated
+    sizes (estimated_rows):
+      merge: both sides join on their primary keys, so both leaf chains
+        are read in key order side by side, once each;
+      index nested loop: the inner side joins on its primary key or an
+        indexed column, so the outer side is scanned and each outer row's
+        key is looked up in the inner side's index, JOIN_BATCH keys at a
+        time (sorted, so each inner leaf is read at most once per batch);
+      hash: neither side is indexed on its join column, so the smaller
+        side is read into a dict and the larger one streamed past it.
+    A merge costs about n + m row reads and a nested loop about
+    outer * log2(inner), so a nested loop from the small side wins when the
+    tables differ greatly in size.
+    """
+
+    def __init__(self, left, right, left_on: Optional[str] = None, right_on: Optional[str] = None,
+                 columns: Optional[Sequence[str]] = None, where: Sequence[Tuple[str, str, Any]] = (),
+                 limit: Optional[int] = None):
+        if left.name == right.name:
+            raise ValueError("Cannot join a table with itself")
+        self.left, self.right = left, right
+        self.left_on = left_on or left.primary_key
+        self.right_on = right_on or right.primary_key
+        for table, column in ((left, self.left_on), (right, self.right_on)):
+            if column not in table.columns:
+                raise ValueError(f"Column '{column}' not found in table '{table.name}'")
+        # Positions in the combined row, which is the left row followed by the right row
+        names = [f'{left.name}.{column}' for column in left.columns]
+        names += [f'{right.name}.{column}' for column in right.columns]
+        self.positions = {name: i for i, name in enumerate(names)}
+        bare = [name.split('.', 1)[1] for name in names]
+        for i, name in enumerate(bare):
+            if bare.count(name) == 1:
+                self.positions[name] = i
+        self.columns = [names[self._position(column)] for column in columns] if columns else names
+        self._indexes = [self._position(column) for column in self.columns]
+        if limit is not None and limit < 0:
+            raise ValueError("LIMIT must not be negative")
+        self.limit = limit
+        filters: Tuple[List, List] = ([], [])
+        for column, op, value in where:
+            position = self._position(column)
+            side = 0 if position < len(left.columns) else 1
+            table = (left, right)[side]
+            name = names[position].split('.', 1)[1]
+            filters[side].append((list(table.columns).index(name), op, _checked(table, name, op, value)))
+        self.where = list(where)
+        self.left_filter = compile_filter(filters[0])
+        self.right_filter = compile_filter(filters[1])
+        self._plan()
+
+    def _position(self, column: str) -> int:
+        if column not in self.positions:
+            raise ValueError(f"Column '{column}' not found, or in both tables")
+        return self.positions[column]
+
+    @staticmethod
+    def _indexed(table, column: str) -> bool:
+        return column == table.primary_key or column in table.secondary_indexes
+
+    def _plan(self) -> None:
+        """Choose the strategy, and for a nested loop or hash join which side is outer."""
+        sizes = (self.left.estimated_rows(), self.right.estimated_rows())
+        indexed = (self._indexed(self.left, self.left_on), self._indexed(self.right, self.right_on))
+        # Estimated rows read, with (strategy, outer side) for each possible plan
+        plans = []
+        if self.left_on == self.left.primary_key and self.right_on == self.right.primary_key:
+            plans.append((sizes[0] + sizes[1], 'merge', None))
+        for outer in (0, 1):
+            if indexed[1 - outer]:
+                probe = max(1.0, math.log2(sizes[1 - outer] + 1))
+                plans.append((sizes[outer] * probe, 'index nested loop', outer))
+        if not plans:
+            outer = 0 if sizes[0] >= sizes[1] else 1  # The smaller side is built into the dict
+            plans.append((sizes[0] + sizes[1], 'hash', outer))
+        self.cost, self.strategy, self.outer = min(plans, key=itemgetter(0))
+        self.sizes = sizes
+
+    def explain(self) -> str:
+        """One line describing the strategy, with the estimated table sizes."""
+        tables = (self.left.name, self.right.name)
+        if self.strategy == 'merge':
+            path = f"merge join {tables[0]}.{self.left_on} = {tables[1]}.{self.right_on}"
+        elif self.strategy == 'hash':
+            path = f"hash join, building on {tables[1 - self.outer]}, probing with {tables[self.outer]}"
+        else:
+            inner = 1 - self.outer
+            column = (self.left_on, self.right_on)[inner]
+            kind = 'primary key' if column == (self.left, self.right)[inner].primary_key else 'index'
+            path = f"index nested loop join: scan {tables[self.outer]}, look up {tables[inner]}.{column} by {kind}"
+        path += f" (estimated rows: {tables[0]} {self.sizes[0]}, {tables[1]} {self.sizes[1]})"
+        if self.where:
+            path += " filter " + " and ".join(f"{column} {op} {value!r}" for column, op, value in self.where)
+        return path
+
+    def _merge(self) -> Iterator[Tuple]:
+        left_key = list(self.left.columns).index(self.left_on)
+        right_key = list(self.right.columns).index(self.right_on)
+        rights = self.right.scan_rows()
+        right = next(rights, None)
+        for left in self.left.scan_rows():
+            key = left[left_key]
+            while right is not None and right[right_key] < key:
+                right = next(rights, None)
+            if right is None:
+                return
+            if right[right_key] == key and self.left_filter(left) and self.right_filter(right):
+                yield left + right
+
+    def _sides(self):
+        """(outer table, its join column, its filter, inner table, its join column, its filter)."""
+        sides = ((self.left, self.left_on, self.left_filter), (self.right, self.right_on, self.right_filter))
+        return sides[self.outer] + sides[1 - self.outer]
+
+    def _nested_loop(self) -> Iterator[Tuple]:
+        outer, outer_on, outer_filter, inner, inner_on, inner_filter = self._sides()
+        key = list(outer.columns).index(outer_on)
+        rows = (row for row in filter(outer_filter, outer.scan_rows()) if row[key] is not None)
+        while True:
+            batch = list(islice(rows, JOIN_BATCH))
+            if not batch:
+                return
+            keys = [row[key] for row in batch]
+            if inner_on == inner.primary_key:
+                matches = [[] if row is None else [row] for row in inner.get_rows(keys)]
+            else:
+                found = {value: [tuple(record.values()) for record in inner.select_by(inner_on, value)]
+                         for value in set(keys)}
+                matches = [found[value] for value in keys]
+            for row, inner_rows in zip(batch, matches):
+                for inner_row in filter(inner_filter, inner_rows):
+                    yield row + inner_row if self.outer == 0 else inner_row + row
+
+    def _hash(self) -> Iterator[Tuple]:
+        outer, outer_on, outer_filter, inner, inner_on, inner_filter = self._sides()
+        inner_key = list(inner.columns).index(inner_on)
+        table: Dict[Any, List[Tuple]] = {}
+        for row in filter(inner_filter, inner.scan_rows()):
+            if row[inner_key] is not None:
+                table.setdefault(row[inner_key], []).append(row)
+        key = list(outer.columns).index(outer_on)
+        for row in filter(outer_filter, outer.scan_rows()):
+            for inner_row in table.get(row[key], ()):
+                yield row + inner_row if self.outer == 0 else inner_row + row
+
+    def rows(self) -> Iterator[Tuple]:
+        """Stream the combined rows: the left row's values followed by the right row's."""
+        if self.strategy == 'merge':
+            rows = self._merge()
+        elif self.strategy == 'hash':
+            rows = self._hash()
+        else:
+            rows = self._nested_loop()
+        return islice(rows, self.limit)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Stream the joined records, projected to the selected columns."""
+        for row in self.rows():
+            yield {column: row[i] for column, i in zip(self.columns, self._indexes)}
+
+    def run(self) -> List[Dict[str, Any]]:
+        """The joined records as a list."""
+        return list(self.records())
+
+_TOKEN = re.compile(r"\s*(?:(<=|>=|!=|[=<>(),*])|'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"|([^\s=<>!(),*'\"]+))")
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    """Split query text into (kind, value) tokens: 'op', 'str' or 'word'."""
+    tokens = []
+    text = text.strip()
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unexpected text: {text[position:]}")
+        symbol, single, double, word = match.groups()
+        if symbol is not None:
+            tokens.append(('op', symbol))
+        elif word is not None:
+            tokens.append(('word', word))
+        else:
+            tokens.append(('str', re.sub(r'\\(.)', r'\1', single if single is not None else double)))
+        position = match.end()
+    return tokens
+
+def _literal(kind: str, value: str):
+    if kind == 'str':
+        return value
+    if kind != 'word':
+        raise ValueError(f"Expected a value, got {value!r}")
+    lowered = value.lower()
+    if lowered in ('null', 'none'):
+        return None
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+def parse_query(text: str) -> Dict[str, Any]:
+    """Parse query text into Query keyword arguments.
+
+    The syntax is SQL's SELECT without SELECT and FROM:
+        [* | column, ... | function(column|*), ...] [where column op value [and ...]]
+        [order by column [asc|desc]] [limit n]
+    Values are numbers, quoted strings, bare words, true, false or null.
+    """
+    tokens = _tokenize(text)
+    i = 0
+
+    def peek_word(*words: str) -> bool:
+        return i < len(tokens) and tokens[i][0] == 'word' and tokens[i][1].lower() in words
+
+    def expect(kind: str, value: Optional[str] = None) -> str:
+        nonlocal i
+        if i >= len(tokens) or tokens[i][0] != kind or (value is not None and tokens[i][1].lower() != value):
+            found = tokens[i][1] if i < len(tokens) else 'end of query'
+            raise ValueError(f"Expected {value or kind}, got {found!r}")
+        i += 1
+        return tokens[i - 1][1]
+
+    query: Dict[str, Any] = {}
+    columns, aggregates = [], []
+    if i < len(tokens) and tokens[i] == ('op', '*'):
+        i += 1
+    elif i < len(tokens) and not peek_word('where', 'order', 'limit'):
+        while True:
+            name = expect('word')
+            if i < len(tokens) and tokens[i] == ('op', '('):
+                i += 1
+                if i < len(tokens) and tokens[i] == ('op', '*'):
+                    i += 1
+                    column = '*'
+                else:
+                    column = expect('word')
+                expect('op', ')')
+                aggregates.append((name.lower(), column))
+            else:
+                columns.append(name)
+            if i < len(tokens) and tokens[i] == ('op', ','):
+                i += 1
+                continue
+            break
+    if columns:
+        query['columns'] = columns
+    if aggregates:
+        query['aggregates'] = aggregates
+
+    if peek_word('where'):
+        i += 1
+        where = []
+        while True:
+            column = expect('word')
+            op = expect('op')
+            if i >= len(tokens):
+                raise ValueError("Expected a value, got end of query")
+            where.append((column, op, _literal(*tokens[i])))
+            i += 1
+            if not peek_word('and'):
+                break
+            i += 1
+        query['where'] = where
+    if peek_word('order'):
+        i += 1
+        expect('word', 'by')
+        query['order_by'] = expect('word')
+        if peek_word('asc', 'desc'):
+            query['descending'] = tokens[i][1].lower() == 'desc'
+            i += 1
+    if peek_word('limit'):
+        i += 1
+        try:
+            query['limit'] = int(expect('word'))
+        except ValueError:
+            raise ValueError("LIMIT needs a whole number") from None
+    if i < len(tokens):
+        raise ValueError(f"Unexpected {tokens[i][1]!r}")
+    return query
@@ -0,0 +1,99 @@
+# secondary_index.py
+from typing import Any, Iterable, Iterator, List, Tuple
+from bplustree import BPlusTree
+
+def _kind(value) -> Any:
+    """Values of one kind can be ordered against each other: all numbers, or all of one type."""
+    return 'number' if isinstance(value, (int, float)) else type(value)
+
+class SecondaryIndex:
+    """Index on a non-primary-key column: a tree of (column value, primary key) entries, one per row.
+
+    Adding or removing a row costs one descent however many rows share its
+    value. Nulls (None) sort before every other value and match only
+    lookups of None. The other values must be of one kind, so the tree can
+    order them, and values of another kind are rejected with ValueError.
+    """
+
+    def __init__(self, column: str, unique: bool = False, degree: int = 3):
+        self.column = column
+        self.unique = unique
+        self.tree = BPlusTree(degree=degree)
+        self.kind = None  # Kind of the non-null values indexed so far
+
+    @staticmethod
+    def _entry(value, pk) -> Tuple:
+        # The flag keeps None from ever being compared with another value
+        return value is not None, value, pk
+
+    def _orderable(self, value) -> bool:
+        return value is None or self.kind is None or _kind(value) == self.kind
+
+    def _duplicate(self, value) -> ValueError:
+        return ValueError(f"Duplicate value {value!r} in unique column '{self.column}'")
+
+    def build(self, rows: Iterable[Tuple[Any, Any]]) -> None:
+        """Rebuild the index from (primary key, column value) pairs."""
+        entries = []
+        kind = None
+        for pk, value in rows:
+            if value is not None:
+                if kind is None:
+                    kind = _kind(value)
+                elif _kind(value) != kind:
+                    raise ValueError(f"Column '{self.column}' mixes values that cannot be ordered, "
+                                     f"such as {value!r}")
+            entries.append(self._entry(value, pk))
+        entries.sort()
+        if self.unique:
+            for entry, following in zip(entries, entries[1:]):
+                if entry[:2] == following[:2]:
+                    raise self._duplicate(entry[1])
+        self.tree.bulk_load((entry, None) for entry in entries)
+        self.kind = kind
+
+    def check(self, value, pk) -> None:
+        """Raise ValueError if value cannot be indexed for pk: of another kind, or a duplicate in a unique column."""
+        if not self._orderable(value):
+            raise ValueError(f"Value {value!r} for column '{self.column}' cannot be ordered "
+                             f"against its other values")
+        if self.unique:
+            for other in self._pks(value):
+                if other != pk:
+                    raise self._duplicate(value)
+
+    def add(self, value, pk) -> None:
+        if value is not None and self.kind is None:
+            self.kind = _kind(value)
+        self.tree.insert(self._entry(value, pk))
+
+    def remove(self, value, pk) -> None:
+        self.tree.delete(self._entry(value, pk))
+
+    def _pks(self, value) -> Iterator:
+        """Lazily yield the primary keys of rows whose column equals value, in order."""
+        present = value is not None
+        for (flag, found, pk), _ in self.tree.iter_range((present, value)):
+            if flag != present or found != value:
+                return
+            yield pk
+
+    def lookup(self, value) -> List:
+        """Primary keys of rows whose column equals value."""
+        if not self._orderable(value):
+            return []  # Nothing of another kind is ever indexed
+        return list(self._pks(value))
+
+    def range(self, start, end) -> List:
+        """Primary keys of rows whose column lies in [start, end], in column order.
+
+        Either bound may be None for no bound; null values are never in a range.
+        """
+        if not (self._orderable(start) and self._orderable(end)):
+            return []
+        pks = []
+        for (_, value, pk), _ in self.tree.iter_range((True,) if start is None else (True, start)):
+            if end is not None and value > end:
+                break
+            pks.append(pk)
+        return pks
@@ -1,82 +1,754 @@
 # table.py
+import gc
+import os
 import pickle
-from typing import Dict, List, Tuple, Optional, Any
-from bplustree import BPlusTree
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterator, List, Tuple, Optional, Any
+from augmented import AugmentedBPlusTree
+from bplustree import BPlusTree, WriteStatus
+from concurrency import ConcurrentBPlusTree, RWLatch
+from frozen import FrozenIndex, write_frozen
+from memtable import BufferedBPlusTree
+from pager import PagedBPlusTree, BUFFER_POOL_SIZE
+from secondary_index import SecondaryIndex
+from tablefile import is_table_file, read_rows, read_schema, write_table
+
+STORAGE_TYPES = ('memory', 'paged', 'frozen')
+NUMERIC_TYPES = (int, float)
+KEY_LOCK_STRIPES = 64  # locks ordering concurrent writes to the same primary key
+_gc_pause_lock = threading.Lock()
+_gc_pauses = 0  # loads currently inside _gc_paused()
+_gc_was_enabled = False
+
+@contextmanager
+def _gc_paused():
+    """Pause cyclic garbage collection while a load builds rows and nodes.
+
+    Everything a load creates stays alive, so collections during it would
+    only rescan the growing table; that doubled load times. Loads running on
+    several threads share one pause, which ends when the last one finishes.
+    """
+    global _gc_pauses, _gc_was_enabled
+    with _gc_pause_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_pause_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
 
 class Table:
-    def __init__(self, name: str, columns: Dict[str, type], primary_key: str):
+    def __init__(self, name: str, columns: Dict[str, type], primary_key: str,
+                 storage: str = 'memory', buffer_pool_size: int = BUFFER_POOL_SIZE,
+                 page_file: Optional[str] = None, concurrent: bool = False, compress: bool = False,
+                 relaxed_deletes: bool = False, write_buffer: int = 0):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage type: {storage}")
         self.name = name
         self.columns = columns
         self.primary_key = primary_key
-        self.index = BPlusTree(degree=3)
-        self.serialized_file = f"{name}.pkl"  # This will be updated by the Database class
+        # Rows are stored as tuples of column values in schema order
+        self._positions = {column: i for i, column in enumerate(columns)}
+        self.storage = storage
+        # Concurrent tables may be read and written from many threads at once
+        self.concurrent = concurrent
+        self.compress = compress  # zlib-compress the blocks of an in-memory table's file
+        # An in-memory index leaves leaves underfull on delete until compact()
+        self.relaxed_deletes = relaxed_deletes
+        # An in-memory index buffers this many writes in a memtable
+        # (BufferedBPlusTree) before applying them; 0 turns it off
+        if concurrent and write_buffer:
+            raise ValueError(f"Table '{name}' cannot combine concurrent and write_buffer")
+        self.write_buffer = write_buffer
+        self._table_latch = RWLatch()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)] if concurrent else []
+        self.secondary_indexes: Dict[str, SecondaryIndex] = {}
+        # Numeric columns whose sum/min/max the index keeps per subtree
+        self.aggregates: List[str] = []
+        self.wal = None  # Set by the Database so writes are logged
+        # Bumped on every write; persist() is skipped while nothing changed
+        self.generation = 0
+        self.persisted_generation = -1
+        # Log sequence number of the last logged write in the table's file;
+        # replay skips the table's log records up to it
+        self.checkpoint_lsn = 0
+        self.bytes_written = 0
+        # A lazily loaded table reads its rows on first use of self.index
+        self._index = None
+        self._load_lock = threading.Lock()
+        if storage == 'paged':
+            # Nodes live in a page file and are cached in a bounded buffer pool
+            self.serialized_file = page_file or f"{name}.pages"
+            self.index = PagedBPlusTree(self.serialized_file, buffer_pool_size=buffer_pool_size)
+        elif storage == 'frozen':
+            # A read-only file made by freeze(), mapped into memory on first use
+            self.serialized_file = page_file or f"{name}.frozen"
+        else:
+            self.index = self._new_index()
+            self.serialized_file = f"{name}.tbl"  # This will be updated by the Database class
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.materialize()
+        return self._index
+
+    @index.setter
+    def index(self, index) -> None:
+        self._index = index
+
+    @property
+    def materialized(self) -> bool:
+        """Whether the table's index has been built (always true unless loaded lazily)."""
+        return self._index is not None
+
+    def materialize(self) -> None:
+        """Read the rows of a lazily loaded table and build its index."""
+        with self._load_lock:
+            if self._index is not None:
+                return
+            if self.storage == 'frozen':
+                self._index = FrozenIndex(self.serialized_file)
+                return
+            with open(self.serialized_file, 'rb') as f, _gc_paused():
+                if is_table_file(f):
+                    read_schema(f)  # Already applied by load()
+                    self._build_index(self._read_pairs(f))
+                else:
+                    pickle.load(f)
+                    self._build_index(pickle.load(f))
+
+    def _new_index(self) -> BPlusTree:
+        if self.concurrent:
+            index = ConcurrentBPlusTree(degree=3)
+        elif self.write_buffer:
+            index = BufferedBPlusTree(degree=3, buffer_size=self.write_buffer)
+        elif self.aggregates:
+            index = AugmentedBPlusTree(degree=3, fields={column: itemgetter(self._positions[column])
+                                                         for column in self.aggregates})
+        else:
+            index = BPlusTree(degree=3)
+        index.relaxed_deletes = self.relaxed_deletes
+        return index
+
+    def _build_index(self, pairs: List[Tuple]) -> None:
+        # Rebuild the index; get_all() persisted the pairs in key order
+        if pairs and isinstance(pairs[0][1], dict):
+            pairs = [(pk, self._pack(record)) for pk, record in pairs]  # Written before rows were tuples
+        index = self._new_index()
+        index.bulk_load(pairs)
+        self._build_secondary(pairs)
+        self._index = index
+
+    def _read_pairs(self, f) -> List[Tuple]:
+        return list(read_rows(f, key=self._positions[self.primary_key]))
+
+    def _build_secondary(self, pairs: List[Tuple]) -> None:
+        for secondary in self.secondary_indexes.values():
+            position = self._positions[secondary.column]
+            secondary.build((pk, row[position]) for pk, row in pairs)
+
+    def _pack(self, record: Dict[str, Any]) -> Tuple:
+        """The row stored for record: its column values in schema order."""
+        return tuple([record[column] for column in self.columns])
+
+    def _unpack(self, row: Optional[Tuple]) -> Optional[Dict[str, Any]]:
+        """The record for a stored row, or None for no row."""
+        return None if row is None else dict(zip(self.columns, row))
     
+    @contextmanager
+    def _writing(self, primary_key_value=None):
+        """Order a write against others on a concurrent table.
+
+        Writes to different primary keys run in parallel, with the index's latches
+        keeping the tree consistent; writes to the same key are serialized so the
+        log records them in the order they were applied. Writes with no single key
+        (batches, create_index) and all writes to a table with secondary indexes,
+        whose unique checks span rows, take the table latch exclusively.
+        """
+        if self.storage == 'frozen':
+            raise ValueError(f"Table '{self.name}' is frozen and cannot be modified")
+        if not self.concurrent:
+            yield
+            return
+        while True:
+            if primary_key_value is None or self.secondary_indexes:
+                with self._table_latch.write():
+                    yield
+                return
+            with self._table_latch.read():
+                if not self.secondary_indexes:
+                    with self._key_locks[hash(primary_key_value) % KEY_LOCK_STRIPES]:
+                        yield
+                    return
+            # An index was created while we waited; take the exclusive path instead
+
+    @contextmanager
+    def _quiesced(self):
+        """Hold off writers to a concurrent table, so each write and its log record land on one side of a checkpoint."""
+        if not self.concurrent:
+            yield
+            return
+        with self._table_latch.write():
+            yield
+
+    def _log_position(self) -> int:
+        """Sequence number of the last record appended to the table's log (0 without a log)."""
+        return self.wal.appended_lsn if self.wal else 0
+
+    @contextmanager
+    def _reading(self):
+        """Keep writers out of the secondary indexes while one is read on a concurrent table."""
+        if not self.concurrent:
+            yield
+            return
+        with self._table_latch.read():
+            yield
+
     def insert(self, record: Dict[str, Any]) -> bool:
-        """Insert a record into the table."""
+        """Insert a record into the table. Returns False if its primary key already exists."""
+        return self.insert_if_absent(record) is WriteStatus.INSERTED
+
+    def insert_if_absent(self, record: Dict[str, Any]) -> WriteStatus:
+        """Insert a record unless its primary key exists. Returns INSERTED or EXISTS."""
         if not all(col in record for col in self.columns):
             raise ValueError("Missing columns in record")
-        
+
         pk_value = record[self.primary_key]
-        if self.index.search(pk_value):
-            return False  # Primary key already exists
-        
-        self.index.insert(pk_value, record)
-        return True
+        with self._writing(pk_value):
+            return self._insert_new(pk_value, record)
+
+    def _insert_new(self, pk_value, record: Dict[str, Any]) -> WriteStatus:
+        # Index checks must pass before the row lands, and an existing key wins over
+        # a unique violation, so only tables with a unique index look the key up first
+        if any(secondary.unique for secondary in self.secondary_indexes.values()):
+            if self.index.search(pk_value):
+                return WriteStatus.EXISTS
+        for secondary in self.secondary_indexes.values():
+            secondary.check(record[secondary.column], pk_value)
+
+        status = self.index.insert_if_absent(pk_value, self._pack(record))
+        if status is WriteStatus.INSERTED:
+            for secondary in self.secondary_indexes.values():
+                secondary.add(record[secondary.column], pk_value)
+            self._record_write('insert', record)
+        return status
+
+    def upsert(self, record: Dict[str, Any]) -> WriteStatus:
+        """Insert a record, or replace the row with its primary key. Returns INSERTED or REPLACED."""
+        if not all(col in record for col in self.columns):
+            raise ValueError("Missing columns in record")
+
+        pk_value = record[self.primary_key]
+        with self._writing(pk_value):
+            row = self._pack(record)
+            if not self.secondary_indexes:
+                status = self.index.insert(pk_value, row)
+            else:
+                status = self.index.modify(pk_value, lambda old: self._repoint(pk_value, old, record, row))
+                if status is WriteStatus.NOT_FOUND:
+                    return self._insert_new(pk_value, record)
+            self._record_write('upsert', record)
+            return status
     
     def select(self, primary_key_value) -> Optional[Dict[str, Any]]:
         """Select a record by primary key."""
-        return self.index.get(primary_key_value)
+        return self._unpack(self.index.get(primary_key_value))
     
     def update(self, primary_key_value, new_values: Dict[str, Any]) -> bool:
         """Update a record by primary key."""
-        record = self.select(primary_key_value)
-        if not record:
-            return False
-        
-        for col, value in new_values.items():
-            if col in record and col != self.primary_key:
-                record[col] = value
-        
-        return self.index.update(primary_key_value, record)
-    
+        def apply(row: Tuple) -> Tuple:
+            # Build the new version aside so concurrent readers see the old or the new record
+            updated = list(row)
+            for col, value in new_values.items():
+                if col in self._positions and col != self.primary_key:
+                    updated[self._positions[col]] = value
+            return self._repoint(primary_key_value, row, new_values, tuple(updated))
+
+        with self._writing(primary_key_value):
+            if not self.index.modify(primary_key_value, apply):
+                return False
+            self._record_write('update', primary_key_value, new_values)
+            return True
+
+    def _repoint(self, pk_value, old: Tuple, new_values: Dict[str, Any], row: Tuple) -> Tuple:
+        """Re-point secondary indexes whose column new_values changes from the old row; returns row."""
+        changed = [s for s in self.secondary_indexes.values()
+                   if s.column in new_values and new_values[s.column] != old[self._positions[s.column]]]
+        for secondary in changed:
+            secondary.check(new_values[secondary.column], pk_value)
+        for secondary in changed:
+            secondary.remove(old[self._positions[secondary.column]], pk_value)
+            secondary.add(new_values[secondary.column], pk_value)
+        return row
+
     def delete(self, primary_key_value) -> bool:
         """Delete a record by primary key."""
-        return self.index.delete(primary_key_value)
+        with self._writing(primary_key_value):
+            row = self.index.pop(primary_key_value)
+            if row is None:
+                return False
+            for secondary in self.secondary_indexes.values():
+                secondary.remove(row[self._positions[secondary.column]], primary_key_value)
+            self._record_write('delete', primary_key_value)
+            return True
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> int:
+        """Insert many records with shared index descents. Returns the number inserted.
+
+        Like insert(), records whose primary key already exists are skipped, and so
+        are repeats of a primary key within the batch (the first one wins).
+        """
+        if not all(col in record for record in records for col in self.columns):
+            raise ValueError("Missing columns in record")
+
+        with self._writing():
+            batch = {}
+            for record in records:
+                batch.setdefault(record[self.primary_key], record)
+            existing = self.index.get_many(list(batch))
+            new = [(pk, record) for (pk, record), old in zip(batch.items(), existing) if old is None]
+            if not new:
+                return 0
+
+            # Check the whole batch first so a violation leaves the table unchanged
+            for secondary in self.secondary_indexes.values():
+                seen = set()
+                for pk, record in new:
+                    value = record[secondary.column]
+                    secondary.check(value, pk)
+                    if secondary.unique and value in seen:
+                        raise ValueError(f"Duplicate value {value!r} in unique column '{secondary.column}'")
+                    seen.add(value)
+
+            self.index.insert_many([(pk, self._pack(record)) for pk, record in new])
+            for secondary in self.secondary_indexes.values():
+                for pk, record in new:
+                    secondary.add(record[secondary.column], pk)
+            self._record_write('insert_many', [record for _, record in new])
+            return len(new)
+
+    def select_many(self, primary_key_values: List) -> List[Optional[Dict[str, Any]]]:
+        """Select records for many primary keys (None where missing), in the order given."""
+        return [self._unpack(row) for row in self.get_rows(primary_key_values)]
+
+    def get_rows(self, primary_key_values: List) -> List[Optional[Tuple]]:
+        """Rows, as tuples in column order, for many primary keys (None where missing), in the order given.
+
+        Like select_many() without building a dict per row. The keys are
+        looked up in sorted order, so a batch reads each leaf once.
+        """
+        return self.index.get_many(primary_key_values)
+
+    def delete_many(self, primary_key_values: List) -> int:
+        """Delete records for many primary keys. Returns the number deleted."""
+        pks = list(primary_key_values)
+        with self._writing():
+            if self.secondary_indexes:
+                for pk, row in zip(pks, self.index.get_many(pks)):
+                    if row is not None:
+                        for secondary in self.secondary_indexes.values():
+                            secondary.remove(row[self._positions[secondary.column]], pk)
+            deleted = self.index.delete_many(pks)
+            if deleted:
+                self._record_write('delete_many', pks)
+            return deleted
+
+    def delete_range(self, start_key=None, end_key=None) -> int:
+        """Delete records with primary keys in [start_key, end_key] (None = unbounded). Returns the number deleted.
+
+        The index unlinks whole leaves and subtrees inside the range instead
+        of deleting key by key (BPlusTree.delete_range). With secondary
+        indexes the rows in the range are read first to remove their entries.
+        """
+        with self._writing():
+            if self.secondary_indexes:
+                for pk, row in list(self.index.iter_range(start_key, end_key)):
+                    for secondary in self.secondary_indexes.values():
+                        secondary.remove(row[self._positions[secondary.column]], pk)
+            deleted = self.index.delete_range(start_key, end_key)
+            if deleted:
+                self._record_write('delete_range', start_key, end_key)
+            return deleted
+
+    def truncate(self) -> int:
+        """Delete every record, keeping the schema and indexes. Returns the number deleted."""
+        with self._writing():
+            deleted = self.index.delete_range()
+            for secondary in self.secondary_indexes.values():
+                secondary.build(())
+            if deleted:
+                self._record_write('truncate')
+            return deleted
+
+    @property
+    def sparse_leaves(self) -> int:
+        """Leaves deletes left underfull for compact(); 0 unless the table's index is in memory and loaded."""
+        if self.storage != 'memory' or self._index is None:
+            return 0
+        return self._index.sparse_leaves
+
+    def compaction_stats(self) -> Dict[str, Any]:
+        """Underfull leaves noted and average leaf occupancy (a fraction of a full leaf, None unless in memory).
+
+        Occupancy walks the leaf chain; sparse_leaves alone is cheap enough
+        to check after every write.
+        """
+        fill = self.index.leaf_fill_factor() if self.storage == 'memory' else None
+        return {'sparse_leaves': self.sparse_leaves, 'leaf_fill': fill}
+
+    def compact(self, limit: Optional[int] = None) -> int:
+        """Rebalance the leaves relaxed deletes left underfull (BPlusTree.compact). Returns the number repaired.
+
+        The records do not change, so nothing is logged. A concurrent index
+        holds its writers off while it compacts.
+        """
+        if not self.sparse_leaves:
+            return 0
+        return self.index.compact(limit)
+
+    def _record_write(self, op: str, *args) -> None:
+        """Mark the table modified and log the write if a log is attached."""
+        self.generation += 1
+        if self.wal:
+            self.wal.append(op, self.name, *args)
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the table changed since it was last loaded or persisted."""
+        return self.generation != self.persisted_generation
+    
+    def create_index(self, column: str, unique: bool = False) -> bool:
+        """Index a non-primary-key column. Returns False if it is already indexed."""
+        if column not in self.columns:
+            raise ValueError(f"Column '{column}' not found")
+        with self._writing():
+            if column == self.primary_key or column in self.secondary_indexes:
+                return False
+            secondary = SecondaryIndex(column, unique)
+            position = self._positions[column]
+            secondary.build((pk, row[position]) for pk, row in self.index.get_all())
+            self.secondary_indexes[column] = secondary
+            self._record_write('create_index', column, unique)
+            return True
+
+    def create_aggregate(self, column: str) -> bool:
+        """Keep the sum, min and max of a numeric column in the index. Returns False if already kept.
+
+        Once a table has an aggregate, count() and range aggregates over an
+        in-memory table read subtree summaries instead of the rows. Paged,
+        concurrent and write-buffered tables keep no summaries and compute
+        them by scanning the range.
+        """
+        if column not in self.columns:
+            raise ValueError(f"Column '{column}' not found")
+        if self.columns[column] not in NUMERIC_TYPES:
+            raise ValueError(f"Column '{column}' is not numeric")
+        with self._writing():
+            if column in self.aggregates:
+                return False
+            self.aggregates.append(column)
+            if self.storage == 'memory' and not (self.concurrent or self.write_buffer):
+                index = self._new_index()
+                index.bulk_load(self.index.get_all())
+                self.index = index
+            self._record_write('create_aggregate', column)
+            return True
+
+    def _summarized(self) -> Optional[AugmentedBPlusTree]:
+        # Paged, concurrent and buffered indexes keep no summaries; callers scan instead
+        index = self.index
+        return index if isinstance(index, AugmentedBPlusTree) else None
+
+    def aggregate(self, column: str, start_key=None, end_key=None) -> Dict[str, Any]:
+        """count, sum, min and max of an aggregated column over primary keys in [start_key, end_key]."""
+        if column not in self.aggregates:
+            raise ValueError(f"Column '{column}' is not aggregated")
+        index = self._summarized()
+        if index is not None:
+            return index.aggregate(column, start_key, end_key)
+        records = list(self.scan(start_key, end_key))
+        values = [record[column] for record in records if record[column] is not None]
+        return {'count': len(records), 'sum': sum(values),
+                'min': min(values, default=None), 'max': max(values, default=None)}
+
+    def count(self, start_key=None, end_key=None) -> int:
+        """Number of records with primary keys in [start_key, end_key] (None = unbounded)."""
+        index = self._summarized()
+        if index is None and self.storage == 'frozen':
+            index = self.index  # Counts by searching its sorted key array
+        if index is not None:
+            return index.count_range(start_key, end_key)
+        return sum(1 for _ in self.scan(start_key, end_key))
+
+    def estimated_rows(self) -> int:
+        """Approximate number of records, in time proportional to the tree's height, for planning.
+
+        Exact for frozen tables and tables that keep aggregates. Otherwise the
+        index multiplies out the fan-out of the nodes on one root-to-leaf path,
+        which is within a small factor of the true count.
+        """
+        return self.index.estimated_count()
+
+    def sum(self, column: str, start_key=None, end_key=None):
+        """Sum of an aggregated column over primary keys in [start_key, end_key]; None values are skipped."""
+        return self.aggregate(column, start_key, end_key)['sum']
+
+    def min(self, column: Optional[str] = None, start_key=None, end_key=None):
+        """Smallest value of an aggregated column (the primary key by default) over [start_key, end_key]."""
+        if column is None or column == self.primary_key:
+            record = next(self.scan(start_key, end_key, limit=1), None)
+            return None if record is None else record[self.primary_key]
+        return self.aggregate(column, start_key, end_key)['min']
+
+    def max(self, column: Optional[str] = None, start_key=None, end_key=None):
+        """Largest value of an aggregated column (the primary key by default) over [start_key, end_key]."""
+        if column is None or column == self.primary_key:
+            record = next(self.scan(start_key, end_key, limit=1, reverse=True), None)
+            return None if record is None else record[self.primary_key]
+        return self.aggregate(column, start_key, end_key)['max']
+
+    def _secondary_index(self, column: str) -> SecondaryIndex:
+        if not self.materialized:
+            self.materialize()  # Secondary indexes are built along with the rows
+        if column not in self.secondary_indexes:
+            raise ValueError(f"Column '{column}' is not indexed")
+        return self.secondary_indexes[column]
+
+    def select_by(self, column: str, value) -> List[Dict[str, Any]]:
+        """Select records whose indexed column equals value."""
+        if column == self.primary_key:
+            record = self.select(value)
+            return [record] if record is not None else []
+        secondary = self._secondary_index(column)
+        with self._reading():
+            pks = secondary.lookup(value)
+        return [self._unpack(row) for row in self.index.get_many(pks) if row is not None]
+
+    def select_by_range(self, column: str, start, end) -> List[Dict[str, Any]]:
+        """Select records whose indexed column lies in [start, end], ordered by that column."""
+        if column == self.primary_key:
+            return self.select_range(start, end)
+        secondary = self._secondary_index(column)
+        with self._reading():
+            pks = secondary.range(start, end)
+        return [self._unpack(row) for row in self.index.get_many(pks) if row is not None]
+    
+    def scan(self, start_key=None, end_key=None, limit: Optional[int] = None, offset: int = 0,
+             reverse: bool = False) -> Iterator[Dict[str, Any]]:
+        """Stream records with primary keys in [start_key, end_key] (None = unbounded).
+
+        Records come in primary key order, or descending order if reverse is set.
+        offset records are skipped first and at most limit are yielded. In-memory
+        tables scan a snapshot, so writes made while iterating are not seen.
+        """
+        stop = None if limit is None else offset + limit
+        for row in islice(self.scan_rows(start_key, end_key, stop, reverse), offset, None):
+            yield self._unpack(row)
+
+    def scan_rows(self, start_key=None, end_key=None, limit: Optional[int] = None,
+                  reverse: bool = False) -> Iterator[Tuple]:
+        """Stream rows, as tuples in column order, with primary keys in [start_key, end_key].
+
+        Like scan() without building a dict per row, for callers that read
+        rows by column position.
+        """
+        if self.storage != 'memory':
+            for _, row in self.index.iter_range(start_key, end_key, limit, reverse):
+                yield row
+            return
+        with self.index.snapshot() as snapshot:
+            for _, row in snapshot.iter_range(start_key, end_key, limit, reverse):
+                yield row
     
     def select_range(self, start_key, end_key) -> List[Dict[str, Any]]:
         """Select records within a range of primary keys."""
-        return [value for key, value in self.index.range_query(start_key, end_key)]
+        return list(self.scan(start_key, end_key))
     
     def select_all(self) -> List[Dict[str, Any]]:
         """Select all records in the table."""
-        return [value for key, value in self.index.get_all()]
-    
-    def persist(self) -> None:
-        """Persist the table to disk."""
-        with open(self.serialized_file, 'wb') as f:
-            pickle.dump({
-                'name': self.name,
-                'columns': self.columns,
-                'primary_key': self.primary_key,
-                'data': self.index.get_all()
-            }, f)
+        return list(self.scan())
+
+    def numpy_view(self) -> 'NumpyView':
+        """A NumPy view of the primary keys and numeric columns, for batch lookups, filters and aggregates.
+
+        Needs numpy and an in-memory or frozen table; rows come back as tuples
+        in column order. The view follows later writes; close it when done.
+        """
+        from vectorized import NumpyView  # Optional dependency, only needed here
+        columns = {column: position for column, position in self._positions.items()
+                   if self.columns[column] in NUMERIC_TYPES}
+        return NumpyView(self.index, columns)
+
+    def persist(self) -> int:
+        """Persist the table to disk. Returns the number of bytes written."""
+        return self._write_capture(self._capture())
+
+    def _capture(self, lsn: Optional[int] = None) -> Tuple[int, int, Any, int]:
+        """Fix the state persist() writes: (generation, log position, snapshot, bytes written).
+
+        Writers are held off meanwhile, so the table's logged writes up to the
+        log position are all in that state and later ones are not. A caller
+        passing lsn holds them off itself (see _quiesced). A paged table is
+        flushed here, as its pages cannot be snapshotted; an in-memory table's
+        snapshot is left for _write_capture().
+        """
+        if lsn is None:
+            with self._quiesced():
+                return self._capture(self._log_position())
+        generation, snapshot, written = self.generation, None, 0
+        if self.storage == 'frozen':
+            lsn = self.checkpoint_lsn  # Never changes after freeze()
+        elif self.storage == 'paged':
+            # Only dirty pages are written; the schema lives in the file header
+            self.index.meta = self._schema(lsn)
+            before = self.index.pager.bytes_written
+            self.index.flush()
+            written = self.index.pager.bytes_written - before
+        else:
+            snapshot = self.index.snapshot()
+        return generation, lsn, snapshot, written
+
+    def _write_capture(self, capture: Tuple[int, int, Any, int]) -> int:
+        """Write the snapshot of a _capture() result, if it has one, and return the bytes written."""
+        _, lsn, snapshot, written = capture
+        if snapshot is not None:
+            # Rows stream from a snapshot so writers need not wait for the dump
+            with snapshot:
+                written = self.write_snapshot(snapshot, lsn)
+        self._persisted(capture, written)
+        return written
+
+    def _persisted(self, capture: Tuple[int, int, Any, int], written: int) -> None:
+        """Record that the state of a _capture() result is on disk."""
+        self.persisted_generation, self.checkpoint_lsn = capture[:2]
+        self.bytes_written += written
+
+    def write_snapshot(self, snapshot, lsn: int) -> int:
+        """Write the rows of a snapshot of an in-memory table's index to serialized_file.
+
+        lsn is the log position the snapshot reflects (see _capture). This is
+        persist() without its bookkeeping, for callers that took the snapshot
+        themselves. Returns the bytes written.
+        """
+        # Write a temp file and rename it so a crash never leaves a torn table
+        tmp_file = self.serialized_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            written = write_table(f, self._schema(lsn), (row for _, row in snapshot.iter_range()),
+                                  compress=self.compress)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.serialized_file)
+        return written
+
+    def _schema(self, lsn: int = 0) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'columns': self.columns,
+            'primary_key': self.primary_key,
+            'indexes': {column: s.unique for column, s in self.secondary_indexes.items()},
+            'aggregates': list(self.aggregates),
+            'lsn': lsn
+        }
+
+    def _apply_schema(self, schema: Dict[str, Any]) -> None:
+        self.name = schema['name']
+        self.columns = schema['columns']
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+        self.primary_key = schema['primary_key']
+        self.secondary_indexes = {column: SecondaryIndex(column, unique)
+                                  for column, unique in schema.get('indexes', {}).items()}
+        self.aggregates = list(schema.get('aggregates', []))
+        self.checkpoint_lsn = schema.get('lsn', 0)
     
-    def load(self) -> bool:
-        """Load the table from disk."""
+    def freeze(self, path: str) -> int:
+        """Write the rows to a read-only file that a table with storage='frozen' opens via mmap.
+
+        Returns the bytes written. Writes made while freezing may be missed.
+        """
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            if self.storage == 'memory':
+                with self._quiesced():
+                    lsn, snapshot = self._log_position(), self.index.snapshot()
+                with snapshot:
+                    written = write_frozen(f, self._schema(lsn), snapshot.iter_range())
+            else:
+                with self._quiesced():
+                    written = write_frozen(f, self._schema(self._log_position()), self.index.iter_range())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+        return written
+
+    def load(self, lazy: bool = False) -> bool:
+        """Load the table from disk. With lazy=True only the schema is read until first use."""
+        if self.storage == 'frozen':
+            # Opening maps the file and reads its header, however large it is
+            if not os.path.exists(self.serialized_file):
+                return False
+            self._index = FrozenIndex(self.serialized_file)
+            self._apply_schema(self._index.schema)
+            if self.secondary_indexes:
+                self._build_secondary(self._index.get_all())  # Reads every row
+            self.persisted_generation = self.generation
+            return True
+
+        if self.storage == 'paged':
+            meta = self.index.meta
+            if not meta:
+                return False
+            self._apply_schema(meta)
+            first = next(self.index.iter_range(limit=1), None)
+            if first is not None and isinstance(first[1], dict):
+                # Written before rows were tuples: convert the page file once
+                for pk, record in self.index.get_all():
+                    self.index.update(pk, self._pack(record))
+                self.index.flush()
+            if self.secondary_indexes:
+                self._build_secondary(self.index.get_all())
+            self.persisted_generation = self.generation
+            return True
+
         try:
-            with open(self.serialized_file, 'rb') as f:
+            with open(self.serialized_file, 'rb') as f, _gc_paused():
+                if is_table_file(f):
+                    self._apply_schema(read_schema(f))
+                    if lazy:
+                        self._index = None
+                    else:
+                        self._build_index(self._read_pairs(f))
+                    self.persisted_generation = self.generation
+                    return True
+
+                # A pickle written before the binary format; Database.load migrates it
                 data = pickle.load(f)
-                self.name = data['name']
-                self.columns = data['columns']
-                self.primary_key = data['primary_key']
+                self._apply_schema(data)
                 
-                # Rebuild the index
-                self.index = BPlusTree(degree=3)
-                for key, value in data['data']:
-                    self.index.insert(key, value)
+                if 'data' in data:
+                    # Older files pickle the rows inside the schema dict
+                    self._build_index(data['data'])
+                elif lazy:
+                    self._index = None
+                else:
+                    self._build_index(pickle.load(f))
+            self.persisted_generation = self.generation
             return True
         except FileNotFoundError:
             return False
+
+    def close(self) -> None:
+        """Release the table's page file or mapped file, if it has one."""
+        if self.storage == 'paged' or self.storage == 'frozen' and self.materialized:
+            self.index.close()
     
     def visualize_index(self, filename: str) -> None:
         """Visualize the B+ tree index."""
@@ -0,0 +1,195 @@
+# tablefile.py
+import json
+import struct
+import zlib
+from itertools import chain, islice
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b'BPTT'
+VERSION = 2  # 2 added tagged JSON columns
+BLOCK_ROWS = 4096  # rows per checksummed block
+_HEADER = struct.Struct('<4sHII')  # magic, version, schema length, crc32 of schema
+_BLOCK = struct.Struct('<IIIB')  # rows, stored payload length, crc32 of stored payload, flags
+_COLUMN = struct.Struct('<cI')  # encoding, encoded length
+_COMPRESSED = 1  # block flag: payload is zlib-compressed
+
+# Column types a schema may name
+TYPES = {'int': int, 'float': float, 'str': str, 'bool': bool, 'list': list, 'dict': dict}
+# Fixed-width struct codes for int columns, narrowest first, with the largest value each holds
+_INT_CODES = ((b'b', 2 ** 7), (b'h', 2 ** 15), (b'i', 2 ** 31), (b'q', 2 ** 63))
+_JSON = b'j'
+_TAGGED_JSON = b't'
+_SCALARS = {str, int, float, bool, type(None)}
+
+def json_safe(values: Iterable) -> bool:
+    """Whether JSON gives values back unchanged: no tuples, and no dict keys other than str, at any depth."""
+    pending = [values]
+    while pending:
+        for value in pending.pop():
+            kind = type(value)
+            if kind in _SCALARS:
+                continue
+            if kind is dict:
+                for key, item in value.items():
+                    if type(key) is not str:
+                        return False
+                    if type(item) not in _SCALARS:
+                        pending.append((item,))
+            elif kind is list:
+                pending.append(value)
+            elif kind is tuple:
+                return False
+    return True
+
+def tag_json(value) -> Any:
+    """value with every tuple and dict wrapped in a one-key object, so untag_json() can restore them.
+
+    A tuple becomes {"t": items} and a dict {"d": [[key, value], ...]}, which
+    keeps keys that are not strings. The tagged form holds no other objects.
+    """
+    kind = type(value)
+    if kind is list:
+        return [tag_json(item) for item in value]
+    if kind is tuple:
+        return {'t': [tag_json(item) for item in value]}
+    if kind is dict:
+        return {'d': [[tag_json(key), tag_json(item)] for key, item in value.items()]}
+    return value
+
+def untag_json(value) -> Any:
+    """Reverse tag_json() on a value read back from JSON."""
+    kind = type(value)
+    if kind is list:
+        return [untag_json(item) for item in value]
+    if kind is dict:
+        if 't' in value:
+            return tuple([untag_json(item) for item in value['t']])
+        return {untag_json(key): untag_json(item) for key, item in value['d']}
+    return value
+
+def _encode_column(column_type: type, values: Tuple) -> Tuple[bytes, bytes]:
+    code = None
+    if column_type is float and all(type(value) is float for value in values):
+        code = b'd'
+    elif column_type is int and all(type(value) is int for value in values):
+        low, high = min(values), max(values)
+        code = next((code for code, limit in _INT_CODES if -limit <= low and high < limit), None)
+    if code is not None:
+        return code, struct.pack(f'<{len(values)}{code.decode()}', *values)
+    if json_safe(values):
+        code = _JSON
+    else:
+        code, values = _TAGGED_JSON, [tag_json(value) for value in values]
+    try:
+        return code, json.dumps(values, separators=(',', ':')).encode()
+    except TypeError as e:
+        raise ValueError(f"Cannot store column value: {e}") from None
+
+def _decode_column(code: bytes, data: bytes, count: int) -> Tuple:
+    if code == _JSON:
+        return json.loads(data)
+    if code == _TAGGED_JSON:
+        return [untag_json(value) for value in json.loads(data)]
+    return struct.unpack(f'<{count}{code.decode()}', data)
+
+def write_table(f: BinaryIO, schema: Dict[str, Any], rows: Iterable[Tuple], compress: bool = False,
+                block_rows: int = BLOCK_ROWS) -> int:
+    """Write schema and rows (tuples in column order, sorted by key) to f. Returns the bytes written.
+
+    The file is a header holding the schema as JSON, then the rows in blocks
+    of up to block_rows, then an empty block marking the end. A block stores
+    its rows column by column: int and float columns whose values all have
+    the column's type are packed as little-endian arrays, ints in the
+    narrowest of 1, 2, 4 or 8 bytes that holds the block's values, and any
+    other column is a JSON list. A column holding tuples or dicts with
+    non-str keys, which JSON would turn into lists and str keys, is written
+    with tag_json() instead, and read back with the original types. Each block carries a CRC32 of its stored
+    bytes and is zlib-compressed if compress is set. Rows are consumed a
+    block at a time, so they can come from a lazy scan.
+    """
+    header = dict(schema, columns=[[name, column_type.__name__] for name, column_type in schema['columns'].items()])
+    for _, type_name in header['columns']:
+        if type_name not in TYPES:
+            raise ValueError(f"Unsupported column type: {type_name}")
+    payload = json.dumps(header).encode()
+    f.write(_HEADER.pack(MAGIC, VERSION, len(payload), zlib.crc32(payload)))
+    f.write(payload)
+    written = _HEADER.size + len(payload)
+
+    column_types = list(schema['columns'].values())
+    rows = iter(rows)
+    while True:
+        block = list(islice(rows, block_rows))
+        if not block:
+            break
+        parts = []
+        for column_type, values in zip(column_types, zip(*block)):
+            code, data = _encode_column(column_type, values)
+            parts += [_COLUMN.pack(code, len(data)), data]
+        data = b''.join(parts)
+        flags = 0
+        if compress:
+            data, flags = zlib.compress(data), _COMPRESSED
+        f.write(_BLOCK.pack(len(block), len(data), zlib.crc32(data), flags))
+        f.write(data)
+        written += _BLOCK.size + len(data)
+    f.write(_BLOCK.pack(0, 0, 0, 0))
+    return written + _BLOCK.size
+
+def is_table_file(f: BinaryIO) -> bool:
+    """Whether f, positioned at its start, holds a table file. The position is left unchanged."""
+    start = f.tell()
+    magic = f.read(len(MAGIC))
+    f.seek(start)
+    return magic == MAGIC
+
+def read_schema(f: BinaryIO) -> Dict[str, Any]:
+    """Read and check the header of a table file, leaving f at its first block."""
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("Table file is truncated")
+    magic, version, length, crc = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not a table file")
+    if version > VERSION:
+        raise ValueError(f"Table file version {version} is newer than supported version {VERSION}")
+    payload = f.read(length)
+    if len(payload) < length or zlib.crc32(payload) != crc:
+        raise ValueError("Table file header is corrupt")
+    schema = json.loads(payload)
+    schema['columns'] = {name: TYPES[type_name] for name, type_name in schema['columns']}
+    return schema
+
+def read_rows(f: BinaryIO, key: Optional[int] = None) -> Iterator[Tuple]:
+    """Yield the rows of a table file whose header read_schema() has consumed, a block at a time.
+
+    With key set to a column position, (row[key], row) pairs are yielded
+    instead. Raises ValueError on a corrupt block or a file cut short before
+    its end marker.
+    """
+    return chain.from_iterable(_read_blocks(f, key))
+
+def _read_blocks(f: BinaryIO, key: Optional[int]) -> Iterator[Iterator[Tuple]]:
+    while True:
+        header = f.read(_BLOCK.size)
+        if len(header) < _BLOCK.size:
+            raise ValueError("Table file is truncated")
+        count, length, crc, flags = _BLOCK.unpack(header)
+        if count == 0:
+            return
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError("Table file is truncated")
+        if zlib.crc32(data) != crc:
+            raise ValueError("Table file block is corrupt")
+        if flags & _COMPRESSED:
+            data = zlib.decompress(data)
+        columns: List[Tuple] = []
+        offset = 0
+        while offset < len(data):
+            code, size = _COLUMN.unpack_from(data, offset)
+            offset += _COLUMN.size
+            columns.append(_decode_column(code, data[offset:offset + size], count))
+            offset += size
+        rows = zip(*columns)
+        yield rows if key is None else zip(columns[key], rows)
@@ -0,0 +1,34 @@
+# test_query.py
+import os
+import shutil
+import tempfile
+import unittest
+from query import Join
+from table import Table
+
+class JoinTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_join_over_paged_table(self):
+        # Enough rows for the paged tree to have several levels of pages
+        students = Table('students', {'id': int, 'name': str}, 'id', storage='paged',
+                         page_file=os.path.join(self.dir, 'students.pages'))
+        students.insert_many([{'id': i, 'name': f'student{i}'} for i in range(300)])
+        grades = Table('grades', {'id': int, 'student': int, 'grade': int}, 'id', write_buffer=64)
+        grades.insert_many([{'id': i, 'student': i * 7 % 400, 'grade': i % 5} for i in range(200)])
+        self.assertGreater(students.estimated_rows(), 30)
+        self.assertGreater(grades.estimated_rows(), 30)  # Counts rows still in the write buffer
+
+        for left_on, right_on in ((None, None), ('id', 'student')):
+            join = Join(students, grades, left_on, right_on, columns=['students.id', 'grades.id'])
+            expected = sorted((i if left_on is None else i * 7 % 400, i) for i in range(200)
+                              if (i if left_on is None else i * 7 % 400) < 300)
+            self.assertEqual(sorted((r['students.id'], r['grades.id']) for r in join.records()), expected)
+        students.index.close()
+
+if __name__ == '__main__':
+    unittest.main()
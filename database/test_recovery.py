@@ -0,0 +1,202 @@
+# test_recovery.py
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from db_manager import QUARANTINE_LOG, Database, ReplayError
+from pager import Pager, PagedBPlusTree
+from wal import WriteAheadLog
+
+def _crash(tree: PagedBPlusTree) -> None:
+    """Drop a paged tree's file handles without flushing, as a crash would."""
+    tree.pager.file.close()
+    if tree.pager.journal is not None:
+        tree.pager.journal.close()
+
+class PagedRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tree.pages')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _open(self) -> PagedBPlusTree:
+        # A tiny pool, so writes between checkpoints evict and free checkpointed pages
+        return PagedBPlusTree(self.path, degree=3, page_size=512, buffer_pool_size=512 * 4)
+
+    def test_reopen_after_crash_sees_last_flush(self):
+        rng = random.Random(7)
+        tree = self._open()
+        expected = {}
+        for round_ in range(20):
+            for step in range(150):
+                key = rng.randrange(300)
+                if rng.random() < 0.6:
+                    tree.insert(key, (round_, step))
+                else:
+                    tree.delete(key)
+            if round_ % 3 == 0:
+                tree.delete_range(rng.randrange(300), rng.randrange(300, 400))
+            if round_ % 2 == 0:
+                tree.flush()
+                expected = dict(tree.get_all())
+            else:
+                _crash(tree)
+                tree = self._open()
+                self.assertEqual(dict(tree.get_all()), expected)
+                self.assertTrue(tree.validate_tree())
+        tree.close()
+
+    def test_sealed_journal_is_finished_on_reopen(self):
+        tree = self._open()
+        tree.insert_many((key, key) for key in range(200))
+        tree.flush()
+        tree.delete_range(50, 150)
+        tree.insert(1000, 'new')
+        # Crash after the journal is sealed but before its pages are copied into place
+        def crash_before_apply(pager, journal, slots):
+            raise OSError('crashed')
+        apply = Pager._apply
+        Pager._apply = crash_before_apply
+        try:
+            self.assertRaises(OSError, tree.flush)
+        finally:
+            Pager._apply = apply
+        _crash(tree)
+        tree = self._open()
+        expected = [(key, key) for key in range(200) if not 50 <= key <= 150] + [(1000, 'new')]
+        self.assertEqual(tree.get_all(), expected)
+        tree.close()
+
+class DatabaseRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_paged_table_reloads_after_crash(self):
+        db = Database('crash', buffer_pool_size=512 * 4)
+        db.create_table('t', {'id': int, 'v': str}, 'id', storage='paged')
+        table = db.get_table('t')
+        for key in range(500):
+            table.insert({'id': key, 'v': 'x' * 20})
+        db.persist()
+        for key in range(0, 500, 2):
+            table.delete(key)
+        table.update(1, {'v': 'updated'})
+        db.commit()
+        _crash(table.index)
+        db.wal.close()
+
+        db = Database('crash')
+        db.load()
+        table = db.get_table('t')
+        self.assertEqual(len(table.select_all()), 250)
+        self.assertEqual(table.select(1)['v'], 'updated')
+        self.assertIsNone(table.select(2))
+
+    def test_concurrent_database_reloads_aggregated_table(self):
+        db = Database('agg')
+        db.create_table('t', {'id': int, 'age': int}, 'id')
+        table = db.get_table('t')
+        for key in range(50):
+            table.insert({'id': key, 'age': key % 7})
+        table.create_aggregate('age')
+        db.persist()
+        db.wal.close()
+
+        db = Database('agg', concurrent=True)
+        self.assertTrue(db.load())
+        table = db.get_table('t')
+        table.insert({'id': 50, 'age': 6})
+        # Computed by scanning: a concurrent index keeps no summaries
+        self.assertEqual(table.aggregate('age', 10, 50), {'count': 41, 'sum': 129, 'min': 0, 'max': 6})
+
+    def test_replay_skips_writes_already_in_table_file(self):
+        db = Database('overlap')
+        db.create_table('t', {'id': int, 'email': str}, 'id')
+        table = db.get_table('t')
+        table.create_index('email', unique=True)
+        db.persist()
+        # A checkpoint rotates the log and then saves tables while writes go on
+        retired = db.wal.rotate()
+        table.insert({'id': 1, 'email': 'x'})
+        table.delete(1)
+        table.insert({'id': 2, 'email': 'x'})
+        table.persist()
+        os.remove(retired)
+        db.commit()
+        db.wal.close()
+
+        db = Database('overlap')
+        self.assertTrue(db.load())
+        self.assertEqual(db.get_table('t').select_all(), [{'id': 2, 'email': 'x'}])
+
+    def test_log_numbers_after_lsns_lost_from_its_tail(self):
+        db = Database('tail')
+        db.create_table('t', {'id': int}, 'id')
+        db.persist()
+        table = db.get_table('t')
+        retired = db.wal.rotate()
+        synced = db.wal.size
+        table.insert({'id': 1})  # Saved below, but its record never reaches the disk
+        table.persist()
+        os.remove(retired)
+        db.wal.close()
+        os.truncate(db.wal.path, synced)
+
+        db = Database('tail')
+        self.assertTrue(db.load())
+        db.get_table('t').insert({'id': 2})
+        db.commit()
+        db.wal.close()
+
+        db = Database('tail')
+        self.assertTrue(db.load())
+        self.assertEqual(db.get_table('t').select_all(), [{'id': 1}, {'id': 2}])
+
+    def test_replay_skips_per_partition(self):
+        db = Database('parts')
+        db.create_table('t', {'id': int}, 'id', partitions={'by': 'range', 'bounds': [100]})
+        db.persist()
+        table = db.get_table('t')
+        table.insert({'id': 150})
+        table.insert({'id': 5})
+        # A checkpoint interrupted after saving the first partition only
+        table.partitions[0].persist()
+        db.commit()
+        db.wal.close()
+
+        db = Database('parts')
+        self.assertTrue(db.load())
+        self.assertEqual(db.get_table('t').select_all(), [{'id': 5}, {'id': 150}])
+
+    def test_failed_replay_quarantines_only_its_table(self):
+        db = Database('replay')
+        db.create_table('good', {'id': int}, 'id')
+        db.create_table('bad', {'id': int}, 'id')
+        db.persist()
+        db.get_table('good').insert({'id': 1})
+        db.get_table('bad').insert({'id': 1})
+        db.wal.append('insert', 'bad', {'wrong': 2})  # Cannot be applied
+        db.get_table('bad').insert({'id': 3})
+        db.commit()
+        db.wal.close()
+
+        db = Database('replay')
+        with self.assertRaises(ReplayError) as raised:
+            db.load()
+        self.assertEqual(list(raised.exception.failures), ['bad'])
+        self.assertEqual(db.list_tables(), ['good'])
+        self.assertEqual(db.get_table('good').select(1), {'id': 1})
+        quarantined = list(WriteAheadLog.read_records(os.path.join(db.db_dir, QUARANTINE_LOG)))
+        self.assertEqual(quarantined, [('insert', 'bad', {'wrong': 2}), ('insert', 'bad', {'id': 3})])
+
+if __name__ == '__main__':
+    unittest.main()
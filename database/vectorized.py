@@ -0,0 +1,221 @@
+# vectorized.py
+import math
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np  # Optional dependency; import this module only when NumPy views are used
+from bplustree import BPlusTreeNode
+from frozen import FrozenIndex
+from memtable import BufferedBPlusTree
+
+CHUNK_KEYS = 1024  # rough number of keys per independently rebuilt chunk
+
+def _array(values: Sequence, what: str) -> 'np.ndarray':
+    """values as an int or float array; None becomes NaN."""
+    array = np.array(values)
+    if array.dtype == object:
+        try:
+            array = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"{what} must hold only int or float values") from None
+    if array.dtype.kind not in 'biuf':
+        raise ValueError(f"{what} must hold only int or float values")
+    return array
+
+class _Chunk:
+    """Arrays for the pairs under one node of a snapshot."""
+    __slots__ = ('node', 'keys', 'values', 'columns')
+
+    def __init__(self, node: Optional[BPlusTreeNode], keys: 'np.ndarray', values: List,
+                 columns: Dict[str, 'np.ndarray']):
+        self.node = node
+        self.keys = keys
+        self.values = values
+        self.columns = columns
+
+class NumpyView:
+    """Read-optimized copy of a tree's numeric keys, and chosen numeric fields of its values, as NumPy arrays.
+
+    Batch lookups binary-search the sorted key array with searchsorted, and
+    key ranges are array slices, so filters and aggregates over numeric
+    columns run as array operations instead of a descent or a Python call
+    per key. columns maps a name to the position of a field in each value
+    (values are row tuples); a None field becomes NaN.
+
+    The view is built from a snapshot. It is split into chunks, one per
+    subtree about CHUNK_KEYS keys in size, and each query first checks
+    whether the tree's root has moved on since that snapshot. If it has,
+    copy-on-write has replaced exactly the nodes on each changed path, so
+    only the chunks whose subtree root was replaced are read again; the
+    others are reused, and the arrays are rejoined with a memory copy. The
+    pinned snapshot makes each write copy its path, so close() the view
+    once it is no longer needed. Frozen indexes never change and are read
+    once. Paged trees take no snapshots and are not supported.
+    """
+
+    def __init__(self, tree, columns: Optional[Dict[str, int]] = None):
+        if not isinstance(tree, FrozenIndex) and not hasattr(tree, 'snapshot'):
+            raise ValueError("NumPy views need an in-memory or frozen index")
+        self.tree = tree
+        self.columns = dict(columns or {})
+        self._snapshot = None
+        self._chunks: Dict[int, _Chunk] = {}
+        # Subtrees this many levels above the leaves hold about CHUNK_KEYS keys
+        fanout = 1.5 * getattr(tree, 'degree', 3)
+        self._chunk_height = max(0, int(math.log(CHUNK_KEYS / fanout, fanout)))
+        self.rebuilt_chunks = 0  # Chunks read from the tree so far, to show what refreshes cost
+        if isinstance(tree, FrozenIndex):
+            self._join([self._read(None, tree.get_all())])
+        else:
+            self.refresh()
+
+    def close(self) -> None:
+        """Release the view's snapshot so writes to the tree stop copying nodes for it."""
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+    def __enter__(self) -> 'NumpyView':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def refresh(self) -> bool:
+        """Bring the arrays up to date with the tree. Returns False if it had not changed."""
+        if isinstance(self.tree, FrozenIndex):
+            return False
+        if isinstance(self.tree, BufferedBPlusTree):
+            self.tree.flush()  # Chunks are read from tree nodes, which buffered writes have not reached
+        if self._snapshot is not None and self._snapshot.root is self.tree.root:
+            return False
+        snapshot = self.tree.snapshot()
+        chunks = {}
+        for node in self._chunk_nodes(snapshot.root):
+            chunk = self._chunks.get(id(node))
+            if chunk is None or chunk.node is not node:
+                chunk = self._read(node, self._pairs(node))
+            chunks[id(node)] = chunk
+        self._join(list(chunks.values()))
+        self.close()
+        self._snapshot, self._chunks = snapshot, chunks
+        return True
+
+    def _chunk_nodes(self, root: BPlusTreeNode) -> List[BPlusTreeNode]:
+        """The nodes _chunk_height levels above the leaves, in key order (or the root if none are)."""
+        height = 0
+        node = root
+        while not node.is_leaf:
+            node = node.children[0]
+            height += 1
+        level = [root]
+        for _ in range(height - self._chunk_height):
+            level = [child for node in level for child in node.children]
+        return level
+
+    @staticmethod
+    def _pairs(node: BPlusTreeNode) -> List:
+        pairs = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                pairs += zip(node.keys, node.values)
+            else:
+                stack.extend(reversed(node.children))
+        return pairs
+
+    def _read(self, node: Optional[BPlusTreeNode], pairs: List) -> _Chunk:
+        self.rebuilt_chunks += 1
+        keys = [key for key, _ in pairs]
+        values = [value for _, value in pairs]
+        columns = {name: _array([value[position] for value in values], f"Column '{name}'")
+                   for name, position in self.columns.items()}
+        return _Chunk(node, _array(keys, "Primary keys"), values, columns)
+
+    def _join(self, chunks: List[_Chunk]) -> None:
+        chunks = [chunk for chunk in chunks if chunk.values]
+        if not chunks:
+            self._keys = np.empty(0, dtype=np.int64)
+            self._values = []
+            self._columns = {name: np.empty(0, dtype=np.float64) for name in self.columns}
+            return
+        self._keys = np.concatenate([chunk.keys for chunk in chunks])
+        self._values = list(chain.from_iterable(chunk.values for chunk in chunks))
+        self._columns = {name: np.concatenate([chunk.columns[name] for chunk in chunks])
+                         for name in self.columns}
+
+    # Queries; each refreshes the view first
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._keys)
+
+    @property
+    def keys(self) -> 'np.ndarray':
+        """The sorted keys. Treat as read-only: it may be shared with later refreshes."""
+        self.refresh()
+        return self._keys
+
+    def column(self, name: str) -> 'np.ndarray':
+        """The values of a column in key order, aligned with keys."""
+        if name not in self.columns:
+            raise ValueError(f"Column '{name}' is not in the view")
+        self.refresh()
+        return self._columns[name]
+
+    def lookup(self, keys) -> 'np.ndarray':
+        """Positions of keys in the view, with -1 for keys that are absent."""
+        self.refresh()
+        query = np.asarray(keys)
+        if not len(self._keys):
+            return np.full(query.shape, -1, dtype=np.intp)
+        positions = np.searchsorted(self._keys, query)
+        found = self._keys[np.minimum(positions, len(self._keys) - 1)] == query
+        return np.where(found, positions, -1)
+
+    def get_many(self, keys, default=None) -> List[Optional[Any]]:
+        """Values for keys, with default for keys that are absent, like BPlusTree.get_many."""
+        positions = self.lookup(keys).tolist()
+        values = self._values
+        return [values[i] if i >= 0 else default for i in positions]
+
+    def range_slice(self, start_key=None, end_key=None) -> slice:
+        """The positions of keys with start_key <= key <= end_key as a slice; either bound may be None."""
+        self.refresh()
+        low = 0 if start_key is None else int(np.searchsorted(self._keys, start_key, 'left'))
+        high = len(self._keys) if end_key is None else int(np.searchsorted(self._keys, end_key, 'right'))
+        return slice(low, max(low, high))
+
+    def range_mask(self, start_key=None, end_key=None) -> 'np.ndarray':
+        """Boolean mask over the view of keys with start_key <= key <= end_key, to combine with column tests."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.range_slice(start_key, end_key)] = True
+        return mask
+
+    def rows(self, where) -> List:
+        """Values at a slice, a boolean mask or an array of positions, in key order."""
+        self.refresh()
+        if isinstance(where, slice):
+            return self._values[where]
+        where = np.asarray(where)
+        positions = np.flatnonzero(where) if where.dtype == bool else where
+        return [self._values[i] for i in positions.tolist()]
+
+    def aggregate(self, column: str, start_key=None, end_key=None, where=None) -> Dict[str, Any]:
+        """count, sum, min and max of a column over a key range, skipping None values.
+
+        where optionally narrows the rows further with a boolean mask over the
+        whole view. count is the number of rows, like Table aggregates.
+        """
+        values = self.column(column)
+        span = self.range_slice(start_key, end_key)
+        values = values[span]
+        if where is not None:
+            values = values[np.asarray(where)[span]]
+        count = len(values)
+        if values.dtype.kind == 'f':
+            values = values[~np.isnan(values)]
+        if not len(values):
+            return {'count': count, 'sum': 0, 'min': None, 'max': None}
+        return {'count': count, 'sum': values.sum().item(),
+                'min': values.min().item(), 'max': values.max().item()}
@@ -0,0 +1,200 @@
+# wal.py
+import os
+import pickle
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Iterator, Optional, Tuple
+
+SYNC_POLICIES = ('always', 'interval', 'none')
+_RECORD = struct.Struct('<II')  # payload length, crc32 of payload
+
+class WriteAheadLog:
+    """Append-only redo log of table writes for one database.
+
+    Each record is a tuple such as ('insert', table, record), pickled with its
+    log sequence number (LSN) and framed by its length and CRC32 so a torn
+    tail left by a crash is detected and cut off. LSNs keep counting across
+    checkpoints and restarts: rotate() starts the new log with a
+    ('checkpoint', None) record holding the current LSN, and opening a log
+    resumes after the highest LSN in it or in its retired log. Table files
+    record the LSN they are current to (see Database.load).
+    sync_policy decides when commit() makes records durable:
+
+    - 'always': commit() returns once the record is fsynced. Concurrent
+      committers share one fsync (group commit); group_commit_delay lets the
+      leader wait briefly for more writers to join its batch.
+    - 'interval': commit() flushes to the OS and fsyncs at most every sync_interval seconds.
+    - 'none': commit() only flushes to the OS.
+    """
+
+    def __init__(self, path: str, sync_policy: str = 'always', group_commit_delay: float = 0.0,
+                 sync_interval: float = 1.0):
+        if sync_policy not in SYNC_POLICIES:
+            raise ValueError(f"Unknown sync policy: {sync_policy}")
+        self.path = path
+        self.sync_policy = sync_policy
+        self.group_commit_delay = group_commit_delay
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._syncing = False
+        self._last_sync = time.monotonic()
+        self.appended_lsn = 0
+        self.durable_lsn = 0
+        self.syncs = 0
+
+        # Drop a torn tail so new records are not appended after garbage
+        valid_end = 0
+        for lsn, _, end in self._scan(path):
+            valid_end = end
+            self.appended_lsn = max(self.appended_lsn, lsn or 0)
+        for lsn, _, _ in self._scan(path + '.ckpt'):
+            self.appended_lsn = max(self.appended_lsn, lsn or 0)
+        self.durable_lsn = self.appended_lsn
+        self.file = open(path, 'ab')
+        if self.file.tell() > valid_end:
+            self.file.truncate(valid_end)
+        self.size = valid_end
+
+    @staticmethod
+    def _scan(path: str) -> Iterator[Tuple[Optional[int], Any, int]]:
+        """Yield (LSN, record, end offset) for each intact record in a log file.
+
+        Records written before logs kept LSNs have None for it.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            offset = 0
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                length, crc = _RECORD.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                offset += _RECORD.size + length
+                entry = pickle.loads(payload)
+                if type(entry[0]) is int:
+                    yield entry[0], entry[1], offset
+                else:
+                    yield None, entry, offset
+
+    @classmethod
+    def read_records(cls, path: str) -> Iterator[Any]:
+        """Yield the intact records in a log file, oldest first."""
+        for _, record, _ in cls._scan(path):
+            yield record
+
+    @classmethod
+    def read_entries(cls, path: str) -> Iterator[Tuple[Optional[int], Any]]:
+        """Yield (LSN, record) for the intact records in a log file, oldest first."""
+        for lsn, record, _ in cls._scan(path):
+            yield lsn, record
+
+    def _write(self, lsn: int, record: Tuple) -> None:
+        payload = pickle.dumps((lsn, record))
+        self.file.write(_RECORD.pack(len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.size += _RECORD.size + len(payload)
+
+    def append(self, *record) -> int:
+        """Append a record and return its log sequence number."""
+        with self._lock:
+            self.appended_lsn += 1
+            lsn = self.appended_lsn
+            self._write(lsn, record)
+        self._local.lsn = lsn
+        return lsn
+
+    def advance(self, lsn: int) -> None:
+        """Continue numbering records after lsn.
+
+        A table file can record an LSN whose records never reached the disk;
+        reusing it would make replay skip new records as already saved.
+        """
+        with self._lock:
+            self.appended_lsn = max(self.appended_lsn, lsn)
+            self.durable_lsn = max(self.durable_lsn, lsn)
+
+    def commit(self) -> None:
+        """Make this thread's appended records durable according to the sync policy."""
+        lsn = getattr(self._local, 'lsn', 0)
+        if self.sync_policy != 'always':
+            with self._lock:
+                self.file.flush()
+                if self.sync_policy == 'interval' and time.monotonic() - self._last_sync >= self.sync_interval:
+                    os.fsync(self.file.fileno())
+                    self._last_sync = time.monotonic()
+                    self.durable_lsn = self.appended_lsn
+                    self.syncs += 1
+            return
+
+        with self._synced:
+            while self.durable_lsn < lsn:
+                if self._syncing:
+                    # Another thread's fsync may cover this record too
+                    self._synced.wait()
+                    continue
+                self._syncing = True
+                batch_lsn = self.appended_lsn
+                synced = False
+                self._synced.release()
+                try:
+                    if self.group_commit_delay:
+                        time.sleep(self.group_commit_delay)
+                    with self._lock:
+                        self.file.flush()
+                        batch_lsn = self.appended_lsn
+                    os.fsync(self.file.fileno())
+                    synced = True
+                finally:
+                    # On a failed flush or fsync the waiters wake to retry
+                    # themselves, and the error reaches this caller
+                    self._synced.acquire()
+                    self._syncing = False
+                    if synced:
+                        self.durable_lsn = max(self.durable_lsn, batch_lsn)
+                        self.syncs += 1
+                    self._synced.notify_all()
+
+    def rotate(self) -> str:
+        """Move the current log aside for a checkpoint and start an empty one.
+
+        Returns the path of the retired log, which the caller removes once the
+        checkpoint is on disk. Records appended meanwhile go to the new log.
+        """
+        retired = self.path + '.ckpt'
+        with self._synced:
+            while self._syncing:
+                self._synced.wait()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            if os.path.exists(retired):
+                # An earlier checkpoint never finished; keep its records ahead of ours
+                with open(self.path, 'rb') as src, open(retired, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, retired)
+            self.file = open(self.path, 'ab')
+            self.size = 0
+            # Keeps the LSN counting if the process restarts before the next append
+            self._write(self.appended_lsn, ('checkpoint', None))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.durable_lsn = self.appended_lsn
+        return retired
+
+    def close(self) -> None:
+        with self._lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()